@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'chat.middleware.ServerTimingMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -71,19 +72,238 @@ CORS_ALLOWED_ORIGINS = [
 #     }
 # }
 
-CACHES = {
-    'default': {
+# 'default' and 'question' are tiered caches (chat/cache_backends.py): a per-process LRU in
+# front of the 'shared' cache. Set REDIS_URL (redis://host:6379/0, or unix:///path/redis.sock
+# for a local server) to share them through Redis; without it they are shared through the
+# database cache table, as before. 'default' holds locks, sessions and conversation buffers,
+# so its reads always go to the shared cache. 'question' holds the semantic cache and may be
+# served from memory for up to L1_TIMEOUT seconds after another process changes it.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+else:
+    SHARED_CACHE = {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'cache_table',
+        # The semantic cache stores several rows per question and evicts by itself; the
+        # default limit of 300 rows would cull entries at random.
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000,
+        },
+    }
+
+CACHES = {
+    'shared': {
+        **SHARED_CACHE,
+        'TIMEOUT': None,
+    },
+    'default': {
+        'BACKEND': 'chat.cache_backends.TieredCache',
+        'LOCATION': 'default',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 0,
+            'COMPRESS_MIN_LENGTH': 1024,
+        },
     },
     'question': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'cache_question_table',
+        'BACKEND': 'chat.cache_backends.TieredCache',
+        'LOCATION': 'question',
+        'KEY_PREFIX': 'question',
+        'TIMEOUT': 7 * 24 * 60 * 60,
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 256,
+            'L1_TIMEOUT': 5,
+            'COMPRESS_MIN_LENGTH': 1024,
+        },
     },
 }
 
 
 
+# Upstream services
+# Each upstream gets a pooled keep-alive client (chat/upstream.py). Besides URL, an entry may
+# override CONNECT_TIMEOUT, READ_TIMEOUT (seconds), RETRIES, BACKOFF (seconds), POOL_SIZE,
+# FAILURE_THRESHOLD (consecutive failures that open the circuit) and RESET_TIMEOUT
+# (seconds before an open circuit lets a trial call through).
+UPSTREAMS = {
+    'query_optimizer': {'URL': 'http://127.0.0.1:5050'},
+    'rag': {'URL': 'http://127.0.0.1:5000'},
+    'ask': {'URL': 'http://127.0.0.1:5060'},
+}
+
+# Semantic question cache
+# INDEX selects the nearest-neighbour index used for cache lookups: 'exact' (brute force)
+# or 'ivf'. OPTIONS are passed to the index class, see chat/vector_index.py.
+# Use benchmarks/ann_recall.py to pick a backend and options for a given cache size;
+# 'ivf' keeps lookups well under a millisecond at 100k questions.
+# Each question is stored as its own entry (chat/semantic_cache.py). Past MAX_ENTRIES the
+# least recently ('lru') or least frequently ('lfu') used questions are evicted, see
+# EVICTION. TTL is the lifetime of an entry in seconds; it defaults to the 'question' cache
+# TIMEOUT. Import a cache saved in the older single-list format with
+# `python manage.py import_question_cache`.
+# A cached answer is served when its question's cosine similarity to the user's exceeds
+# THRESHOLD, or THRESHOLDS[option] for answer modes listed there, e.g. {'Generation': 0.6}.
+SEMANTIC_CACHE = {
+    'THRESHOLD': 0.5,
+    'THRESHOLDS': {},
+    'INDEX': 'exact',
+    'OPTIONS': {},
+    'MAX_ENTRIES': 100000,
+    'EVICTION': 'lru',
+}
+
+# Cache feedback
+# Set LOG_PATH to a file to log every semantic cache decision (query, closest cached question,
+# score, served or not) and the ratings users send to /cache_feedback/ with the returned
+# decision_id (chat/feedback.py). `python manage.py calibrate_cache_threshold` replays the
+# log and recommends a threshold per answer mode. Ratings only exist for served answers, so
+# with EXPLORE_RATE > 0 that fraction of questions scoring up to EXPLORE_MARGIN below the
+# threshold is served from the cache too, to collect ratings there.
+CACHE_FEEDBACK = {
+    'LOG_PATH': None,
+    'EXPLORE_RATE': 0.0,
+    'EXPLORE_MARGIN': 0.05,
+}
+
+# Request coalescing
+# Concurrent cache misses for the same question (up to case and whitespace), or for questions
+# more than THRESHOLD similar, wait for one set of upstream calls and share its answer
+# (chat/coalescing.py). An answer mode whose SEMANTIC_CACHE hit threshold is higher uses that
+# one instead, so no answer is shared that the cache would not serve. Set ALIAS to a cache
+# alias, e.g. 'default', to also coalesce identical questions across worker processes: the
+# first process holds a lock for up to LOCK_TIMEOUT seconds and keeps its answer for
+# RESULT_TIMEOUT seconds; the others poll for it for up to WAIT_TIMEOUT seconds before
+# calling the upstreams themselves.
+REQUEST_COALESCING = {
+    'ENABLED': True,
+    'THRESHOLD': 0.5,
+    'ALIAS': None,
+    'LOCK_TIMEOUT': 60,
+    'RESULT_TIMEOUT': 10,
+    'WAIT_TIMEOUT': 30,
+}
+
+# Sentence embedding model used for the semantic cache
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# The model is imported and loaded on first use. Set EMBEDDING_WARMUP to True to load it
+# when Django starts instead, so the first chat request of each worker is not slowed down.
+EMBEDDING_WARMUP = False
+
+# Embedding server
+# Set URL to 'unix:///path/to/socket' or 'http://host:port' to encode through a shared
+# `python manage.py run_embedding_server` process instead of loading the model in every
+# worker. TIMEOUT is in seconds.
+EMBEDDING_SERVER = {
+    'URL': None,
+    'TIMEOUT': 30,
+}
+
+# Embedding memoization
+# SIZE bounds the per-process LRU of question embeddings. Set ALIAS to a cache alias to
+# share embeddings between worker processes; TIMEOUT applies to that shared cache.
+EMBEDDING_CACHE = {
+    'SIZE': 4096,
+    'ALIAS': None,
+    'TIMEOUT': None,
+}
+
+# Embedding store
+# Set PATH to a directory to keep the semantic cache embeddings in memory-mapped files
+# (chat/embedding_store.py) that every worker on the host maps read-only, so a new or
+# restarted worker starts warm without copying the vectors into its own memory. Requires a
+# POSIX host. The file is compacted when more than COMPACT_RATIO of its rows were removed.
+# DTYPE is what searches scan: 'float32', 'float16' (half the size) or 'int8' (a quarter,
+# and as fast to scan as float32; numpy converts float16 slowly, so it saves memory only).
+# With 'float16' and 'int8' the best RERANK candidates are re-scored against float32
+# copies, so cache hit decisions match float32; see benchmarks/quantization_accuracy.py.
+# DTYPE applies when the store is created; delete the directory to change it.
+EMBEDDING_STORE = {
+    'PATH': None,
+    'DTYPE': 'float32',
+    'RERANK': 32,
+    'COMPACT_RATIO': 0.5,
+}
+
+# Related-question prefetch
+# After a cache miss the answers to the related questions are fetched concurrently on
+# WORKERS threads, each call bounded by TIMEOUT seconds. With BACKGROUND they are fetched
+# after the response has been sent instead of delaying it. With QUEUE they are written to
+# the durable job queue and processed by `python manage.py run_cache_worker`.
+CACHE_PREFETCH = {
+    'WORKERS': 4,
+    'TIMEOUT': 10,
+    'BACKGROUND': True,
+    'QUEUE': False,
+}
+
+# Async views
+# Size of the thread pool the async views use for embedding and cache lookups.
+ASYNC_EMBEDDING_WORKERS = 2
+
+# Conversation buffer
+# Each conversation's new messages are kept in the default cache under its own key for
+# TIMEOUT seconds and written to the database in batches: when FLUSH_SIZE conversations
+# have unsaved messages or the oldest has waited FLUSH_INTERVAL seconds. With BACKGROUND a
+# thread in every process checks this; without it only the size trigger, save_cache_to_db
+# and the flush_cache_to_db endpoint write. Keep TIMEOUT well above FLUSH_INTERVAL.
+CONVERSATION_BUFFER = {
+    'TIMEOUT': 24 * 60 * 60,
+    'FLUSH_SIZE': 50,
+    'FLUSH_INTERVAL': 30,
+    'BACKGROUND': True,
+}
+
+# Batch chat
+# /batch_chat/ and `python manage.py batch_chat` answer up to MAX_QUESTIONS questions at once
+# (chat/batch.py): one encode and one cache lookup for the whole batch, then the misses on a
+# pool of WORKERS threads shared by all batches. Batches of STREAM_MIN_QUESTIONS or more are
+# streamed as newline-delimited JSON unless the request sets "stream": false.
+CHAT_BATCH = {
+    'MAX_QUESTIONS': 1000,
+    'WORKERS': 8,
+    'STREAM_MIN_QUESTIONS': 50,
+}
+
+# Chat history search
+# /search_chats/ searches saved messages by keyword through an FTS5 index on SQLite (kept in
+# sync by triggers, see migration 0005) or a GIN text search index on PostgreSQL (migration
+# 0006); other databases fall back to a substring scan of every message. With SEMANTIC set
+# it also searches by meaning (mode=semantic).
+# With SEMANTIC, the embedding of every saved message is stored; run
+# `python manage.py index_message_embeddings` once after turning it on to embed older
+# messages. INDEX and OPTIONS select the nearest-neighbour index as for SEMANTIC_CACHE;
+# hits below THRESHOLD are dropped and at most MAX_RESULTS are ranked.
+CHAT_SEARCH = {
+    'SEMANTIC': False,
+    'INDEX': 'exact',
+    'OPTIONS': {},
+    'THRESHOLD': 0.3,
+    'MAX_RESULTS': 200,
+}
+
+# Metrics
+# Pipeline stages are timed into per-process histograms served at /metrics/ in the Prometheus
+# text format (chat/metrics.py). SERVER_TIMING adds a Server-Timing header with the stage
+# timings of each request. With PROFILING, a request with a `profile` query parameter is
+# answered with a sampled profile (one sample every PROFILE_INTERVAL seconds) in the
+# collapsed-stack format instead; leave it off in production.
+METRICS = {
+    'SERVER_TIMING': True,
+    'PROFILING': False,
+    'PROFILE_INTERVAL': 0.005,
+}
+
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
 
@@ -111,11 +331,86 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects the database: 'sqlite' (the default) or 'postgresql', configured from the
+# POSTGRES_* variables. Cache and session storage goes to the 'cache' alias (see CacheRouter in
+# chat/db.py) so it never waits on the chat writes' lock: with SQLite a separate file,
+# cache.sqlite3; with PostgreSQL its own connections to POSTGRES_CACHE_DB (by default the same
+# database). Run `python manage.py createcachetable` after switching; entries already in
+# db.sqlite3 can be carried over with
+#   sqlite3 db.sqlite3 ".dump cache_table" | sqlite3 cache.sqlite3
+# With Redis (REDIS_URL) no table is routed and the 'cache' alias is unused.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+SQLITE_OPTIONS = {
+    # Seconds a connection waits for another's write lock before "database is locked"
+    'timeout': 20,
+    # The database cache reads then writes inside one transaction. In SQLite's default
+    # deferred mode concurrent writers fail with "database is locked" and the cache
+    # drops the write silently; IMMEDIATE makes them wait for the lock instead.
+    'transaction_mode': 'IMMEDIATE',
+}
+
+if DB_ENGINE == 'postgresql':
+    # DB_POOL_MAX_SIZE > 0 uses psycopg's connection pool (Django >= 5.1, psycopg[pool]),
+    # which does not mix with persistent connections; otherwise each thread keeps its
+    # connection for DB_CONN_MAX_AGE seconds, checked before reuse.
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '0'))
+
+    def postgres_database(name):
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': name,
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        if DB_POOL_MAX_SIZE:
+            database['CONN_MAX_AGE'] = 0
+            database['OPTIONS']['pool'] = {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            }
+        return database
+
+    DATABASES = {
+        'default': postgres_database(os.environ.get('POSTGRES_DB', 'isro_bah')),
+        'cache': postgres_database(os.environ.get('POSTGRES_CACHE_DB', os.environ.get('POSTGRES_DB', 'isro_bah'))),
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_OPTIONS,
+        },
+        'cache': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'cache.sqlite3',
+            'OPTIONS': SQLITE_OPTIONS,
+        },
     }
+
+DATABASE_ROUTERS = ['chat.db.CacheRouter']
+
+# Set on every new SQLite connection (chat/db.py). In WAL mode readers no longer block the
+# writer or each other, and with synchronous=NORMAL a commit is not fsynced until checkpoint,
+# which stays safe against application crashes (a power loss can drop the last commits).
+# busy_timeout is in milliseconds; a negative cache_size is in KiB. journal_mode is the one
+# pragma stored in the database file: the first connection converts db.sqlite3 and
+# cache.sqlite3 to WAL for good, so they are not kept in git (create them with `migrate` and
+# `createcachetable`). Set 'journal_mode': 'DELETE' to convert them back.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 2 ** 20,
 }
 
 
@@ -143,7 +438,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LANGUAGE_CODE = 'en-us'
 
-TIME_ZONE = 'Asia/kolkata'
+TIME_ZONE = 'Asia/Kolkata'
 
 USE_I18N = True
 
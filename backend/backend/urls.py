@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
-from chat.views import save_chat_to_cache, save_cache_to_db, fetch_chat_from_db, list_chats, save_chat
+from chat.views import save_chat_to_cache, save_cache_to_db, fetch_chat_from_db, list_chats, save_chat, get_upstream_stats, stream_chat, flush_cache_to_db, get_cache_stats, metrics, search_chats, batch_chat, cache_feedback
+from chat import async_views
 
 """
 URL configuration for backend project.
@@ -29,8 +30,29 @@ urlpatterns = [
     path('save_chat/', save_chat, name='save_chat'),
     # Save a chat to the cache and then to the database
     path('save_chat_to_cache/', save_chat_to_cache, name='save_chat_to_cache'),
+    # Stream the pipeline stages of a chat as Server-Sent Events
+    path('stream_chat/', stream_chat, name='stream_chat'),
+    # Answer a list of questions in one request
+    path('batch_chat/', batch_chat, name='batch_chat'),
     # Save a chat from the cache to the database
     path('save_cache_to_db/', save_cache_to_db, name='save_cache_to_db'),
+    # Save the buffered messages of all conversations to the database
+    path('flush_cache_to_db/', flush_cache_to_db, name='flush_cache_to_db'),
     # Fetch a chat from the database by its ID
     path('fetch_chat_from_db/<int:chat_id>/', fetch_chat_from_db, name='fetch_chat_from_db'),
+    # Rate an answer, for calibrating the semantic cache threshold
+    path('cache_feedback/', cache_feedback, name='cache_feedback'),
+    # Keyword or semantic search over the messages of saved chats
+    path('search_chats/', search_chats, name='search_chats'),
+    # Latency and circuit breaker stats of the upstream services
+    path('upstream_stats/', get_upstream_stats, name='upstream_stats'),
+    # Hit rates and compression counters of the tiered caches
+    path('cache_stats/', get_cache_stats, name='cache_stats'),
+    # Pipeline stage timings and cache counters in the Prometheus text format
+    path('metrics/', metrics, name='metrics'),
+    # Async versions of the chat pipeline, for serving under ASGI (backend/asgi.py)
+    path('async/list_chats/', async_views.list_chats, name='async_list_chats'),
+    path('async/save_chat_to_cache/', async_views.save_chat_to_cache, name='async_save_chat_to_cache'),
+    path('async/save_cache_to_db/', async_views.save_cache_to_db, name='async_save_cache_to_db'),
+    path('async/fetch_chat_from_db/<int:chat_id>/', async_views.fetch_chat_from_db, name='async_fetch_chat_from_db'),
 ]
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Recall-vs-latency benchmark for the semantic cache indexes in chat/vector_index.py.
+
+Builds each index over synthetic clustered unit vectors (shaped like MiniLM question
+embeddings), then compares every backend's top-k results and query latency against the
+exact brute-force baseline.
+
+Usage (from the backend directory):
+    python benchmarks/ann_recall.py --size 100000 --backends exact ivf
+    python benchmarks/ann_recall.py --size 100000 --backends ivf --nprobe 4 8 16 32
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat.vector_index import ExactIndex, IVFIndex  # noqa: E402
+
+
+def make_dataset(size, dim, queries, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    data = centers[rng.integers(0, clusters, size)] + 0.35 * rng.normal(size=(size, dim))
+    data = (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+    # Queries are paraphrase-like perturbations of stored questions.
+    picked = data[rng.integers(0, size, queries)] + 0.1 * rng.normal(size=(queries, dim))
+    picked = (picked / np.linalg.norm(picked, axis=1, keepdims=True)).astype(np.float32)
+    return data, picked
+
+
+def build(index, data):
+    start = time.perf_counter()
+    for key, vector in enumerate(data):
+        index.add(key, vector)
+    return time.perf_counter() - start
+
+
+def run_queries(index, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([key for _, key in index.search(query, k)])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000, results
+
+
+def recall(results, truth, k):
+    return float(np.mean([len(set(r[:k]) & set(t[:k])) / k for r, t in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--clusters', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--backends', nargs='+', default=['exact', 'ivf'])
+    parser.add_argument('--nlist', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    data, queries = make_dataset(args.size, args.dim, args.queries, args.clusters, args.seed)
+    print(f"{args.size} vectors x {args.dim} dims, {args.queries} queries, k={args.k}\n")
+
+    exact = ExactIndex()
+    exact_build = build(exact, data)
+    exact_latency, truth = run_queries(exact, queries, args.k)
+
+    print(f"{'backend':<24}{'build s':>10}{'p50 ms':>10}{'p99 ms':>10}{'recall@1':>10}{'recall@k':>10}")
+
+    def report(name, build_time, latency, results):
+        print(f"{name:<24}{build_time:>10.1f}{np.percentile(latency, 50):>10.3f}{np.percentile(latency, 99):>10.3f}"
+              f"{recall(results, truth, 1):>10.3f}{recall(results, truth, args.k):>10.3f}")
+
+    if 'exact' in args.backends:
+        report('exact', exact_build, exact_latency, truth)
+
+    if 'ivf' in args.backends:
+        index = IVFIndex(nlist=args.nlist)
+        build_time = build(index, data)
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            latency, results = run_queries(index, queries, args.k)
+            report(f'ivf nprobe={nprobe}', build_time, latency, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+Settings for benchmarks/chat_pipeline.py and the servers of benchmarks/wsgi_vs_asgi.py.
+
+The project settings, with the SQLite databases and the cache table moved to BENCH_DIR so a
+run never touches db.sqlite3, cache.sqlite3 or the real semantic cache.
+"""
+
+import os
+
+from backend.settings import *  # noqa: F401,F403
+from backend.settings import CACHES, DATABASES
+
+BENCH_DIR = os.environ['BENCH_DIR']
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', '127.0.0.1']
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES = {
+        alias: {
+            **database,
+            'NAME': os.path.join(BENCH_DIR, f'bench-{alias}.sqlite3'),
+            'OPTIONS': {**database.get('OPTIONS', {}), 'timeout': 60},
+        }
+        for alias, database in DATABASES.items()
+    }
+
+if CACHES['shared']['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache':
+    CACHES = {**CACHES, 'shared': {**CACHES['shared'], 'LOCATION': 'bench_cache_table'}}
+else:
+    # Keep the benchmark's keys apart from the real ones in a shared Redis
+    CACHES = {**CACHES, 'shared': {**CACHES['shared'], 'KEY_PREFIX': 'bench'}}
@@ -0,0 +1,250 @@
+"""
+Load benchmark for the hot paths of the chat pipeline, runnable offline on a CPU-only host.
+
+Starts the stub upstreams from benchmarks/stubs.py, creates a scratch database and cache
+table in a temporary directory (benchmarks/bench_settings.py), and for each question cache
+size in --sizes seeds the semantic cache up to that size, then drives with --concurrency
+threads through the Django test client:
+    save_chat_to_cache  --hit-ratio of the questions are seeded ones (cache hits), the rest
+                        are unique (misses that call the stubs)
+    list_chats          first pages and follow-up pages of the chat list
+    fetch_chat_from_db  random seeded chats, --messages messages each
+Requests go through the URL routing, middleware and views in this process, so the numbers
+exclude the HTTP server but include everything the chat code does.
+
+By default questions are embedded by a deterministic hashing encoder, so no model download
+is needed and cache hits are exact; pass --real-model to use the sentence encoder.
+
+Reports throughput, latency percentiles and the process RSS per endpoint and cache size.
+Save the results with --output and pass them as --baseline to a later run to fail (exit
+status 1) when any p95 grew by more than --tolerance.
+
+Usage (from the backend directory):
+    python benchmarks/chat_pipeline.py --sizes 1000 10000 100000 --latency 0.05
+    python benchmarks/chat_pipeline.py --sizes 1000 --output baseline.json
+    python benchmarks/chat_pipeline.py --sizes 1000 --baseline baseline.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from stubs import start_stubs  # noqa: E402
+
+
+class HashEncoder:
+    """
+    A stand-in for the SentenceTransformer model: a random unit vector seeded by the text_key
+    of each text, so equal texts (up to normalization) get equal vectors and others are
+    nearly orthogonal.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True):
+        from chat.embeddings import text_key
+        vectors = np.stack([
+            np.random.default_rng(int(text_key(text)[:16], 16)).standard_normal(self.dim)
+            for text in texts
+        ]).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def seed_question(i):
+    return f"Seeded benchmark question number {i} about monsoon rainfall?"
+
+
+def seed_questions(start, stop, batch_size=1000):
+    from chat.embeddings import encode
+    from chat.semantic_cache import insert_entries
+    for low in range(start, stop, batch_size):
+        questions = [seed_question(i) for i in range(low, min(low + batch_size, stop))]
+        vectors = encode(questions)
+        insert_entries([
+            (question, {'answer': f"Seeded answer to: {question}", 'highest_similar_question': question}, vector)
+            for question, vector in zip(questions, vectors)
+        ])
+
+
+def seed_chats(count, messages):
+    from chat.models import Chat, Message, make_preview
+    texts = [[{'text': f"Benchmark message {j} of chat {i}", 'isBot': bool(j % 2)} for j in range(messages)] for i in range(count)]
+    chats = Chat.objects.bulk_create([Chat(preview=make_preview(chat)) for chat in texts])
+    Message.objects.bulk_create(
+        [
+            Message(chat_id=chat.id, ordinal=j, message_id=str(uuid.uuid4()), text=message['text'], is_bot=message['isBot'])
+            for chat, chat_messages in zip(chats, texts)
+            for j, message in enumerate(chat_messages)
+        ],
+        batch_size=1000,
+    )
+    return [chat.id for chat in chats]
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def drive(make_request, total, concurrency):
+    """
+    Send total requests from concurrency threads, each with its own test client.
+
+    Returns:
+    tuple: (latencies in ms, error count, elapsed seconds)
+    """
+    from django.test import Client
+
+    local = threading.local()
+    rng_lock = threading.Lock()
+    rng = random.Random(0)
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        with rng_lock:
+            seed = rng.random()
+        start = time.perf_counter()
+        try:
+            ok = make_request(local.client, seed).status_code == 200
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(one, range(total)))
+        elapsed = time.perf_counter() - start
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    return latencies, sum(not ok for _, ok in results), elapsed
+
+
+def scenarios(size, chat_ids, hit_ratio):
+    def save_chat_to_cache(client, seed):
+        if seed < hit_ratio:
+            question = seed_question(int(seed / hit_ratio * size))
+        else:
+            question = f"Unseen benchmark question {uuid.uuid4().hex}?"
+        return client.post('/save_chat_to_cache/', {'chat_data': [{'text': question, 'isBot': False}]},
+                           content_type='application/json')
+
+    def list_chats(client, seed):
+        response = client.get('/list_chats/')
+        if seed < 0.5 and response.status_code == 200 and response.json().get('next'):
+            # Follow one page, as the sidebar does when scrolled
+            response = client.get(response.json()['next'])
+        return response
+
+    def fetch_chat_from_db(client, seed):
+        return client.get(f'/fetch_chat_from_db/{chat_ids[int(seed * len(chat_ids))]}/')
+
+    return {
+        'save_chat_to_cache': save_chat_to_cache,
+        'list_chats': list_chats,
+        'fetch_chat_from_db': fetch_chat_from_db,
+    }
+
+
+def compare(results, baseline, tolerance):
+    previous = {(row['endpoint'], row['size']): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get((row['endpoint'], row['size']))
+        if before and row['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{row['endpoint']} at {row['size']} questions: p95 {before['p95_ms']:.1f} -> {row['p95_ms']:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Question cache sizes to seed.")
+    parser.add_argument('--endpoints', nargs='+', choices=['save_chat_to_cache', 'list_chats', 'fetch_chat_from_db'],
+                        default=['save_chat_to_cache', 'list_chats', 'fetch_chat_from_db'])
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds of latency per upstream call.")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint and size.")
+    parser.add_argument('--hit-ratio', type=float, default=0.8, help="Fraction of chats asking a seeded question.")
+    parser.add_argument('--chats', type=int, default=1000, help="Chats seeded for list_chats and fetch_chat_from_db.")
+    parser.add_argument('--messages', type=int, default=20, help="Messages per seeded chat.")
+    parser.add_argument('--real-model', action='store_true', help="Embed with the sentence encoder instead of a hashing stand-in.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare against results saved with --output.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 growth over the baseline, as a fraction.")
+    args = parser.parse_args()
+
+    bench_dir = tempfile.mkdtemp(prefix='chat-bench-')
+    os.environ['BENCH_DIR'] = bench_dir
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'bench_settings'
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    call_command('createcachetable', verbosity=0)
+    if not args.real_model:
+        from chat import embeddings
+        embeddings._model = HashEncoder()
+
+    stubs = start_stubs(args.latency)
+    print(f"Scratch database in {bench_dir}, stub upstreams with {args.latency}s latency\n")
+    chat_ids = seed_chats(args.chats, args.messages)
+
+    results = []
+    print(f"{'endpoint':<22}{'size':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'rss MB':>10}")
+    seeded = 0
+    try:
+        for size in sorted(args.sizes):
+            start = time.perf_counter()
+            seed_questions(seeded, size)
+            seeded = size
+            print(f"-- seeded {size} questions in {time.perf_counter() - start:.1f}s")
+            for endpoint in args.endpoints:
+                request = scenarios(size, chat_ids, args.hit_ratio)[endpoint]
+                latencies, errors, elapsed = drive(request, args.requests, args.concurrency)
+                row = {
+                    'endpoint': endpoint,
+                    'size': size,
+                    'throughput': args.requests / elapsed,
+                    'p50_ms': float(np.percentile(latencies, 50)),
+                    'p95_ms': float(np.percentile(latencies, 95)),
+                    'p99_ms': float(np.percentile(latencies, 99)),
+                    'errors': errors,
+                    'rss_mb': current_rss_mb(),
+                }
+                results.append(row)
+                print(f"{endpoint:<22}{size:>8}{row['throughput']:>10.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+                      f"{row['p99_ms']:>10.1f}{errors:>8}{row['rss_mb']:>10.0f}")
+    finally:
+        for server in stubs:
+            server.shutdown()
+
+    print(f"\npeak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
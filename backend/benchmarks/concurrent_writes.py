@@ -0,0 +1,176 @@
+"""
+Concurrent-write benchmark for the database layouts in benchmarks/db_settings.py.
+
+For each variant, --processes worker processes (like gunicorn workers) of --threads threads
+each run --turns chat turns against a scratch database in a temporary directory. A turn is
+what save_chat_to_cache and a session save write:
+    append    the question and answer appended to a new chat (Chat.append_messages)
+    cache     a 2 KB value set in the shared database cache, as a session save does
+    list      the first page of the chat list, read while the others write
+Reports turns per second, p50/p95 latency per step, failed steps ("database is locked" once
+the busy timeout runs out) and dropped cache writes. The database cache swallows its own
+errors, so a dropped write is a key that cannot be read back after the run.
+
+Runs with the database cache, so unset REDIS_URL. For the postgresql variant set
+DB_ENGINE=postgresql and point POSTGRES_DB at a scratch database; its chats are left there.
+
+Usage (from the backend directory):
+    python benchmarks/concurrent_writes.py --processes 4 --threads 4 --turns 200
+    DB_ENGINE=postgresql POSTGRES_DB=bench python benchmarks/concurrent_writes.py --variants wal-split postgresql
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+VARIANTS = ['rollback', 'wal', 'wal-split', 'postgresql']
+STEPS = ['append', 'cache', 'list']
+
+
+def setup_django(variant, bench_dir):
+    os.environ['BENCH_DIR'] = bench_dir
+    os.environ['BENCH_DB_VARIANT'] = variant
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'db_settings'
+    import django
+    django.setup()
+
+
+def prepare(variant, bench_dir):
+    setup_django(variant, bench_dir)
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    call_command('createcachetable', verbosity=0)
+
+
+def run_thread(turns, results, cache_keys):
+    from django.core.cache import caches
+    from django.db import connections
+    from chat.models import Chat
+
+    cache = caches['shared']
+    payload = 'x' * 2048
+    try:
+        for turn in range(turns):
+            steps = {}
+            start = time.perf_counter()
+            try:
+                chat = Chat.objects.create()
+                chat.append_messages([
+                    {'text': f"Benchmark question {turn}?", 'isBot': False},
+                    {'text': f"Benchmark answer {turn}.", 'isBot': True},
+                ])
+                steps['append'] = time.perf_counter() - start
+            except Exception:
+                steps['append'] = None
+
+            key = f"bench-session-{uuid.uuid4().hex}"
+            start = time.perf_counter()
+            try:
+                cache.set(key, payload, 300)
+                steps['cache'] = time.perf_counter() - start
+                cache_keys.append(key)
+            except Exception:
+                steps['cache'] = None
+
+            start = time.perf_counter()
+            try:
+                list(Chat.objects.order_by('-created_at').values('id', 'preview')[:20])
+                steps['list'] = time.perf_counter() - start
+            except Exception:
+                steps['list'] = None
+            results.append(steps)
+    finally:
+        connections.close_all()
+
+
+def worker(variant, bench_dir, threads, turns):
+    """
+    Run threads threads of turns turns each in a fresh process.
+
+    Returns:
+    dict: Per step, the latencies in ms of the steps that succeeded and the failure count,
+        plus the number of cache writes that could not be read back.
+    """
+    setup_django(variant, bench_dir)
+    from django.core.cache import caches
+
+    results = []
+    cache_keys = []
+    pool = [threading.Thread(target=run_thread, args=(turns, results, cache_keys)) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    found = {}
+    for start in range(0, len(cache_keys), 500):
+        found.update(caches['shared'].get_many(cache_keys[start:start + 500]))
+    report = {'dropped': len(cache_keys) - len(found)}
+    for step in STEPS:
+        latencies = [turn[step] * 1000 for turn in results if turn[step] is not None]
+        report[step] = {'latencies': latencies, 'failed': sum(turn[step] is None for turn in results)}
+    return report
+
+
+def run_variant(variant, bench_dir, args):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        pool.apply(prepare, (variant, bench_dir))
+    with context.Pool(args.processes) as pool:
+        start = time.perf_counter()
+        reports = pool.starmap(worker, [(variant, bench_dir, args.threads, args.turns)] * args.processes)
+        elapsed = time.perf_counter() - start
+    row = {
+        'variant': variant,
+        'throughput': args.processes * args.threads * args.turns / elapsed,
+        'dropped': sum(report['dropped'] for report in reports),
+    }
+    for step in STEPS:
+        latencies = [latency for report in reports for latency in report[step]['latencies']]
+        row[f'{step}_p50'] = float(np.percentile(latencies, 50)) if latencies else float('nan')
+        row[f'{step}_p95'] = float(np.percentile(latencies, 95)) if latencies else float('nan')
+        row[f'{step}_failed'] = sum(report[step]['failed'] for report in reports)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=['rollback', 'wal', 'wal-split'])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help="Threads per process.")
+    parser.add_argument('--turns', type=int, default=200, help="Chat turns per thread.")
+    args = parser.parse_args()
+
+    if os.environ.get('REDIS_URL'):
+        parser.error("unset REDIS_URL: the benchmark measures the database cache")
+    if 'postgresql' in args.variants and os.environ.get('DB_ENGINE') != 'postgresql':
+        parser.error("the postgresql variant needs DB_ENGINE=postgresql and the POSTGRES_* settings")
+
+    bench_dir = tempfile.mkdtemp(prefix='db-bench-')
+    print(f"Scratch databases in {bench_dir}; {args.processes} processes x {args.threads} threads x {args.turns} turns\n")
+    header = f"{'variant':<12}{'turns/s':>10}"
+    for step in STEPS:
+        header += f"{step + ' p50':>14}{step + ' p95':>14}{'failed':>8}"
+    print(header + f"{'dropped':>9}")
+    for variant in args.variants:
+        row = run_variant(variant, bench_dir, args)
+        line = f"{variant:<12}{row['throughput']:>10.1f}"
+        for step in STEPS:
+            line += f"{row[step + '_p50']:>14.1f}{row[step + '_p95']:>14.1f}{row[step + '_failed']:>8}"
+        print(line + f"{row['dropped']:>9}")
+    print("\nlatencies in ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Settings for benchmarks/concurrent_writes.py.
+
+bench_settings with the database layout named by BENCH_DB_VARIANT:
+    rollback    the layout before SQLITE_PRAGMAS and the cache database: one SQLite file
+                for chats, cache and sessions in SQLite's default rollback journal mode,
+                with IMMEDIATE transactions and Django's default 5 second timeout
+    wal         one SQLite file with SQLITE_PRAGMAS
+    wal-split   SQLITE_PRAGMAS, with the cache tables in a second file (the project default)
+    postgresql  the project's PostgreSQL databases; needs DB_ENGINE=postgresql
+"""
+
+import os
+
+from backend.settings import SQLITE_OPTIONS
+from bench_settings import *  # noqa: F401,F403
+from bench_settings import BENCH_DIR
+
+VARIANT = os.environ['BENCH_DB_VARIANT']
+
+
+def sqlite_database(name, options):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCH_DIR, name),
+        'OPTIONS': options,
+    }
+
+
+if VARIANT == 'rollback':
+    SQLITE_PRAGMAS = {'journal_mode': 'DELETE'}
+    DATABASES = {'default': sqlite_database('rollback.sqlite3', {'transaction_mode': 'IMMEDIATE'})}
+elif VARIANT == 'wal':
+    DATABASES = {'default': sqlite_database('wal.sqlite3', SQLITE_OPTIONS)}
+elif VARIANT == 'wal-split':
+    DATABASES = {
+        'default': sqlite_database('wal-split.sqlite3', SQLITE_OPTIONS),
+        'cache': sqlite_database('wal-split-cache.sqlite3', SQLITE_OPTIONS),
+    }
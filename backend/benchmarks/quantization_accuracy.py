@@ -0,0 +1,105 @@
+"""
+Accuracy of quantized embedding stores on the semantic cache hit decision.
+
+Fills an EmbeddingStore (chat/embedding_store.py) of each DTYPE with the same synthetic
+unit vectors (clustered like MiniLM question embeddings) and asks each store for the best
+match of every query. A query is a cache hit when its best score exceeds the threshold
+(0.5, as in chat.pipeline). Every configuration is compared with the float32 store:
+    agree      share of queries with the same hit/miss decision
+    false hit  misses under float32 that became hits
+    false miss hits under float32 that became misses
+    same best  share of float32 hits answered with the same cached entry
+    max err    largest difference of the best score from float32
+Queries are perturbed copies of stored vectors with noise spread so that best scores cover
+roughly 0.25 to 0.95, i.e. both sides of the threshold.
+
+Usage (from the backend directory):
+    python benchmarks/quantization_accuracy.py --size 100000 --queries 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat.embedding_store import EmbeddingStore  # noqa: E402
+
+CONFIGS = [
+    ('float32', 0),
+    ('float16', 0),
+    ('float16', 32),
+    ('int8', 0),
+    ('int8', 32),
+]
+
+
+def make_dataset(size, dim, queries, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    data = centers[rng.integers(0, clusters, size)] + 0.8 * rng.normal(size=(size, dim))
+    data = (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+    # Noise per query from light paraphrase to unrelated, so best scores straddle the threshold.
+    noise = rng.uniform(0.01, 0.2, size=(queries, 1))
+    picked = data[rng.integers(0, size, queries)] + noise * rng.normal(size=(queries, dim))
+    picked = (picked / np.linalg.norm(picked, axis=1, keepdims=True)).astype(np.float32)
+    return data, picked
+
+
+def run(dtype, rerank, data, queries, directory):
+    store = EmbeddingStore(os.path.join(directory, f'{dtype}-{rerank}'), dtype=dtype, rerank=rerank)
+    ids = [str(i) for i in range(len(data))]
+    for start in range(0, len(data), 10000):
+        store.add(ids[start:start + 10000], data[start:start + 10000])
+    store.search(queries[0], 1)
+
+    scores, best, latencies = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        score, entry_id = store.search(query, 1)[0]
+        latencies.append(time.perf_counter() - start)
+        scores.append(score)
+        best.append(entry_id)
+    scanned = sum(
+        os.path.getsize(os.path.join(store.path, f'{prefix}-0.bin'))
+        for prefix in ('vectors', 'scales') if os.path.exists(os.path.join(store.path, f'{prefix}-0.bin'))
+    )
+    return np.array(scores), np.array(best), np.array(latencies) * 1000, scanned / len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--clusters', type=int, default=1000)
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    data, queries = make_dataset(args.size, args.dim, args.queries, args.clusters, args.seed)
+    print(f"{args.size} vectors x {args.dim} dims, {args.queries} queries, threshold {args.threshold}\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {config: run(*config, data, queries, directory) for config in CONFIGS}
+
+    base_scores, base_best, _, _ = results[('float32', 0)]
+    base_hits = base_scores > args.threshold
+    near = np.abs(base_scores - args.threshold) < 0.01
+    print(f"float32 hits {base_hits.sum()} of {len(queries)}, {near.sum()} within 0.01 of the threshold\n")
+    print(f"{'dtype':<10}{'rerank':>8}{'bytes/vec':>11}{'p50 ms':>9}{'agree %':>10}"
+          f"{'false hit':>11}{'false miss':>12}{'same best %':>13}{'max err':>10}")
+    for (dtype, rerank), (scores, best, latency, scanned) in results.items():
+        hits = scores > args.threshold
+        same_best = np.mean(best[base_hits] == base_best[base_hits]) * 100 if base_hits.any() else 100.0
+        print(f"{dtype:<10}{rerank:>8}{scanned:>11.0f}{np.percentile(latency, 50):>9.2f}"
+              f"{np.mean(hits == base_hits) * 100:>10.2f}{(hits & ~base_hits).sum():>11}{(~hits & base_hits).sum():>12}"
+              f"{same_best:>13.2f}{np.abs(scores - base_scores).max():>10.5f}")
+
+
+if __name__ == '__main__':
+    main()
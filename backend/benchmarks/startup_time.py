@@ -0,0 +1,74 @@
+"""
+Startup cost of the Django project with lazy and eager embedding model loading.
+
+Each scenario runs in a fresh interpreter and reports wall time and peak RSS:
+    lazy   django.setup() and importing backend.urls (what migrate, shell, admin and every
+           worker boot pay now that the model is loaded on first use)
+    eager  the same followed by chat.embeddings.warm_up(), which is what every process paid
+           before the model load was deferred, and what EMBEDDING_WARMUP=True pays at boot
+The first-encode column is the extra latency the first embedding request sees in each case.
+
+Usage (from the backend directory):
+    python benchmarks/startup_time.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import backend.urls
+from chat import embeddings
+if {eager}:
+    embeddings.warm_up()
+startup = time.perf_counter() - start
+start = time.perf_counter()
+embeddings.encode(['How much rainfall did Kerala receive in July?'])
+first_encode = time.perf_counter() - start
+print(json.dumps({{
+    'startup': startup,
+    'first_encode': first_encode,
+    'maxrss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+SCENARIOS = {'lazy': False, 'eager': True}
+
+
+def run(eager, settings_module):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD.format(eager=eager)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=['lazy', 'eager'])
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings'))
+    args = parser.parse_args()
+
+    print(f"{'scenario':<10}{'startup s':>12}{'first encode s':>16}{'peak RSS MB':>14}")
+    for name in args.scenarios:
+        results = [run(SCENARIOS[name], args.settings) for _ in range(args.runs)]
+        startup = np.median([r['startup'] for r in results])
+        first_encode = np.median([r['first_encode'] for r in results])
+        rss = np.median([r['maxrss_mb'] for r in results])
+        print(f"{name:<10}{startup:>12.2f}{first_encode:>16.3f}{rss:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
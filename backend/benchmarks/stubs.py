@@ -0,0 +1,117 @@
+"""
+Local stand-ins for the upstream services called by the chat pipeline.
+
+    :5050 /process_query  query optimizer, returns {"optimized_query": ...}
+    :5000 /api/query      RAG API, returns {"answer": ..., "highest_similar_question": ...}
+    :5060 /ask            related questions, returns {"top_3_questions": [...], "highest_similar_question": ...}
+
+Each stub sleeps for a configurable latency before answering, so benchmarks can model slow
+upstreams without network access or GPUs.
+
+Usage (from the backend directory):
+    python benchmarks/stubs.py --latency 0.2
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORTS = {'query_optimizer': 5050, 'rag': 5000, 'ask': 5060}
+
+
+def related_questions(query):
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()
+    return [f"What is related topic {digest[i:i + 6]}?" for i in (0, 6, 12)]
+
+
+def respond(path, body):
+    query = body.get('query') or body.get('chat_data') or ''
+    if path == '/process_query':
+        return {'optimized_query': query}
+    if path == '/api/query':
+        return {'answer': f"Stub answer to: {query}", 'highest_similar_question': f"Stub similar to: {query}"}
+    if path == '/ask':
+        return {'top_3_questions': related_questions(query), 'highest_similar_question': f"Stub similar to: {query}"}
+    return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    error_rate = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.latency)
+        payload = respond(self.path, body)
+        if payload is None or random.random() < self.error_rate:
+            self.send_response(404 if payload is None else 503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Load generators drop keep-alive connections freely; only report real errors.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stubs(latency=0.0, error_rate=0.0, ports=None):
+    """
+    Start one stub server per upstream on background threads.
+
+    Parameters:
+    latency (float or dict): Seconds each response is delayed, either for all stubs or per upstream name.
+    error_rate (float): Fraction of requests answered with 503.
+    ports (dict, optional): Port per upstream name. Defaults to the ports in settings.UPSTREAMS.
+
+    Returns:
+    list: The running StubServer instances; call shutdown() on each to stop them.
+    """
+    servers = []
+    for name, port in (ports or DEFAULT_PORTS).items():
+        handler = type(f'{name}Handler', (StubHandler,), {
+            'latency': latency.get(name, 0.0) if isinstance(latency, dict) else latency,
+            'error_rate': error_rate,
+        })
+        server = StubServer(('127.0.0.1', port), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.1, help="Seconds each response is delayed.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503.")
+    args = parser.parse_args()
+
+    start_stubs(args.latency, args.error_rate)
+    print(f"Stub upstreams listening on {DEFAULT_PORTS} with {args.latency}s latency. Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Load test comparing the synchronous chat views under WSGI with the async views under ASGI.
+
+Starts the stub upstreams from benchmarks/stubs.py, then for each server:
+    wsgi  gunicorn backend.wsgi:application with --workers sync workers, driving /save_chat_to_cache/
+    asgi  uvicorn backend.asgi:application in a single process, driving /async/save_chat_to_cache/
+and sends --requests chats with --concurrency in flight, each with a unique question so the
+upstream path is exercised. Reports throughput and latency percentiles.
+
+Both servers run with benchmarks/bench_settings.py against a scratch database and cache table
+in a temporary directory, which is migrated first, so a run never touches db.sqlite3,
+cache.sqlite3 or the real semantic cache. Requires gunicorn and uvicorn (in requirements.txt).
+
+Usage (from the backend directory):
+    python benchmarks/wsgi_vs_asgi.py --latency 0.2 --concurrency 200 --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+import numpy as np
+
+from stubs import start_stubs
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+SERVERS = {
+    'wsgi': lambda port, workers: (
+        ['gunicorn', 'backend.wsgi:application', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--timeout', '120', '--log-level', 'warning'],
+        '/save_chat_to_cache/',
+    ),
+    'asgi': lambda port, workers: (
+        ['uvicorn', 'backend.asgi:application', '--port', str(port), '--log-level', 'warning'],
+        '/async/save_chat_to_cache/',
+    ),
+}
+
+
+def wait_for(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+async def drive(url, total, concurrency):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(f"Benchmark question {uuid.uuid4().hex}?")
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            question = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json={'chat_data': [{'text': question, 'isBot': False}]})
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return np.array(latencies) * 1000, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['wsgi', 'asgi'])
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds of latency per upstream call.")
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4, help="Gunicorn sync workers for the WSGI run.")
+    parser.add_argument('--port', type=int, default=8100)
+    args = parser.parse_args()
+
+    for name in args.servers:
+        command, _ = SERVERS[name](args.port, args.workers)
+        if shutil.which(command[0]) is None:
+            sys.exit(f"{command[0]} is not installed")
+
+    bench_dir = tempfile.mkdtemp(prefix='asgi-bench-')
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'bench_settings',
+        'BENCH_DIR': bench_dir,
+        'PYTHONPATH': os.pathsep.join(filter(None, [BENCHMARKS_DIR, BACKEND_DIR, os.environ.get('PYTHONPATH')])),
+    }
+    for command in ('createcachetable', 'migrate'):
+        subprocess.run([sys.executable, 'manage.py', command, '--verbosity', '0'], cwd=BACKEND_DIR, env=env, check=True)
+
+    start_stubs(args.latency)
+    print(f"Scratch database in {bench_dir}, stub upstreams with {args.latency}s latency\n")
+    print(f"{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name in args.servers:
+        command, path = SERVERS[name](args.port, args.workers)
+        server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+        try:
+            wait_for(f'http://127.0.0.1:{args.port}/admin/login/')
+            latencies, errors, elapsed = asyncio.run(
+                drive(f'http://127.0.0.1:{args.port}{path}', args.requests, args.concurrency)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{name:<8}{args.requests / elapsed:>10.1f}{np.percentile(latencies, 50):>10.1f}"
+              f"{np.percentile(latencies, 95):>10.1f}{np.percentile(latencies, 99):>10.1f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
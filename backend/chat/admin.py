@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Chat
+from .search import keyword_chat_ids
 
 class ChatAdmin(admin.ModelAdmin):
     """
@@ -9,7 +10,7 @@ class ChatAdmin(admin.ModelAdmin):
 
     Attributes:
         list_display (list): A list of fields to be displayed in the admin interface's list view.
-        search_fields (list): A list of fields to be searchable in the admin interface.
+        search_fields (list): A list of fields to be searchable in the admin interface. Chats whose messages match the search through the full-text index are found too.
         readonly_fields (list): A list of fields that are read-only in the admin interface.
 
     Args:
@@ -20,5 +21,14 @@ class ChatAdmin(admin.ModelAdmin):
     """
 
     list_display = ('id', 'created_at')
-    search_fields = ('user_input', 'generated_responses')
-    readonly_fields = ('created_at',)
\ No newline at end of file
+    search_fields = ('preview',)
+    readonly_fields = ('created_at',)
+
+    def get_search_results(self, request, queryset, search_term):
+        matches, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            matches |= queryset.filter(id__in=keyword_chat_ids(search_term))
+        return matches, may_have_duplicates
+
+
+admin.site.register(Chat, ChatAdmin)
\ No newline at end of file
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from django.core import checks
+        from django.db.backends.signals import connection_created
+
+        from .db import check_cache_tables, configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='chat.db.configure_sqlite')
+        checks.register(check_cache_tables, checks.Tags.database)
+
+        # The embedding model is otherwise loaded on first use; see EMBEDDING_WARMUP.
+        if getattr(settings, 'EMBEDDING_WARMUP', False):
+            from .embeddings import warm_up
+            warm_up()
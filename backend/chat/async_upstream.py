@@ -0,0 +1,115 @@
+import asyncio
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+
+from .upstream import UPSTREAM_DEFAULTS, CircuitOpenError, upstreams
+
+# Errors the async views treat as a failed upstream call.
+ASYNC_REQUEST_ERRORS = (httpx.HTTPError, CircuitOpenError)
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class AsyncUpstreamClient:
+    """
+    The asyncio counterpart of UpstreamClient for one upstream service.
+
+    It shares the circuit breaker and latency histogram of the synchronous client with the
+    same name, so both code paths trip the same breaker and report into the same stats.
+    An httpx.AsyncClient is kept per event loop, since its connection pool cannot be shared
+    between loops.
+
+    Methods:
+    post(self, path, **kwargs): Sends a POST request to a path on the upstream.
+    """
+
+    def __init__(self, sync_client, connect_timeout=3, read_timeout=30, retries=2, backoff=0.2, pool_size=10):
+        self.name = sync_client.name
+        self.base_url = sync_client.base_url
+        self.breaker = sync_client.breaker
+        self.latency = sync_client.latency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            self._clients[loop] = client
+        return client
+
+    async def post(self, path, **kwargs):
+        """
+        Sends a POST request to a path on the upstream, retrying connection errors and
+        502/503/504 responses with exponential backoff.
+
+        Args:
+        path (str): The path of the endpoint, e.g. '/api/query'.
+        **kwargs: Passed to httpx.AsyncClient.post.
+
+        Returns:
+        httpx.Response: The response. Callers are expected to call raise_for_status().
+
+        Raises:
+        CircuitOpenError: If the circuit breaker is open.
+        httpx.HTTPError: If the request fails.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for upstream '{self.name}'")
+
+        client = self._client()
+        start = time.perf_counter()
+        failed = True
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await client.post(path, **kwargs)
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    # Other errors are not retried, as in UpstreamClient: after a read timeout
+                    # the upstream may still be working on the request
+                    if attempt == self.retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                        break
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            failed = response.status_code >= 500
+        except asyncio.CancelledError:
+            # The caller went away, e.g. the client disconnected; that says nothing about the upstream
+            failed = None
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+            # Every call reports back, or a trial would keep the shared breaker half open
+            if failed is None:
+                self.breaker.release()
+            elif failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return response
+
+
+def _build_async_upstreams():
+    clients = {}
+    for name, config in getattr(settings, 'UPSTREAMS', {}).items():
+        config = {**UPSTREAM_DEFAULTS, **config}
+        clients[name] = AsyncUpstreamClient(
+            upstreams[name],
+            connect_timeout=config['CONNECT_TIMEOUT'],
+            read_timeout=config['READ_TIMEOUT'],
+            retries=config['RETRIES'],
+            backoff=config['BACKOFF'],
+            pool_size=config['POOL_SIZE'],
+        )
+    return clients
+
+
+async_upstreams = _build_async_upstreams()
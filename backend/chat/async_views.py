@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.request import Request
+
+from .async_upstream import ASYNC_REQUEST_ERRORS, async_upstreams
+from .conversations import buffer_messages, flush_conversations, get_conversation, new_conversation_id
+from .metrics import stage
+from .models import Chat, Message
+from .pagination import ChatCursorPagination, MessageCursorPagination
+from .pipeline import StageError, answer_question, lookup_cached_answer
+from .serializers import ChatSummarySerializer
+
+# Bounded pool for the CPU-bound embedding and cache lookup, so the event loop stays free
+# and at most ASYNC_EMBEDDING_WORKERS encodes run at once.
+_embedding_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_EMBEDDING_WORKERS', 2),
+    thread_name_prefix='embedding',
+)
+
+
+def _read_json(request):
+    # The JSON object in the request body, or None if the body is not one
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# DRF's cursor paginator and the serializers evaluate querysets synchronously, so the paged
+# reads run in a thread through sync_to_async; only the existence checks use the async ORM.
+def _list_chats_page(request):
+    chats = Chat.objects.only('id', 'created_at', 'preview')
+    paginator = ChatCursorPagination()
+    page = paginator.paginate_queryset(chats, Request(request))
+    return {
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+        "results": ChatSummarySerializer(page, many=True).data,
+    }
+
+
+@require_GET
+async def list_chats(request):
+    """
+    Asynchronous version of views.list_chats.
+
+    The page is read with the synchronous ORM and paginator in a thread (sync_to_async), so
+    each request still occupies a thread while its query runs.
+
+    Parameters:
+    request (HttpRequest): The incoming request object, with optional `cursor` and `limit` query parameters.
+
+    Returns:
+    JsonResponse: One page of chat summaries with "next"/"previous" links. The HTTP status code is set to 200 OK.
+    """
+    page = await sync_to_async(_list_chats_page)(request)
+    return JsonResponse(page, status=status.HTTP_200_OK)
+
+
+@csrf_exempt
+@require_POST
+async def save_chat_to_cache(request):
+    """
+    Asynchronous version of views.save_chat_to_cache.
+
+    The embedding and cache lookup run on a bounded thread pool. A miss is answered by
+    pipeline.answer_question in a thread, so concurrent requests for the same question share
+    one set of upstream calls with the sync views, and the stages are timed the same way.
+    Only the 'mapping' mode calls the RAG API with the async client.
+
+    Parameters:
+    - chat_data (dict): A JSON object containing the chat data.
+    - option (str, optional): An optional parameter specifying the mode for processing the chat data. Defaults to 'Generation'.
+    - conversation_id (str, optional): The conversation the message belongs to. A new conversation is started if omitted.
+    - chat_id (int, optional): The saved chat a new conversation continues.
+
+    Returns:
+    - JsonResponse: A response object containing the chat data, the conversation ID and a similar question if available.
+    """
+    data = _read_json(request)
+    if data is None:
+        return JsonResponse({"status": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    chat_data = data.get('chat_data')
+    option = data.get('option', 'Generation')
+    conversation_id = data.get('conversation_id') or new_conversation_id()
+
+    if not chat_data:
+        return JsonResponse({"status": "No chat data provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Assign unique IDs to messages
+    for message in chat_data:
+        message['id'] = str(uuid.uuid4())
+
+    user_input = chat_data[-1].get('text')
+    if option == 'mapping':
+        try:
+            with stage('rag_query'):
+                response = await async_upstreams['rag'].post('/api/query', json={"query": user_input, "mode": option})
+                response.raise_for_status()
+            response_data = response.json()
+            return JsonResponse({"status": "Chat saved to cache", "response_data": response_data}, status=status.HTTP_200_OK)
+        except ASYNC_REQUEST_ERRORS as e:
+            return JsonResponse({"status": f"External API request error: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+
+    try:
+        # run_in_executor does not carry the context over, which the stage timings are kept in
+        loop = asyncio.get_running_loop()
+        best_match_score, matched_question_data, decision_id = await loop.run_in_executor(
+            _embedding_executor, contextvars.copy_context().run, partial(lookup_cached_answer, user_input, option=option)
+        )
+
+        if matched_question_data:
+            # Retrieve response from the cache
+            bot_response = matched_question_data.get('answer', 'No response from cached data')
+            similar_question = matched_question_data.get('highest_similar_question', '')
+        else:
+            # Coalesced with concurrent requests for the same question, as in views.save_chat_to_cache.
+            # Not on the embedding pool: a coalesced request waits there for the first one's answer.
+            try:
+                answer_data = await sync_to_async(answer_question, thread_sensitive=False)(user_input, option)
+            except StageError as e:
+                return JsonResponse({"status": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+
+            bot_response = answer_data['answer']
+            similar_question = answer_data['highest_similar_question']
+
+        # Append bot response to chat_data
+        chat_data.append({
+            "id": str(uuid.uuid4()),
+            "text": bot_response,
+            "isBot": True
+        })
+
+    except Exception as e:
+        return JsonResponse({"status": f"Unexpected error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # Buffer the user message and the response in the conversation's cache entry
+    last_response = chat_data[-1]
+    with stage('buffer'):
+        await sync_to_async(buffer_messages)(conversation_id, chat_data[-2:], data.get('chat_id'))
+
+    return JsonResponse({"status": "Chat saved to cache", "chat_data": [last_response], "conversation_id": conversation_id, "similar_question": similar_question, "decision_id": decision_id}, status=status.HTTP_200_OK)
+
+
+@csrf_exempt
+@require_POST
+async def save_cache_to_db(request):
+    """
+    Asynchronous version of views.save_cache_to_db.
+
+    The buffer reads and the flush run synchronously in a thread (sync_to_async).
+
+    Parameters:
+    - conversation_id (str): The conversation returned by save_chat_to_cache.
+    - chat_id (int, optional): An optional parameter specifying the ID of the chat to be saved. Defaults to None.
+
+    Returns:
+    - JsonResponse: A response object containing the chat ID and a status message.
+    """
+    data = _read_json(request)
+    if data is None:
+        return JsonResponse({"status": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    conversation_id = data.get('conversation_id')
+    chat_id = data.get('chat_id')
+
+    if not conversation_id or await sync_to_async(get_conversation)(conversation_id) is None:
+        return JsonResponse({"status": "No chat found in cache"}, status=status.HTTP_400_BAD_REQUEST)
+    if chat_id and not await Chat.objects.filter(id=chat_id).aexists():
+        return JsonResponse({"error": "Chat not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    if chat_id:
+        await sync_to_async(buffer_messages)(conversation_id, [], chat_id)
+    await sync_to_async(flush_conversations)([conversation_id])
+    chat_id = (await sync_to_async(get_conversation)(conversation_id))['chat_id']
+    return JsonResponse({"status": "Chat saved to DB", "chat_id": chat_id}, status=status.HTTP_200_OK)
+
+
+def _fetch_messages(request, chat_id):
+    messages = Message.objects.filter(chat_id=chat_id).order_by('ordinal')
+    paginator = MessageCursorPagination()
+    page = paginator.paginate_queryset(messages, Request(request))
+    if page is None:
+        return [message.as_dict() for message in messages]
+    return {
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+        "results": [message.as_dict() for message in page],
+    }
+
+
+@require_GET
+async def fetch_chat_from_db(request, chat_id: int) -> JsonResponse:
+    """
+    Asynchronous version of views.fetch_chat_from_db.
+
+    The existence check uses the async ORM; the messages are read with the synchronous ORM
+    and paginator in a thread (sync_to_async).
+
+    Parameters:
+    - chat_id (int): The unique identifier of the chat to be retrieved. Pass `limit` to page through long conversations.
+
+    Returns:
+    - JsonResponse: A response object containing the chat messages (or one page of them), or an error message with status code 404 NOT FOUND.
+    """
+    if not await Chat.objects.filter(id=chat_id).aexists():
+        return JsonResponse({"error": "Chat not found"}, status=status.HTTP_404_NOT_FOUND)
+    messages = await sync_to_async(_fetch_messages)(request, chat_id)
+    return JsonResponse(messages, safe=False, status=status.HTTP_200_OK)
@@ -0,0 +1,111 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+
+from .embeddings import encode, text_key
+from .feedback import record_decision
+from .metrics import record_lookup, stage
+from .pipeline import StageError, answer_question, similarity_threshold
+from .semantic_cache import lookup_entries
+
+logger = logging.getLogger(__name__)
+
+CHAT_BATCH = {
+    'MAX_QUESTIONS': 1000,
+    'WORKERS': 8,
+    'STREAM_MIN_QUESTIONS': 50,
+    **getattr(settings, 'CHAT_BATCH', {}),
+}
+
+# Shared by every batch in the process, so the number of concurrent upstream pipelines is bounded.
+_executor = ThreadPoolExecutor(max_workers=CHAT_BATCH['WORKERS'], thread_name_prefix='batch')
+
+
+def _cached_result(index, question, score, data, decision_id):
+    return {
+        "index": index,
+        "question": question,
+        "decision_id": decision_id,
+        "cached": True,
+        "score": score,
+        "answer": data.get('answer', 'No response from cached data'),
+        "similar_question": data.get('highest_similar_question', ''),
+    }
+
+
+def _answer_miss(question, option):
+    try:
+        return answer_question(question, option)
+    finally:
+        # The worker thread may have opened a database connection, e.g. to queue prefetches
+        connections.close_all()
+
+
+def answer_batch(questions, option='Generation', threshold=None):
+    """
+    Answer several questions, yielding each result as soon as it is ready.
+
+    All questions are encoded in one batch and looked up in the semantic cache with one
+    index search, so cache hits are yielded first. The misses then go through the upstream
+    pipeline on a thread pool of CHAT_BATCH['WORKERS'] threads shared by all batches, one
+    pipeline per distinct question (up to normalization).
+
+    Unlike save_chat_to_cache, the questions and answers are not added to a conversation.
+
+    Parameters:
+    questions (list): The questions, as strings.
+    option (str, optional): The answer mode, e.g. 'Generation'.
+    threshold (float, optional): The minimum cosine similarity for a cache hit. Defaults to the threshold of the answer mode.
+
+    Yields:
+    dict: One result per question, tagged with its position in questions as "index" and
+        with the "decision_id" of its cache lookup (see chat.feedback). A hit or answered miss
+        has "cached", "score", "answer" and "similar_question"; a question whose upstream
+        calls failed has "error" instead.
+    """
+    if not questions:
+        return
+    if threshold is None:
+        threshold = similarity_threshold(option)
+    with stage('encode'):
+        vectors = encode(questions)
+    with stage('cache_lookup'):
+        matches = lookup_entries(vectors, threshold)
+
+    misses = {}
+    for index, (question, (score, entry_id, entry)) in enumerate(zip(questions, matches)):
+        record_lookup(score, entry is not None, matched=entry_id is not None)
+        decision_id = record_decision(question, option, score, entry_id, entry)
+        if entry is not None:
+            yield _cached_result(index, question, score, entry['data'], decision_id)
+        else:
+            misses.setdefault(text_key(question), []).append((index, question, score, decision_id))
+
+    futures = {
+        _executor.submit(_answer_miss, pending[0][1], option): pending
+        for pending in misses.values()
+    }
+    for future in as_completed(futures):
+        try:
+            data = future.result()
+            error = None
+        except StageError as e:
+            error = str(e)
+        except Exception as e:
+            logger.exception("Batch question failed")
+            error = f"Unexpected error: {str(e)}"
+        for index, question, score, decision_id in futures[future]:
+            if error is not None:
+                yield {"index": index, "question": question, "decision_id": decision_id, "error": error}
+            else:
+                yield {
+                    "index": index,
+                    "question": question,
+                    "decision_id": decision_id,
+                    "cached": False,
+                    "score": score,
+                    "answer": data['answer'],
+                    "similar_question": data['highest_similar_question'],
+                }
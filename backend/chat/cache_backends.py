@@ -0,0 +1,278 @@
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connections, router
+
+# L1 stores and stats, shared by every thread's instance of the same cache alias
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class _L1Store:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            'l1_hits': 0,
+            'l2_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'compressed_sets': 0,
+            'bytes_raw': 0,
+            'bytes_stored': 0,
+        }
+
+
+class TieredCache(BaseCache):
+    """
+    A two-level cache: a per-process LRU (L1) in front of another cache alias (L2).
+
+    Reads are served from L1 when possible and otherwise from L2, which then fills L1.
+    Writes go to L2 and L1. Values are pickled once here; values of at least
+    COMPRESS_MIN_LENGTH bytes are zlib-compressed before they are sent to L2. Integers are
+    sent to L2 as they are, so incr() and decr() can be left to L2, which is atomic in Redis.
+
+    L1 entries are trusted for at most L1_TIMEOUT seconds, which bounds how stale a read
+    can be after another process changes a key. add() always goes to L2, so it stays safe
+    to use as a lock. Set L1_MAX_ENTRIES to 0 for aliases that need every read to be
+    current. clear() only removes the keys of this alias from L2 when L2 is Redis or the
+    database cache, and clears all of L2 otherwise.
+
+    LOCATION names the L1 store; OPTIONS are:
+        L2 (str): The alias of the shared cache. Required.
+        L1_MAX_ENTRIES (int): Entries kept in L1. Defaults to 1024.
+        L1_TIMEOUT (float): Seconds an L1 entry is trusted. Defaults to 5.
+        COMPRESS_MIN_LENGTH (int): Smallest pickled size that is compressed, or None to
+            never compress. Defaults to 1024.
+        COMPRESS_LEVEL (int): zlib level. Defaults to 1 (fastest).
+
+    Methods:
+    stats(self): Returns the hit, miss and compression counters of this alias.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options['L2']
+        self.l1_max_entries = options.get('L1_MAX_ENTRIES', 1024)
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.compress_min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+        self.compress_level = options.get('COMPRESS_LEVEL', 1)
+        with _stores_lock:
+            self._store = _stores.setdefault(location or self.l2_alias, _L1Store())
+
+    @property
+    def _l2(self):
+        return caches[self.l2_alias]
+
+    # Serialization
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        blob = b'p' + data
+        if self.compress_min_length is not None and len(data) >= self.compress_min_length:
+            compressed = zlib.compress(data, self.compress_level)
+            if len(compressed) < len(data):
+                blob = b'z' + compressed
+        with self._store.lock:
+            stats = self._store.stats
+            stats['sets'] += 1
+            stats['bytes_raw'] += len(data)
+            stats['bytes_stored'] += len(blob)
+            stats['compressed_sets'] += blob[:1] == b'z'
+        return blob
+
+    def _decode(self, blob):
+        if type(blob) is int:
+            return blob
+        data = zlib.decompress(blob[1:]) if blob[:1] == b'z' else blob[1:]
+        return pickle.loads(data)
+
+    def _l2_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    # L1
+
+    def _l1_get(self, key):
+        if not self.l1_max_entries:
+            return None
+        with self._store.lock:
+            entry = self._store.entries.get(key)
+            if entry is None:
+                return None
+            expires, blob = entry
+            if expires <= time.monotonic():
+                del self._store.entries[key]
+                return None
+            self._store.entries.move_to_end(key)
+            return blob
+
+    def _l1_set(self, key, blob, timeout=DEFAULT_TIMEOUT):
+        if not self.l1_max_entries:
+            return
+        lifetime = self.l1_timeout
+        timeout = self._l2_timeout(timeout)
+        if timeout is not None:
+            if timeout <= 0:
+                self._l1_delete(key)
+                return
+            lifetime = min(lifetime, timeout)
+        entries = self._store.entries
+        with self._store.lock:
+            entries[key] = (time.monotonic() + lifetime, blob)
+            entries.move_to_end(key)
+            while len(entries) > self.l1_max_entries:
+                entries.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._store.lock:
+            self._store.entries.pop(key, None)
+
+    def _count(self, name, n=1):
+        with self._store.lock:
+            self._store.stats[name] += n
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        blob = self._l1_get(key)
+        if blob is not None:
+            self._count('l1_hits')
+            return self._decode(blob)
+        blob = self._l2.get(key)
+        if blob is None:
+            self._count('misses')
+            return default
+        self._count('l2_hits')
+        self._l1_set(key, blob)
+        return self._decode(blob)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_and_validate_key(key, version=version): key for key in keys}
+        found, remaining = {}, []
+        for made_key, key in made.items():
+            blob = self._l1_get(made_key)
+            if blob is None:
+                remaining.append(made_key)
+            else:
+                found[key] = self._decode(blob)
+        self._count('l1_hits', len(found))
+        if remaining:
+            stored = self._l2.get_many(remaining)
+            for made_key, blob in stored.items():
+                self._l1_set(made_key, blob)
+                found[made[made_key]] = self._decode(blob)
+            self._count('l2_hits', len(stored))
+            self._count('misses', len(remaining) - len(stored))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        blob = self._encode(value)
+        self._l2.set(key, blob, self._l2_timeout(timeout))
+        self._l1_set(key, blob, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self.make_and_validate_key(key, version=version): key for key in data}
+        blobs = {made_key: self._encode(data[key]) for made_key, key in made.items()}
+        failed = self._l2.set_many(blobs, self._l2_timeout(timeout)) or []
+        for made_key, blob in blobs.items():
+            if made_key not in failed:
+                self._l1_set(made_key, blob, timeout)
+        return [made[made_key] for made_key in failed]
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Always decided by L2, so add() can be used as a cross-process lock
+        key = self.make_and_validate_key(key, version=version)
+        blob = self._encode(value)
+        added = self._l2.add(key, blob, self._l2_timeout(timeout))
+        if added:
+            self._l1_set(key, blob, timeout)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        # Left to L2 so concurrent increments are not lost; decr() goes through here
+        key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(key)
+        return self._l2.incr(key, delta)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(key)
+        return self._l2.touch(key, self._l2_timeout(timeout))
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(key)
+        return self._l2.delete(key)
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_and_validate_key(key, version=version) for key in keys]
+        for key in made:
+            self._l1_delete(key)
+        self._l2.delete_many(made)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._l1_get(key) is not None or self._l2.has_key(key)
+
+    def clear(self):
+        with self._store.lock:
+            self._store.entries.clear()
+        # Every key of this alias starts with its KEY_PREFIX, whatever the version
+        prefix = f'{self.key_prefix}:'
+        l2 = self._l2
+        if hasattr(l2, 'delete_pattern'):
+            l2.delete_pattern(f'{prefix}*')
+        elif isinstance(l2, DatabaseCache):
+            db = router.db_for_write(l2.cache_model_class)
+            connection = connections[db]
+            table = connection.ops.quote_name(l2._table)
+            pattern = l2.make_key(prefix).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE cache_key LIKE %s ESCAPE '\\'", [pattern])
+        else:
+            # Also clears every other alias stored in the same L2
+            l2.clear()
+
+    def close(self, **kwargs):
+        self._l2.close(**kwargs)
+
+    def stats(self):
+        """
+        Return the counters of this alias, shared by all threads of the process.
+
+        Returns:
+        dict: l1_hits, l2_hits, misses, hit_rate, l1_size, sets, compressed_sets and the
+            pickled (bytes_raw) and stored (bytes_stored) sizes of all values written.
+        """
+        with self._store.lock:
+            stats = dict(self._store.stats)
+            stats['l1_size'] = len(self._store.entries)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['l1_hits'] + stats['l2_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+def cache_stats():
+    """
+    Return the stats of every tiered cache alias in this process.
+
+    Returns:
+    dict: Maps each alias to its TieredCache.stats().
+    """
+    return {
+        alias: caches[alias].stats()
+        for alias in settings.CACHES
+        if isinstance(caches[alias], TieredCache)
+    }
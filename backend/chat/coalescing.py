@@ -0,0 +1,136 @@
+import threading
+import time
+
+import numpy as np
+from django.core.cache import caches
+
+from .metrics import increment
+
+
+class _Call:
+    # One in-flight computation and the threads waiting for it.
+    def __init__(self, vector, scope):
+        self.vector = vector
+        self.scope = scope
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent computations of the same question into one.
+
+    A call is identified by a key, e.g. the text_key of the question, and optionally by an
+    embedding. While a call is in flight, other threads asking with the same key, or with an
+    embedding whose cosine similarity to its embedding exceeds threshold (the comparison the
+    semantic cache makes), wait for it and get its result (or its exception) instead of
+    computing it again. Embeddings only match
+    calls in the same scope, e.g. the same answer mode.
+
+    With a cache alias, calls are also coalesced across processes by key: the first process
+    claims a lock in that cache with cache.add and publishes its result there for
+    result_timeout seconds. Other processes poll for the result and compute it themselves if
+    the lock is released without one, or after wait_timeout seconds.
+
+    Attributes:
+    threshold (float): The cosine similarity two embeddings must exceed to share a call, unless do() is given one.
+    shared (BaseCache): The cache used to coalesce across processes, or None.
+
+    Methods:
+    do(self, key, fn, vector=None, scope='', threshold=None): Returns fn(), sharing one call between concurrent callers.
+    """
+
+    def __init__(self, threshold, alias=None, lock_timeout=60, result_timeout=10, wait_timeout=30,
+                 poll_interval=0.05, key_prefix='coalesce'):
+        self.threshold = threshold
+        self.shared = caches[alias] if alias else None
+        self.lock_timeout = lock_timeout
+        self.result_timeout = result_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.key_prefix = key_prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, vector=None, scope='', threshold=None):
+        """
+        Returns fn(), sharing one call between concurrent callers with a matching key or embedding.
+
+        Parameters:
+        key (str): Identifies the computation; must be safe to use in a cache key.
+        fn (callable): Computes the result. It must return a picklable value other than None.
+        vector (ndarray, optional): The L2-normalized embedding of the question.
+        scope (str, optional): Only calls in the same scope are matched by embedding.
+        threshold (float, optional): The similarity threshold for this call. Defaults to self.threshold.
+
+        Returns:
+        The result of fn, computed by this call or by the one it joined.
+
+        Raises:
+        Exception: Whatever fn raised, in this thread or in the one whose call was joined.
+        """
+        key = f'{scope}:{key}'
+        with self._lock:
+            call = self._find(key, vector, scope, self.threshold if threshold is None else threshold)
+            leader = call is None
+            if leader:
+                call = _Call(vector, scope)
+                self._calls[key] = call
+
+        if not leader:
+            increment('coalesced_requests')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _find(self, key, vector, scope, threshold):
+        # Called with self._lock held.
+        call = self._calls.get(key)
+        if call is not None or vector is None:
+            return call
+        candidates = [
+            call for call in self._calls.values()
+            if call.vector is not None and call.scope == scope
+        ]
+        if not candidates:
+            return None
+        scores = np.stack([call.vector for call in candidates]) @ np.asarray(vector, dtype=np.float32)
+        best = int(np.argmax(scores))
+        return candidates[best] if scores[best] > threshold else None
+
+    def _run(self, key, fn):
+        if self.shared is None:
+            return fn()
+
+        lock_key = f'{self.key_prefix}:lock:{key}'
+        result_key = f'{self.key_prefix}:result:{key}'
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            result = self.shared.get(result_key)
+            if result is not None:
+                increment('coalesced_requests')
+                return result
+            if self.shared.add(lock_key, 1, self.lock_timeout):
+                try:
+                    result = fn()
+                    self.shared.set(result_key, result, self.result_timeout)
+                    return result
+                finally:
+                    self.shared.delete(lock_key)
+            if time.monotonic() >= deadline:
+                # The other process is too slow or gone; compute it here rather than fail.
+                return fn()
+            time.sleep(self.poll_interval)
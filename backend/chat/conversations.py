@@ -0,0 +1,341 @@
+import atexit
+import logging
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import Max
+
+from .metrics import timed
+from .models import Chat, Message, make_preview
+from .search import index_new_messages
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_BUFFER = {
+    'TIMEOUT': 24 * 60 * 60,
+    'FLUSH_SIZE': 50,
+    'FLUSH_INTERVAL': 30,
+    'BACKGROUND': True,
+    **getattr(settings, 'CONVERSATION_BUFFER', {}),
+}
+
+conversation_cache = caches['default']
+
+# A conversation with unsaved messages has a dirty marker holding when it became dirty,
+#   conversation:<id>:dirty
+# and whoever sets the marker (cache.add succeeds for one writer) records the id in an
+# append-only log, one key per conversation, whose slots are claimed with cache.add like the
+# semantic cache's log:
+#   conversations:dirty:<seq>   (conversation id, time it became dirty)
+# conversations:dirty:head is the highest slot claimed and conversations:dirty:flushed the
+# slot up to which the log has been flushed, so buffer_messages only locks its own
+# conversation and the flusher reads the slots between the two. Slots expire with the buffers.
+DIRTY_HEAD_KEY = 'conversations:dirty:head'
+FLUSHED_KEY = 'conversations:dirty:flushed'
+LOCK_TIMEOUT = 10
+CLAIM_ATTEMPTS = 100
+LOG_CHUNK = 1000
+LOG_PROBE = 16
+
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+
+def _buffer_key(conversation_id):
+    return f'conversation:{conversation_id}'
+
+
+def _dirty_key(conversation_id):
+    return f'conversation:{conversation_id}:dirty'
+
+
+def _dirty_log_key(seq):
+    return f'conversations:dirty:{seq}'
+
+
+@contextmanager
+def _cache_lock(key):
+    # A lock shared by all worker processes; cache.add only succeeds for one of them.
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not conversation_cache.add(lock_key, 1, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Timed out waiting for {lock_key}")
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        conversation_cache.delete(lock_key)
+
+
+def get_conversation(conversation_id):
+    """
+    Return the buffer of a conversation.
+
+    Parameters:
+    conversation_id (str): The conversation's id.
+
+    Returns:
+    dict: {'chat_id': int or None, 'pending': [messages not yet saved]}, or None if the
+        conversation is unknown or has expired.
+    """
+    return conversation_cache.get(_buffer_key(conversation_id))
+
+
+def buffer_messages(conversation_id, messages, chat_id=None):
+    """
+    Append messages to a conversation's buffer and mark it for writing to the database.
+
+    The buffer lives in the default cache for CONVERSATION_BUFFER['TIMEOUT'] seconds after
+    its last write. Dirty conversations are saved in batches by flush_conversations().
+
+    Parameters:
+    conversation_id (str): The conversation's id.
+    messages (list): Dicts with 'id', 'text' and 'isBot' keys.
+    chat_id (int, optional): The saved chat this conversation continues, if the buffer has none yet.
+
+    Returns:
+    dict: The updated buffer.
+    """
+    key = _buffer_key(conversation_id)
+    with _cache_lock(key):
+        buffer = conversation_cache.get(key) or {'chat_id': None, 'pending': []}
+        if buffer['chat_id'] is None and chat_id:
+            buffer['chat_id'] = int(chat_id)
+        buffer['pending'].extend(
+            {"id": message.get('id', ''), "text": message.get('text', ''), "isBot": bool(message.get('isBot'))}
+            for message in messages
+        )
+        conversation_cache.set(key, buffer, CONVERSATION_BUFFER['TIMEOUT'])
+        # Under the buffer lock, so a flush either sees these messages or runs after the
+        # marker is set again
+        seq = _mark_dirty(conversation_id)
+
+    if CONVERSATION_BUFFER['BACKGROUND']:
+        _flusher.start()
+    # Only a newly dirty conversation moves the head, so only then can a flush become due
+    if seq is not None and seq - (conversation_cache.get(FLUSHED_KEY) or 0) >= CONVERSATION_BUFFER['FLUSH_SIZE']:
+        if CONVERSATION_BUFFER['BACKGROUND']:
+            _flusher.wake()
+        else:
+            flush_conversations()
+    return buffer
+
+
+def _mark_dirty(conversation_id):
+    # Returns the log slot claimed for the conversation, or None if it was already dirty.
+    since = time.time()
+    if not conversation_cache.add(_dirty_key(conversation_id), since, CONVERSATION_BUFFER['TIMEOUT']):
+        return None
+    seq = conversation_cache.get(DIRTY_HEAD_KEY) or 0
+    for _ in range(CLAIM_ATTEMPTS):
+        seq += 1
+        if not conversation_cache.add(_dirty_log_key(seq), (conversation_id, since), CONVERSATION_BUFFER['TIMEOUT']):
+            continue
+        if seq > (conversation_cache.get(FLUSHED_KEY) or 0):
+            break
+        # A hole the flusher has already passed; claim another slot
+    else:
+        conversation_cache.delete(_dirty_key(conversation_id))
+        raise TimeoutError(f"Could not claim a dirty log slot for conversation {conversation_id}")
+    if (conversation_cache.get(DIRTY_HEAD_KEY) or 0) < seq:
+        conversation_cache.set(DIRTY_HEAD_KEY, seq, None)
+    return seq
+
+
+def _read_dirty_log(seq, head):
+    # Returns the (seq, (conversation id, since)) entries after seq, and the last slot read.
+    # Missing slots up to head are skipped: they expired or are holes left by a claim that
+    # failed without raising (the database cache returns False from add() when the database
+    # is locked). Slots past head are probed too: a writer may have claimed them without
+    # having updated the head yet.
+    entries = []
+    while seq < head:
+        slots = range(seq + 1, min(head, seq + LOG_CHUNK) + 1)
+        found = conversation_cache.get_many([_dirty_log_key(slot) for slot in slots])
+        entries.extend((slot, found[_dirty_log_key(slot)]) for slot in slots if _dirty_log_key(slot) in found)
+        seq = slots[-1]
+    while True:
+        slots = range(seq + 1, seq + LOG_PROBE + 1)
+        found = conversation_cache.get_many([_dirty_log_key(slot) for slot in slots])
+        for slot in slots:
+            if _dirty_log_key(slot) not in found:
+                return entries, seq
+            entries.append((slot, found[_dirty_log_key(slot)]))
+            seq = slot
+
+
+def flush_conversations(conversation_ids=None):
+    """
+    Write the pending messages of dirty conversations to the database in one batch.
+
+    New chats are created with one bulk INSERT, the last ordinal of every existing chat is
+    read with one grouped query, and all messages are written with one bulk INSERT, in a
+    single transaction. If the write fails the conversations stay dirty.
+
+    Parameters:
+    conversation_ids (list, optional): Only flush these conversations. Defaults to all dirty ones.
+
+    Returns:
+    dict: Maps each flushed conversation id to the id of its chat.
+    """
+    if conversation_ids is not None:
+        return _flush(conversation_ids)
+    flushed = conversation_cache.get(FLUSHED_KEY) or 0
+    entries, last = _read_dirty_log(flushed, conversation_cache.get(DIRTY_HEAD_KEY) or 0)
+    result = _flush({conversation_id for _, (conversation_id, _) in entries})
+    # Only after the write succeeded, so a failed flush is retried from the same slot
+    if (conversation_cache.get(FLUSHED_KEY) or 0) < last:
+        conversation_cache.set(FLUSHED_KEY, last, None)
+    seen = {seq for seq, _ in entries}
+    _relog_late_entries([seq for seq in range(flushed + 1, last + 1) if seq not in seen])
+    return result
+
+
+def _relog_late_entries(holes):
+    # A writer that read a stale head can claim a slot the flusher found empty, after it was
+    # read but before the flushed slot moved past it, and keep it. Its conversation stays
+    # marked dirty, so later turns would never log it again; re-read the holes once the flushed
+    # slot has moved and log what turned up in a live slot.
+    late = set()
+    for start in range(0, len(holes), LOG_CHUNK):
+        found = conversation_cache.get_many([_dirty_log_key(seq) for seq in holes[start:start + LOG_CHUNK]])
+        late.update(conversation_id for conversation_id, _ in found.values())
+    for conversation_id in sorted(late):
+        key = _buffer_key(conversation_id)
+        with _cache_lock(key):
+            buffer = conversation_cache.get(key)
+            if buffer and buffer['pending']:
+                conversation_cache.delete(_dirty_key(conversation_id))
+                _mark_dirty(conversation_id)
+
+
+def _flush(conversation_ids):
+    # Conversations flushed concurrently by another process, or flushed already through an
+    # older log slot, have no pending messages left and are skipped.
+    if not conversation_ids:
+        return {}
+    with ExitStack() as stack:
+        for conversation_id in sorted(conversation_ids):
+            stack.enter_context(_cache_lock(_buffer_key(conversation_id)))
+        keys = {conversation_id: _buffer_key(conversation_id) for conversation_id in conversation_ids}
+        stored = conversation_cache.get_many(keys.values())
+        buffers = {
+            conversation_id: stored[key]
+            for conversation_id, key in keys.items()
+            if key in stored and stored[key]['pending']
+        }
+        _write_buffers(buffers)
+        for buffer in buffers.values():
+            buffer['pending'] = []
+        conversation_cache.set_many(
+            {keys[conversation_id]: buffer for conversation_id, buffer in buffers.items()},
+            CONVERSATION_BUFFER['TIMEOUT'],
+        )
+        conversation_cache.delete_many([_dirty_key(conversation_id) for conversation_id in conversation_ids])
+    return {conversation_id: buffer['chat_id'] for conversation_id, buffer in buffers.items()}
+
+
+@timed('db_write')
+def _write_buffers(buffers):
+    if not buffers:
+        return
+    with transaction.atomic():
+        requested = {buffer['chat_id'] for buffer in buffers.values() if buffer['chat_id']}
+        existing = set(Chat.objects.filter(id__in=requested).values_list('id', flat=True))
+        # A conversation whose chat was deleted starts a new one
+        new = [conversation_id for conversation_id, buffer in buffers.items() if buffer['chat_id'] not in existing]
+        chats = Chat.objects.bulk_create([Chat(preview=make_preview(buffers[conversation_id]['pending'])) for conversation_id in new])
+        for conversation_id, chat in zip(new, chats):
+            buffers[conversation_id]['chat_id'] = chat.id
+
+        last_ordinals = dict(
+            Message.objects.filter(chat_id__in=existing)
+            .values('chat_id').annotate(last=Max('ordinal')).values_list('chat_id', 'last')
+        )
+        messages = []
+        for buffer in buffers.values():
+            chat_id = buffer['chat_id']
+            start = last_ordinals.get(chat_id, -1) + 1
+            if chat_id in existing and start == 0:
+                Chat.objects.filter(id=chat_id).update(preview=make_preview(buffer['pending']))
+            messages.extend(
+                Message(
+                    chat_id=chat_id,
+                    ordinal=start + offset,
+                    message_id=str(message['id'] or ''),
+                    text=message['text'] or '',
+                    is_bot=message['isBot'],
+                )
+                for offset, message in enumerate(buffer['pending'])
+            )
+        Message.objects.bulk_create(messages, batch_size=500)
+    index_new_messages(messages)
+
+
+def flush_due():
+    """
+    Flush all dirty conversations if FLUSH_SIZE of them are waiting or the oldest has
+    waited FLUSH_INTERVAL seconds.
+
+    Returns:
+    dict: The result of flush_conversations(), or an empty dict if no flush was due.
+    """
+    head = conversation_cache.get(DIRTY_HEAD_KEY) or 0
+    flushed = conversation_cache.get(FLUSHED_KEY) or 0
+    if head - flushed >= CONVERSATION_BUFFER['FLUSH_SIZE']:
+        return flush_conversations()
+    entries, _ = _read_dirty_log(flushed, head)
+    if entries and time.time() - min(since for _, (_, since) in entries) >= CONVERSATION_BUFFER['FLUSH_INTERVAL']:
+        return flush_conversations()
+    return {}
+
+
+class _Flusher:
+    # Background thread that runs flush_due() every FLUSH_INTERVAL seconds, or sooner when woken.
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='conversation-flusher', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(CONVERSATION_BUFFER['FLUSH_INTERVAL'])
+            self._wake.clear()
+            try:
+                flush_due()
+            except Exception:
+                logger.exception("Flushing buffered conversations failed")
+            finally:
+                connections.close_all()
+
+
+_flusher = _Flusher()
+
+
+@atexit.register
+def _flush_on_exit():
+    if _flusher._thread is None:
+        return
+    try:
+        flush_conversations()
+    except Exception:
+        logger.exception("Flushing buffered conversations at exit failed")
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core import checks
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.db import connections, router
+
+SQLITE_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'temp_store': 'MEMORY',
+})
+
+CACHE_DATABASE = getattr(settings, 'CACHE_DATABASE', 'cache')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply SQLITE_PRAGMAS to every new SQLite connection; connected to connection_created.
+
+    journal_mode=WAL is stored in the database file and persists after the setting is removed,
+    but the other pragmas only last for the connection, so they are set each time one is opened.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def check_cache_tables(app_configs, databases=None, **kwargs):
+    """
+    Warn about database cache tables missing from the database the router sends them to.
+
+    A database check, so it runs with migrate and `check --database`. Without the table every
+    cache and session write is dropped silently and every read misses.
+    """
+    if not databases:
+        return []
+    warnings = []
+    for table in sorted(_cache_tables()):
+        alias = router.db_for_write(BaseDatabaseCache(table, {}).cache_model_class)
+        if table not in connections[alias].introspection.table_names():
+            warnings.append(checks.Warning(
+                f"The cache table {table!r} does not exist in the {alias!r} database.",
+                hint="Run `python manage.py createcachetable`.",
+                id='chat.W001',
+            ))
+    return warnings
+
+
+def _cache_tables():
+    return {
+        config['LOCATION']
+        for config in settings.CACHES.values()
+        if config['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache'
+    }
+
+
+class CacheRouter:
+    """
+    Route the tables of the configured database caches to the CACHE_DATABASE alias.
+
+    Cache and session writes then take that database's write lock instead of the one the
+    chats are saved under. Other DatabaseCache tables, such as the legacy one read by
+    import_question_cache, stay on the default database. Without a CACHE_DATABASE entry in
+    DATABASES every table stays on the default database.
+    """
+
+    def __init__(self):
+        self.tables = _cache_tables()
+
+    def _database(self, model):
+        if CACHE_DATABASE in settings.DATABASES and model._meta.db_table in self.tables:
+            return CACHE_DATABASE
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._database(model)
+
+    def db_for_write(self, model, **hints):
+        return self._database(model)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # createcachetable asks with the cache's model, so each table is created in one database
+        model = hints.get('model')
+        if model is not None and self._database(model) is not None:
+            return db == CACHE_DATABASE
+        if db == CACHE_DATABASE:
+            return False
+        return None
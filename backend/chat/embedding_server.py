@@ -0,0 +1,269 @@
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collects concurrent encode requests into batches for a single encoder.
+
+    A request waits at most max_wait seconds for others to join its batch, and a batch is
+    sent as soon as it holds max_batch_size texts. One background thread owns the encoder,
+    so the model is only ever called from one place. If encoding a batch fails, its requests
+    are encoded one at a time, so only the request that caused the failure gets the error.
+
+    Methods:
+    encode(self, texts): Encodes texts as part of the next batch and returns their vectors.
+    stats(self): Returns request, text and batch counters.
+    """
+
+    def __init__(self, encoder, max_batch_size=64, max_wait=0.005):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def encode(self, texts):
+        """
+        Encodes texts as part of the next batch.
+
+        Args:
+        texts (list): The strings to encode.
+
+        Returns:
+        ndarray: An (n, dim) float32 array.
+        """
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'texts': self.texts,
+            'batches': self.batches,
+            'mean_batch_size': self.texts / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize(),
+        }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            count = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    for request_texts, future in batch:
+                        self._run_alone(request_texts, future)
+                continue
+
+            self._count(len(batch), len(texts))
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def _run_alone(self, texts, future):
+        try:
+            vectors = self._encode(texts)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self._count(1, len(texts))
+        future.set_result(vectors)
+
+    def _encode(self, texts):
+        return np.asarray(self.encoder(texts), dtype=np.float32) if texts else np.empty((0, 0), np.float32)
+
+    def _count(self, requests, texts):
+        self.requests += requests
+        self.texts += texts
+        self.batches += 1
+
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP interface of the embedding server.
+
+    POST /encode with a JSON body {"texts": [...]} returns the embeddings as raw
+    little-endian float32 bytes, with the array shape in the X-Embedding-Shape header.
+    GET /stats returns the batcher counters as JSON.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    batcher = None
+
+    def do_POST(self):
+        if self.path != '/encode':
+            return self._send(404, b'', 'text/plain')
+        try:
+            texts = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))['texts']
+        except (ValueError, KeyError, TypeError):
+            texts = None
+        # Checked here rather than by the encoder, which would fail the whole micro-batch
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return self._send(400, b'Expected a JSON body with a "texts" list of strings', 'text/plain')
+        try:
+            vectors = self.batcher.encode(texts)
+        except Exception as e:
+            return self._send(500, str(e).encode('utf-8'), 'text/plain')
+        self._send(200, vectors.astype('<f4').tobytes(), 'application/octet-stream',
+                   {'X-Embedding-Shape': f'{vectors.shape[0]},{vectors.shape[1] if vectors.ndim == 2 else 0}'})
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self._send(404, b'', 'text/plain')
+        self._send(200, json.dumps(self.batcher.stats()).encode('utf-8'), 'application/json')
+
+    def _send(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address.
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every worker thread of every Django process may connect at once.
+    request_queue_size = 128
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+class ThreadingTCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(url, batcher):
+    """
+    Create an embedding server listening on url.
+
+    Parameters:
+    url (str): 'unix:///path/to/socket' or 'http://host:port'.
+    batcher (MicroBatcher): The batcher that serves encode requests.
+
+    Returns:
+    socketserver.BaseServer: The server; call serve_forever() to run it.
+    """
+    handler = type('BoundEmbeddingRequestHandler', (EmbeddingRequestHandler,), {'batcher': batcher})
+    parsed = urlparse(url)
+    if parsed.scheme == 'unix':
+        return ThreadingUnixHTTPServer(parsed.path, handler)
+    return ThreadingTCPHTTPServer((parsed.hostname, parsed.port), handler)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class EmbeddingClient:
+    """
+    Client for the embedding server, over a Unix socket or HTTP.
+
+    Each thread keeps its own keep-alive connection.
+
+    Methods:
+    encode(self, texts): Returns the embeddings computed by the server.
+    """
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self._parsed = urlparse(url)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self._parsed.scheme == 'unix':
+                connection = _UnixHTTPConnection(self._parsed.path, self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self._parsed.hostname, self._parsed.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def encode(self, texts):
+        """
+        Returns the embeddings computed by the server.
+
+        Args:
+        texts (list): The strings to encode.
+
+        Returns:
+        ndarray: An (n, dim) float32 array.
+
+        Raises:
+        ConnectionError: If the server cannot be reached or returns an error.
+        """
+        body = json.dumps({'texts': list(texts)}).encode('utf-8')
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request('POST', '/encode', body, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                self._local.connection = None
+                # A kept-alive connection may have been closed by the server; reconnect once.
+                # Nothing else is retried: after a timeout the server is still encoding the texts.
+                if attempt or not isinstance(e, ConnectionError):
+                    raise ConnectionError(f"Embedding server at {self.url} is unreachable: {e}") from e
+
+        if response.status != 200:
+            raise ConnectionError(f"Embedding server returned {response.status}: {data.decode('utf-8', 'replace')}")
+        rows, dim = (int(value) for value in response.getheader('X-Embedding-Shape').split(','))
+        return np.frombuffer(data, dtype='<f4').reshape(rows, dim)
@@ -0,0 +1,388 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+SEARCH_CHUNK = 4096
+# Queries scored together by search_many
+QUERY_CHUNK = 64
+DTYPES = ('float32', 'float16', 'int8')
+
+
+class EmbeddingStore:
+    """
+    Fixed-width embedding rows in memory-mapped files, shared by every process on a host.
+
+    The directory holds:
+        manifest.json      {"generation", "dim", "dtype"}, replaced atomically on compaction
+        vectors-<g>.bin    the rows, dim values of dtype each, in the order they were added
+        scales-<g>.bin     int8 stores only: one float32 scale per row
+        full-<g>.bin       float16 and int8 stores only: the rows in float32, for re-ranking
+        ids-<g>.log        one line per change: "+<row> <id>" when a row is added and
+                           "-<id>" when it is removed
+    Readers map the files read-only, so all processes share one copy through the page cache,
+    and tail the id log to keep their id -> row map current. Writers append under an
+    exclusive file lock. When more than compact_ratio of the rows are dead, the live rows are
+    copied to a new generation; readers notice the new manifest and remap. The files of the
+    previous generation are only deleted by the next compaction, so a reader that read the
+    old manifest just before can still map them.
+
+    float16 rows halve and int8 rows (symmetric, scaled per row) quarter the memory scanned
+    per search. Quantized stores score every row on the small codes and then re-score the
+    best rerank candidates exactly against the float32 rows, so only those few rows of the
+    full-precision file are ever read.
+
+    Methods:
+    refresh(self): Applies rows added or removed by other processes.
+    add(self, ids, vectors): Appends rows for ids not already stored.
+    remove(self, ids): Marks the rows of ids as removed.
+    get_many(self, ids): Returns zero-copy row views for the stored ids.
+    search(self, vector, k): Returns the k most similar live rows for a query vector.
+    search_many(self, vectors, k): Runs search for each row of a matrix of query vectors.
+    compact(self): Rewrites the store without its removed rows.
+    """
+
+    def __init__(self, path, dtype='float32', rerank=32, compact_ratio=0.5, compact_min_rows=1024):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown embedding store dtype '{dtype}', expected one of {DTYPES}")
+        self.path = str(path)
+        self.dtype = np.dtype(dtype)
+        self.rerank = rerank
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._manifest_stat = None
+        self._reset(None)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._rows)
+
+    def __contains__(self, entry_id):
+        self.refresh()
+        return entry_id in self._rows
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _reset(self, manifest):
+        self.generation = manifest['generation'] if manifest else 0
+        self.dim = manifest['dim'] if manifest else None
+        if manifest:
+            self.dtype = np.dtype(manifest['dtype'])
+        self._rows = {}
+        self._ids = []
+        self._alive = np.zeros(0, dtype=bool)
+        # One past the highest row in the log, live or dead
+        self._next_row = 0
+        self._log_offset = 0
+        self._maps = {}
+
+    # Reading
+
+    def refresh(self):
+        """
+        Applies rows added or removed by other processes since the last call.
+
+        Costs two stat calls when nothing changed.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self._file('manifest.json'))
+            except FileNotFoundError:
+                return
+            key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if key != self._manifest_stat:
+                with open(self._file('manifest.json')) as f:
+                    manifest = json.load(f)
+                self._manifest_stat = key
+                if manifest['generation'] != self.generation or self.dim is None:
+                    self._reset(manifest)
+            self._read_log()
+
+    def _read_log(self):
+        log_path = self._file(f'ids-{self.generation}.log')
+        try:
+            size = os.path.getsize(log_path)
+        except FileNotFoundError:
+            return
+        if size <= self._log_offset:
+            return
+        with open(log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read(size - self._log_offset)
+        # Only complete lines; a writer may be half way through one
+        end = data.rfind(b'\n') + 1
+        self._log_offset += end
+        for line in data[:end].decode('ascii').splitlines():
+            if line.startswith('+'):
+                row, entry_id = line[1:].split(' ', 1)
+                self._set_row(entry_id, int(row))
+            elif line.startswith('-'):
+                row = self._rows.pop(line[1:], None)
+                if row is not None:
+                    self._alive[row] = False
+
+    def _set_row(self, entry_id, row):
+        if row >= len(self._alive):
+            self._alive = np.concatenate([self._alive, np.zeros(max(row + 1, 2 * len(self._alive)) - len(self._alive), dtype=bool)])
+            self._ids.extend([None] * (len(self._alive) - len(self._ids)))
+        previous = self._rows.get(entry_id)
+        if previous is not None:
+            self._alive[previous] = False
+        self._rows[entry_id] = row
+        self._ids[row] = entry_id
+        self._alive[row] = True
+        self._next_row = max(self._next_row, row + 1)
+
+    def _columns(self):
+        # (file prefix, dtype, values per row) of every file holding row data
+        columns = [('vectors', self.dtype, self.dim)]
+        if self.dtype == np.int8:
+            columns.append(('scales', np.dtype(np.float32), 1))
+        if self.dtype != np.float32:
+            columns.append(('full', np.dtype(np.float32), self.dim))
+        return columns
+
+    def _mapped(self, prefix, rows):
+        # The memory map of a row file, grown to cover at least rows rows
+        matrix = self._maps.get(prefix)
+        if matrix is None or len(matrix) < rows:
+            dtype, width = next((dtype, width) for name, dtype, width in self._columns() if name == prefix)
+            matrix = np.memmap(self._file(f'{prefix}-{self.generation}.bin'), dtype=dtype, mode='r', shape=(rows, width))
+            self._maps[prefix] = matrix
+        return matrix
+
+    def get_many(self, ids):
+        """
+        Returns the stored float32 vectors of ids, as read-only views into the shared mapping.
+
+        Args:
+        ids (iterable): The ids to look up.
+
+        Returns:
+        dict: Maps each stored id to its vector; ids that are not stored are left out.
+        """
+        with self._lock:
+            self.refresh()
+            rows = {entry_id: self._rows[entry_id] for entry_id in ids if entry_id in self._rows}
+            if not rows:
+                return {}
+            matrix = self._mapped('vectors' if self.dtype == np.float32 else 'full', self._next_row)
+            return {entry_id: matrix[row] for entry_id, row in rows.items()}
+
+    def search(self, vector, k=1):
+        """
+        Returns the k live rows with the highest inner product with a query vector.
+
+        Rows are scored in chunks, so quantized stores are never converted all at once. In
+        quantized stores the best max(k, rerank) rows are then re-scored in float32, so the
+        returned scores are exact; with rerank=0 the quantized scores are returned.
+
+        Args:
+        vector (ndarray): The L2-normalized query vector.
+        k (int): The number of results to return.
+
+        Returns:
+        list: (score, id) tuples sorted by descending similarity.
+        """
+        return self.search_many(np.asarray(vector, dtype=np.float32).reshape(1, -1), k)[0]
+
+    def search_many(self, vectors, k=1):
+        """
+        Returns the k most similar live rows for each of several query vectors.
+
+        Each chunk of rows is read once for QUERY_CHUNK queries at a time, so the score
+        matrix never holds more than QUERY_CHUNK columns.
+
+        Args:
+        vectors (ndarray): An (n, dim) array of L2-normalized query vectors.
+        k (int): The number of results to return per query.
+
+        Returns:
+        list: One list of (score, id) tuples per query, as returned by search.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self.refresh()
+            if not self._rows:
+                return [[] for _ in vectors]
+            count = self._next_row
+            maps = {prefix: self._mapped(prefix, count) for prefix, _, _ in self._columns()}
+            alive = self._alive[:count].copy()
+            ids = self._ids
+        live = int(alive.sum())
+        results = []
+        for first in range(0, len(vectors), QUERY_CHUNK):
+            queries = vectors[first:first + QUERY_CHUNK]
+            scores = np.empty((count, len(queries)), dtype=np.float32)
+            matrix = maps['vectors']
+            for start in range(0, count, SEARCH_CHUNK):
+                scores[start:start + SEARCH_CHUNK] = matrix[start:start + SEARCH_CHUNK].astype(np.float32, copy=False) @ queries.T
+            if 'scales' in maps:
+                scores *= maps['scales']
+            scores[~alive] = -np.inf
+            results.extend(self._top(scores[:, column], queries[column], k, live, maps, ids) for column in range(len(queries)))
+        return results
+
+    def _top(self, scores, vector, k, live, maps, ids):
+        k = min(k, live)
+        if k == 0:
+            return []
+        reranking = 'full' in maps and self.rerank > 0
+        candidates = min(max(k, self.rerank), live) if reranking else k
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        if reranking:
+            top = np.sort(top)
+            scores = np.full(len(scores), -np.inf, dtype=np.float32)
+            scores[top] = maps['full'][top] @ vector
+        top = top[np.argsort(-scores[top])][:k]
+        return [(float(scores[row]), ids[row]) for row in top]
+
+    # Writing
+
+    @contextmanager
+    def _write_lock(self):
+        # fcntl is POSIX only; it is imported here so the module loads everywhere.
+        import fcntl
+
+        with self._lock, open(self._file('lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, ids, vectors):
+        """
+        Appends rows for the ids that are not stored yet.
+
+        Args:
+        ids (list): The ids of the vectors.
+        vectors (ndarray): An (n, dim) array; rows are quantized to the store's dtype.
+
+        Returns:
+        int: The number of rows appended.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        with self._write_lock():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_manifest(self.generation)
+            new = {}
+            for entry_id, vector in zip(ids, vectors):
+                if entry_id not in self._rows and entry_id not in new:
+                    new[entry_id] = vector
+            if not new:
+                return 0
+            start = self._next_row
+            data = self._encode(np.vstack(list(new.values())))
+            for prefix, dtype, width in self._columns():
+                descriptor = os.open(self._file(f'{prefix}-{self.generation}.bin'), os.O_RDWR | os.O_CREAT, 0o644)
+                with os.fdopen(descriptor, 'r+b') as f:
+                    # Rows past the last logged one were left by a writer that failed; overwrite them.
+                    f.seek(start * width * dtype.itemsize)
+                    f.write(data[prefix].tobytes())
+            lines = ''.join(f'+{start + offset} {entry_id}\n' for offset, entry_id in enumerate(new))
+            self._append_log(lines)
+            return len(new)
+
+    def remove(self, ids):
+        """
+        Marks the rows of ids as removed, compacting the store when enough rows are dead.
+
+        Args:
+        ids (iterable): The ids to remove. Ids that are not stored are ignored.
+
+        Returns:
+        int: The number of rows removed.
+        """
+        with self._write_lock():
+            stored = [entry_id for entry_id in dict.fromkeys(ids) if entry_id in self._rows]
+            if stored:
+                self._append_log(''.join(f'-{entry_id}\n' for entry_id in stored))
+            total = self._next_row
+            if total >= self.compact_min_rows and total - len(self._rows) > self.compact_ratio * total:
+                self._compact()
+            return len(stored)
+
+    def compact(self):
+        """
+        Rewrites the store with only its live rows, as a new generation.
+
+        Returns:
+        None
+        """
+        with self._write_lock():
+            self._compact()
+
+    def _encode(self, vectors):
+        # The rows of each column file for float32 vectors
+        if self.dtype == np.float32:
+            return {'vectors': vectors}
+        if self.dtype == np.float16:
+            return {'vectors': vectors.astype(np.float16), 'full': vectors}
+        scales = np.abs(vectors).max(axis=1, keepdims=True) / 127
+        scales[scales == 0] = 1
+        codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+        return {'vectors': codes, 'scales': scales.astype(np.float32), 'full': vectors}
+
+    def _append_log(self, lines):
+        with open(self._file(f'ids-{self.generation}.log'), 'a', encoding='ascii') as f:
+            f.write(lines)
+        self._read_log()
+
+    def _compact(self):
+        if not self._next_row:
+            return
+        live = sorted(self._rows.items(), key=lambda item: item[1])
+        generation = self.generation + 1
+        for prefix, _, _ in self._columns():
+            matrix = self._mapped(prefix, self._next_row)
+            with open(self._file(f'{prefix}-{generation}.bin'), 'wb') as f:
+                for start in range(0, len(live), SEARCH_CHUNK):
+                    f.write(np.ascontiguousarray(matrix[[row for _, row in live[start:start + SEARCH_CHUNK]]]).tobytes())
+        with open(self._file(f'ids-{generation}.log'), 'w', encoding='ascii') as f:
+            f.write(''.join(f'+{row} {entry_id}\n' for row, (entry_id, _) in enumerate(live)))
+        expired = self.generation - 1
+        self._write_manifest(generation)
+        # Processes that still map older files keep reading them until they refresh
+        for name in [f'{prefix}-{expired}.bin' for prefix, _, _ in self._columns()] + [f'ids-{expired}.log']:
+            try:
+                os.unlink(self._file(name))
+            except FileNotFoundError:
+                pass
+        self.refresh()
+
+    def _write_manifest(self, generation):
+        manifest = {'generation': generation, 'dim': self.dim, 'dtype': self.dtype.name}
+        temp = self._file(f'manifest.json.{os.getpid()}')
+        with open(temp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp, self._file('manifest.json'))
+
+
+def build_embedding_store():
+    """
+    Create the embedding store configured by settings.EMBEDDING_STORE.
+
+    Returns:
+    EmbeddingStore: The store, or None if no PATH is configured.
+    """
+    config = getattr(settings, 'EMBEDDING_STORE', {})
+    if not config.get('PATH'):
+        return None
+    return EmbeddingStore(
+        config['PATH'],
+        dtype=config.get('DTYPE', 'float32'),
+        rerank=config.get('RERANK', 32),
+        compact_ratio=config.get('COMPACT_RATIO', 0.5),
+    )
@@ -0,0 +1,239 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+EMBEDDING_MODEL = getattr(settings, 'EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+EMBEDDING_SERVER = {
+    'URL': None,
+    'TIMEOUT': 30,
+    **getattr(settings, 'EMBEDDING_SERVER', {}),
+}
+
+if EMBEDDING_SERVER['URL']:
+    # Encode through the shared embedding server; the model is never loaded in this process
+    from .embedding_server import EmbeddingClient
+    embedding_client = EmbeddingClient(EMBEDDING_SERVER['URL'], EMBEDDING_SERVER['TIMEOUT'])
+else:
+    embedding_client = None
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Return the SentenceTransformer model, importing and loading it on first use.
+
+    sentence_transformers imports torch, so it is deferred until something encodes locally;
+    management commands and views that never embed do not pay for it.
+
+    Returns:
+    SentenceTransformer: The shared model instance.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+
+def warm_up():
+    """
+    Load the model and run one encode so the first request does not pay for it.
+
+    Does nothing when an embedding server is configured.
+    """
+    if embedding_client is None:
+        get_model().encode(['warm up'], convert_to_numpy=True, normalize_embeddings=True)
+
+
+def normalize_text(text):
+    """
+    Normalize text for use as a cache key: lowercase and collapse whitespace.
+
+    The MiniLM tokenizer is uncased and ignores surrounding whitespace, so texts that
+    normalize to the same string encode to the same vector.
+
+    Parameters:
+    text (str): The text to normalize.
+
+    Returns:
+    str: The normalized text.
+    """
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def text_key(text):
+    """
+    Return a stable cache key for a text: the SHA-1 of its normalized form.
+
+    Parameters:
+    text (str): The text to key.
+
+    Returns:
+    str: A hexadecimal digest.
+    """
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    A memoization layer in front of the sentence encoder.
+
+    Vectors are kept as float32 arrays in an in-process LRU keyed by text_key. When an
+    alias is configured, misses fall through to that shared Django cache before the
+    encoder is run, so worker processes can reuse each other's embeddings.
+
+    Attributes:
+    size (int): The maximum number of vectors held in the in-process LRU.
+    hits (int): Lookups served from the LRU or the shared cache.
+    misses (int): Lookups that had to run the encoder.
+
+    Methods:
+    encode(self, texts, encoder): Returns embeddings for texts, encoding only the misses.
+    stats(self): Returns the hit/miss counters and current size.
+    clear(self): Empties the in-process LRU and resets the counters.
+    """
+
+    def __init__(self, size=4096, alias=None, timeout=None, key_prefix='embedding'):
+        self.size = size
+        self.shared = caches[alias] if alias else None
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, texts, encoder):
+        """
+        Returns embeddings for texts, running the encoder only on texts not already cached.
+
+        Parameters:
+        texts (list): The strings to encode.
+        encoder (callable): A function mapping a list of strings to an (n, dim) array.
+
+        Returns:
+        ndarray: An (n, dim) float32 array in the same order as texts.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        keys = [text_key(text) for text in texts]
+        found = self._get_local(keys)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.shared is not None:
+            shared = self._get_shared(missing)
+            self._set_local(shared)
+            found.update(shared)
+            missing = [key for key in missing if key not in shared]
+
+        if missing:
+            texts_by_key = dict(zip(keys, texts))
+            vectors = np.asarray(encoder([texts_by_key[key] for key in missing]), dtype=np.float32)
+            encoded = dict(zip(missing, vectors))
+            self._set_local(encoded)
+            if self.shared is not None:
+                self.shared.set_many(
+                    {self._shared_key(key): vector.tobytes() for key, vector in encoded.items()},
+                    timeout=self.timeout,
+                )
+            found.update(encoded)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the current size of the in-process LRU.
+
+        Returns:
+        dict: A dictionary with 'hits', 'misses', 'hit_rate' and 'size' keys.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._vectors),
+            }
+
+    def clear(self):
+        """
+        Empties the in-process LRU and resets the counters. The shared cache is left untouched.
+        """
+        with self._lock:
+            self._vectors.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _get_local(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._vectors.get(key)
+                if vector is not None:
+                    self._vectors.move_to_end(key)
+                    found[key] = vector
+        return found
+
+    def _set_local(self, vectors):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._vectors[key] = vector
+                self._vectors.move_to_end(key)
+            while len(self._vectors) > self.size:
+                self._vectors.popitem(last=False)
+
+    def _get_shared(self, keys):
+        stored = self.shared.get_many([self._shared_key(key) for key in keys])
+        return {
+            key: np.frombuffer(stored[self._shared_key(key)], dtype=np.float32)
+            for key in keys
+            if self._shared_key(key) in stored
+        }
+
+    def _shared_key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+
+def _build_embedding_cache():
+    config = getattr(settings, 'EMBEDDING_CACHE', {})
+    return EmbeddingCache(
+        size=config.get('SIZE', 4096),
+        alias=config.get('ALIAS'),
+        timeout=config.get('TIMEOUT'),
+    )
+
+
+embedding_cache = _build_embedding_cache()
+
+
+def _encode_uncached(texts):
+    if embedding_client is not None:
+        return embedding_client.encode(texts)
+    return get_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def encode(texts):
+    """
+    Encode a list of texts into L2-normalized float32 embeddings, reusing cached vectors.
+
+    Parameters:
+    texts (list): The strings to encode.
+
+    Returns:
+    ndarray: An (n, dim) float32 array with one normalized embedding per text.
+    """
+    return embedding_cache.encode(texts, _encode_uncached)
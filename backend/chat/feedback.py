@@ -0,0 +1,168 @@
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+
+from .semantic_cache import cached_question
+
+CACHE_FEEDBACK = {
+    'LOG_PATH': None,
+    'EXPLORE_RATE': 0.0,
+    'EXPLORE_MARGIN': 0.05,
+    **getattr(settings, 'CACHE_FEEDBACK', {}),
+}
+
+
+class DecisionLog:
+    """
+    An append-only log of semantic cache decisions and the feedback users gave on them.
+
+    Each record is one JSON line, written with a single O_APPEND write, so every process on
+    the host can append to the same file without a lock. There are two kinds of record:
+        {"type": "lookup", "id", "time", "option", "query", "matched", "score", "served", "explored"}
+        {"type": "feedback", "id", "time", "helpful"}
+    where a feedback record's id is that of the lookup it rates.
+
+    Attributes:
+    path (str): The log file.
+
+    Methods:
+    append(self, record): Appends a record.
+    read(self): Yields the records in the order they were written.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, record):
+        os.write(self._fd, (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8'))
+
+    def read(self):
+        with open(self.path, encoding='utf-8') as log:
+            for line in log:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A torn last line from a process that died mid-write
+                    continue
+
+
+decision_log = DecisionLog(CACHE_FEEDBACK['LOG_PATH']) if CACHE_FEEDBACK['LOG_PATH'] else None
+
+
+def record_decision(query, option, score, entry_id, entry, explored=False):
+    """
+    Log a semantic cache decision, if CACHE_FEEDBACK['LOG_PATH'] is set.
+
+    Parameters:
+    query (str): The user's question.
+    option (str): The answer mode.
+    score (float): The similarity of the closest cached question.
+    entry_id (str): The id of the closest cached question, or None if there is none.
+    entry (dict): The cache entry that was served, or None on a miss.
+    explored (bool): Whether the entry was served below the threshold to collect feedback.
+
+    Returns:
+    str: The decision id the client sends feedback for, or None when logging is off.
+    """
+    if decision_log is None:
+        return None
+    if entry is not None:
+        matched = entry['question']
+    else:
+        matched = cached_question(entry_id) if entry_id is not None else None
+    decision_id = uuid.uuid4().hex
+    decision_log.append({
+        'type': 'lookup',
+        'id': decision_id,
+        'time': time.time(),
+        'option': option,
+        'query': query,
+        'matched': matched,
+        'score': round(float(score), 4),
+        'served': entry is not None,
+        'explored': explored,
+    })
+    return decision_id
+
+
+def record_feedback(decision_id, helpful):
+    """
+    Log a user's rating of the answer given for a decision.
+
+    Parameters:
+    decision_id (str): The id returned with the answer.
+    helpful (bool): Whether the user found the answer correct.
+
+    Returns:
+    bool: False when logging is off.
+    """
+    if decision_log is None:
+        return False
+    decision_log.append({'type': 'feedback', 'id': decision_id, 'time': time.time(), 'helpful': bool(helpful)})
+    return True
+
+
+def calibrate(records, thresholds, max_error_rate=0.05, min_labels=20, margin=0.05):
+    """
+    Replay logged decisions to find the lowest threshold whose served answers are accurate enough.
+
+    For every candidate threshold the hit rate is the fraction of lookups whose closest
+    question scored above it, and the error rate is the fraction rated unhelpful among the
+    rated answers served from the cache that scored above it. Only served answers are ever
+    rated, so a threshold well below every rated score has no evidence of its own: it is only
+    recommended if some rated answer scored within margin of it. Set
+    CACHE_FEEDBACK['EXPLORE_RATE'] to collect ratings below the current threshold.
+
+    Parameters:
+    records (iterable): Records read from a DecisionLog.
+    thresholds (list): The candidate thresholds, ascending.
+    max_error_rate (float): The highest acceptable error rate.
+    min_labels (int): The fewest rated answers a threshold needs to be recommended.
+    margin (float): How far below the lowest rated score above it a threshold may be.
+
+    Returns:
+    dict: Per answer mode, {'lookups', 'rows', 'recommended'}, where rows has one
+        {'threshold', 'hit_rate', 'error_rate', 'labels', 'lowest_rated'} per candidate and
+        recommended is the lowest qualifying threshold or None.
+    """
+    lookups = {}
+    ratings = {}
+    for record in records:
+        if record.get('type') == 'lookup':
+            lookups[record['id']] = record
+        elif record.get('type') == 'feedback':
+            # The latest rating of a decision wins
+            ratings[record['id']] = record['helpful']
+
+    by_option = {}
+    for decision_id, lookup in lookups.items():
+        by_option.setdefault(lookup['option'], []).append((lookup['score'], lookup['served'], ratings.get(decision_id)))
+
+    report = {}
+    for option, decisions in sorted(by_option.items()):
+        rows = []
+        recommended = None
+        for threshold in thresholds:
+            above = [(score, served, helpful) for score, served, helpful in decisions if score > threshold]
+            rated = [(score, helpful) for score, served, helpful in above if served and helpful is not None]
+            error_rate = [helpful for _, helpful in rated].count(False) / len(rated) if rated else None
+            lowest_rated = min(score for score, _ in rated) if rated else None
+            rows.append({
+                'threshold': threshold,
+                'hit_rate': len(above) / len(decisions),
+                'error_rate': error_rate,
+                'labels': len(rated),
+                'lowest_rated': lowest_rated,
+            })
+            if (recommended is None and len(rated) >= min_labels and error_rate <= max_error_rate
+                    and lowest_rated <= threshold + margin):
+                recommended = threshold
+        report[option] = {'lookups': len(decisions), 'rows': rows, 'recommended': recommended}
+    return report
@@ -0,0 +1,148 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .embeddings import text_key
+from .models import CacheWarmJob
+from .prefetch import add_answers, fetch_answers
+from .semantic_cache import load_index
+
+
+def enqueue_warm(questions, index=None):
+    """
+    Add "warm this question" jobs to the durable queue.
+
+    Questions already in the semantic cache, or already queued or in flight, are skipped.
+    Questions whose earlier job finished but which are no longer cached (or whose job
+    failed) are queued again.
+
+    Parameters:
+    questions (list): The questions to warm the cache with.
+    index (SemanticCacheIndex, optional): The semantic cache index, loaded if not given.
+
+    Returns:
+    int: The number of jobs queued.
+    """
+    index = index if index is not None else load_index()
+    keyed = {}
+    for question in questions:
+        if question and not index.contains(question):
+            keyed.setdefault(text_key(question), question)
+    if not keyed:
+        return 0
+
+    existing = set(CacheWarmJob.objects.filter(question_key__in=keyed).values_list('question_key', flat=True))
+    CacheWarmJob.objects.bulk_create(
+        [CacheWarmJob(question=question, question_key=key) for key, question in keyed.items() if key not in existing],
+        ignore_conflicts=True,
+    )
+    requeued = CacheWarmJob.objects.filter(
+        question_key__in=existing, status__in=[CacheWarmJob.DONE, CacheWarmJob.FAILED]
+    ).update(status=CacheWarmJob.PENDING, attempts=0, error='', updated_at=timezone.now())
+    return len(keyed) - len(existing) + requeued
+
+
+def claim_jobs(worker_id, batch_size):
+    """
+    Atomically claim up to batch_size pending jobs, oldest first.
+
+    Parameters:
+    worker_id (str): The identifier of the claiming worker.
+    batch_size (int): The maximum number of jobs to claim.
+
+    Returns:
+    list: The claimed CacheWarmJob objects.
+    """
+    with transaction.atomic():
+        ids = list(
+            CacheWarmJob.objects.filter(status=CacheWarmJob.PENDING)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        # Only rows still pending are taken, so concurrent workers never claim the same job.
+        CacheWarmJob.objects.filter(id__in=ids, status=CacheWarmJob.PENDING).update(
+            status=CacheWarmJob.RUNNING,
+            claimed_by=worker_id,
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now(),
+        )
+    return list(CacheWarmJob.objects.filter(id__in=ids, status=CacheWarmJob.RUNNING, claimed_by=worker_id))
+
+
+def process_jobs(jobs, max_attempts=3):
+    """
+    Fetch answers for claimed jobs and write them into the semantic cache.
+
+    Questions that were cached since being queued are completed without an upstream call.
+    Answers are fetched concurrently and encoded in one batch. A failed job goes back to
+    the queue until it has been attempted max_attempts times.
+
+    Parameters:
+    jobs (list): The claimed CacheWarmJob objects.
+    max_attempts (int): The number of attempts before a job is marked failed.
+
+    Returns:
+    dict: The number of jobs 'done', 'retried' and 'failed'.
+    """
+    index = load_index()
+    todo = [job for job in jobs if not index.contains(job.question)]
+    answers = fetch_answers(list(dict.fromkeys(job.question for job in todo)))
+    add_answers(answers)
+
+    todo_ids = {job.id for job in todo}
+    done = [job.id for job in jobs if job.id not in todo_ids or job.question in answers]
+    unanswered = [job for job in todo if job.question not in answers]
+    retried = [job.id for job in unanswered if job.attempts < max_attempts]
+    failed = [job.id for job in unanswered if job.attempts >= max_attempts]
+
+    now = timezone.now()
+    CacheWarmJob.objects.filter(id__in=done).update(status=CacheWarmJob.DONE, error='', updated_at=now)
+    CacheWarmJob.objects.filter(id__in=retried).update(
+        status=CacheWarmJob.PENDING, error='Upstream request failed', updated_at=now
+    )
+    CacheWarmJob.objects.filter(id__in=failed).update(
+        status=CacheWarmJob.FAILED, error='Upstream request failed', updated_at=now
+    )
+    return {'done': len(done), 'retried': len(retried), 'failed': len(failed)}
+
+
+def requeue_stale(older_than):
+    """
+    Return running jobs whose worker has not reported back within older_than seconds to the queue.
+
+    Parameters:
+    older_than (float): The age in seconds after which a running job is considered abandoned.
+
+    Returns:
+    int: The number of jobs requeued.
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return CacheWarmJob.objects.filter(status=CacheWarmJob.RUNNING, updated_at__lt=cutoff).update(
+        status=CacheWarmJob.PENDING, claimed_by='', updated_at=timezone.now()
+    )
+
+
+def queue_stats(window=60):
+    """
+    Summarize the queue: job counts per status, depth and recent throughput.
+
+    Parameters:
+    window (int): The period in seconds over which throughput is measured.
+
+    Returns:
+    dict: Counts per status, 'depth' (pending plus running jobs) and 'throughput' (jobs completed per second over the window).
+    """
+    counts = dict.fromkeys([status for status, _ in CacheWarmJob.STATUS_CHOICES], 0)
+    counts.update(CacheWarmJob.objects.values_list('status').annotate(count=Count('id')).order_by())
+    completed = CacheWarmJob.objects.filter(
+        status=CacheWarmJob.DONE, updated_at__gte=timezone.now() - timedelta(seconds=window)
+    ).count()
+    return {
+        **counts,
+        'depth': counts[CacheWarmJob.PENDING] + counts[CacheWarmJob.RUNNING],
+        'throughput': completed / window,
+    }
@@ -0,0 +1,60 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.batch import CHAT_BATCH, answer_batch
+
+
+def read_questions(lines):
+    # One question per line, either as plain text or as a JSON object with a "question" key
+    questions = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            try:
+                line = json.loads(line)['question']
+            except (ValueError, KeyError, TypeError) as e:
+                raise CommandError(f"Line {number} is not a JSON object with a 'question': {e}") from e
+        questions.append(line)
+    return questions
+
+
+class Command(BaseCommand):
+    help = "Answer the questions in a file through the batch chat pipeline, writing one JSON result per line."
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File with one question per line, as text or {\"question\": ...}; '-' for stdin.")
+        parser.add_argument('--output', help="Write the results here instead of to stdout.")
+        parser.add_argument('--option', default='Generation', help="The answer mode.")
+        parser.add_argument('--batch-size', type=int, default=CHAT_BATCH['MAX_QUESTIONS'],
+                            help="Questions encoded and looked up together.")
+
+    def handle(self, *args, **options):
+        if options['input'] == '-':
+            questions = read_questions(sys.stdin)
+        else:
+            try:
+                with open(options['input'], encoding='utf-8') as source:
+                    questions = read_questions(source)
+            except OSError as e:
+                raise CommandError(f"Could not read {options['input']!r}: {e}") from e
+        if options['option'] == 'mapping':
+            raise CommandError("The mapping option is not supported in batches")
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else self.stdout
+        counts = {'cached': 0, 'answered': 0, 'failed': 0}
+        try:
+            batch_size = options['batch_size']
+            for start in range(0, len(questions), batch_size):
+                for result in answer_batch(questions[start:start + batch_size], options['option']):
+                    result['index'] += start
+                    output.write(json.dumps(result) + '\n')
+                    counts['failed' if 'error' in result else 'cached' if result['cached'] else 'answered'] += 1
+        finally:
+            if options['output']:
+                output.close()
+        self.stderr.write(f"{len(questions)} question(s): {counts['cached']} cached, "
+                          f"{counts['answered']} answered, {counts['failed']} failed")
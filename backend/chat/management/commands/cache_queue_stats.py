@@ -0,0 +1,22 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from chat.jobs import queue_stats
+
+
+class Command(BaseCommand):
+    help = "Show the depth and throughput of the semantic cache warm-up queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=60,
+                            help="Seconds over which throughput is measured.")
+        parser.add_argument('--json', action='store_true', help="Print the stats as JSON.")
+
+    def handle(self, *args, **options):
+        stats = queue_stats(options['window'])
+        if options['json']:
+            self.stdout.write(json.dumps(stats))
+            return
+        for name, value in stats.items():
+            self.stdout.write(f"{name:<12}{value:.2f}" if isinstance(value, float) else f"{name:<12}{value}")
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.feedback import CACHE_FEEDBACK, DecisionLog, calibrate
+from chat.pipeline import similarity_threshold
+
+
+class Command(BaseCommand):
+    help = "Replay the logged semantic cache decisions and recommend a hit threshold per answer mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=CACHE_FEEDBACK['LOG_PATH'],
+                            help="The decision log. Defaults to CACHE_FEEDBACK['LOG_PATH'].")
+        parser.add_argument('--max-error-rate', type=float, default=0.05,
+                            help="Highest acceptable fraction of served answers rated unhelpful.")
+        parser.add_argument('--min-labels', type=int, default=20,
+                            help="Fewest rated answers a threshold needs to be recommended.")
+        parser.add_argument('--margin', type=float, default=0.05,
+                            help="How far below the lowest rated score a threshold may be recommended.")
+        parser.add_argument('--min', type=float, default=0.3, help="Lowest threshold considered.")
+        parser.add_argument('--max', type=float, default=0.95, help="Highest threshold considered.")
+        parser.add_argument('--step', type=float, default=0.01, help="Spacing of the thresholds considered.")
+        parser.add_argument('--json', action='store_true', help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        if not options['log']:
+            raise CommandError("No decision log; set CACHE_FEEDBACK['LOG_PATH'] or pass --log")
+        steps = int(round((options['max'] - options['min']) / options['step']))
+        thresholds = [round(options['min'] + i * options['step'], 4) for i in range(steps + 1)]
+        try:
+            report = calibrate(DecisionLog(options['log']).read(), thresholds, options['max_error_rate'],
+                               options['min_labels'], options['margin'])
+        except OSError as e:
+            raise CommandError(f"Could not read the decision log {options['log']!r}: {e}") from e
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        if not report:
+            self.stdout.write("No cache decisions logged yet")
+        for option, result in report.items():
+            current = similarity_threshold(option)
+            self.stdout.write(f"\n{option}: {result['lookups']} lookup(s), current threshold {current}")
+            self.stdout.write(f"{'threshold':>10}{'hit rate':>10}{'error rate':>12}{'labels':>8}")
+            for row in result['rows']:
+                error_rate = f"{row['error_rate']:.3f}" if row['error_rate'] is not None else '-'
+                marker = ' <' if row['threshold'] == result['recommended'] else ''
+                self.stdout.write(f"{row['threshold']:>10.2f}{row['hit_rate']:>10.3f}{error_rate:>12}{row['labels']:>8}{marker}")
+            if result['recommended'] is None:
+                self.stdout.write("No threshold has enough rated answers within the error budget")
+            else:
+                self.stdout.write(f"Recommended threshold: {result['recommended']}")
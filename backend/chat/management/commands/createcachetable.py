@@ -0,0 +1,19 @@
+from django.core.management.commands import createcachetable
+from django.db import connections
+
+
+class Command(createcachetable.Command):
+    help = ("Creates the tables needed to use the SQL cache backend, on every database the "
+            "router sends one to unless --database is given.")
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        # CacheRouter puts the cache tables on the 'cache' database, so the stock default
+        # of --database=default would create nothing.
+        parser.set_defaults(database=None)
+
+    def handle(self, *tablenames, **options):
+        if options['database'] is not None:
+            return super().handle(*tablenames, **options)
+        for alias in connections:
+            super().handle(*tablenames, **{**options, 'database': alias})
@@ -0,0 +1,26 @@
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from chat.embeddings import encode
+from chat.semantic_cache import import_legacy_questions, question_cache
+
+
+class Command(BaseCommand):
+    help = "Import the semantic cache from the single 'cached_questions' list into per-entry records."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', default='cache_question_table',
+                            help="Database cache table holding the list (the 'question' cache before it was tiered).")
+        parser.add_argument('--current', action='store_true',
+                            help="Read the list from the configured 'question' cache instead of --table.")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Entries encoded and inserted together.")
+
+    def handle(self, *args, **options):
+        source = question_cache if options['current'] else DatabaseCache(options['table'], {})
+        try:
+            imported, skipped = import_legacy_questions(encode, source, options['batch_size'])
+        except DatabaseError as e:
+            raise CommandError(f"Could not read the legacy cache table {options['table']!r}: {e}") from e
+        self.stdout.write(f"Imported {imported} question(s), skipped {skipped}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import Message
+from chat.search import index_messages
+
+
+class Command(BaseCommand):
+    help = "Store embeddings for saved messages that have none, for semantic chat search."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=256,
+                            help="Messages encoded together.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = Message.objects.filter(embedding__isnull=True).exclude(text='').order_by('id')
+        indexed = last_id = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id).only('id', 'text')[:batch_size])
+            if not batch:
+                break
+            indexed += index_messages(batch, batch_size)
+            last_id = batch[-1].id
+        self.stdout.write(f"Stored embeddings for {indexed} message(s)")
@@ -0,0 +1,60 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.jobs import claim_jobs, process_jobs, queue_stats, requeue_stale
+
+
+class Command(BaseCommand):
+    help = "Process queued semantic cache warm-up jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=16,
+                            help="Maximum number of jobs claimed and encoded together.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--max-attempts', type=int, default=3,
+                            help="Attempts before a job is marked failed.")
+        parser.add_argument('--stale-after', type=float, default=300,
+                            help="Seconds after which a running job is assumed abandoned and requeued.")
+        parser.add_argument('--report-interval', type=float, default=30,
+                            help="Seconds between queue depth and throughput reports.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        requeued = requeue_stale(options['stale_after'])
+        self.stdout.write(f"Worker {worker_id} started, requeued {requeued} stale job(s)")
+
+        processed = 0
+        started = last_report = time.monotonic()
+        while True:
+            jobs = claim_jobs(worker_id, options['batch_size'])
+            if jobs:
+                result = process_jobs(jobs, options['max_attempts'])
+                processed += len(jobs)
+                self.stdout.write(
+                    f"Processed {len(jobs)} job(s): {result['done']} done, "
+                    f"{result['retried']} retried, {result['failed']} failed"
+                )
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
+
+            now = time.monotonic()
+            if now - last_report >= options['report_interval']:
+                self._report(processed, now - started)
+                last_report = now
+
+        self._report(processed, time.monotonic() - started)
+
+    def _report(self, processed, elapsed):
+        stats = queue_stats()
+        self.stdout.write(
+            f"Queue depth {stats['depth']} ({stats['pending']} pending, {stats['running']} running), "
+            f"{processed} job(s) processed at {processed / max(elapsed, 1e-9):.2f}/s"
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from chat.embedding_server import MicroBatcher, make_server
+from chat.embeddings import EMBEDDING_MODEL, EMBEDDING_SERVER, get_model
+
+EMBEDDING_SERVER_URL = EMBEDDING_SERVER['URL'] or 'unix:///tmp/isro-bah-embedding.sock'
+
+
+class Command(BaseCommand):
+    help = "Serve sentence embeddings to the Django workers, batching concurrent requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=EMBEDDING_SERVER_URL,
+                            help="'unix:///path/to/socket' or 'http://host:port'. Defaults to EMBEDDING_SERVER['URL'].")
+        parser.add_argument('--max-batch-size', type=int, default=64,
+                            help="Maximum number of texts encoded in one batch.")
+        parser.add_argument('--max-wait-ms', type=float, default=5,
+                            help="Milliseconds a request waits for others to join its batch.")
+
+    def handle(self, *args, **options):
+        model = get_model()
+
+        def encoder(texts):
+            return model.encode(texts, batch_size=len(texts), convert_to_numpy=True, normalize_embeddings=True)
+
+        batcher = MicroBatcher(encoder, options['max_batch_size'], options['max_wait_ms'] / 1000)
+        server = make_server(options['url'], batcher)
+        self.stdout.write(f"Serving {EMBEDDING_MODEL} embeddings on {options['url']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,214 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from .embeddings import embedding_cache
+from .upstream import LatencyHistogram, upstreams
+
+# Upper bounds of the stage latency buckets, in milliseconds; finer than the upstream buckets
+# at the low end, where the encode and cache lookup stages fall.
+STAGE_BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# Upper bounds of the best similarity score buckets.
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram of plain values, e.g. similarity scores.
+
+    Methods:
+    observe(self, value): Records one value.
+    snapshot(self): Returns the bucket counts and the total count and sum.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'sum': self.sum,
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts)),
+            }
+
+
+_stages = {}
+_counters = {}
+_registry_lock = threading.Lock()
+similarity_scores = Histogram(SCORE_BUCKETS)
+
+# Stage durations of the request being served, for the Server-Timing header; None outside a request.
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _stage_histogram(name):
+    histogram = _stages.get(name)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _stages.setdefault(name, LatencyHistogram(STAGE_BUCKETS))
+    return histogram
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage.
+
+    The duration is added to the stage's histogram and, inside a request, to the request's
+    Server-Timing header. Time spent in a stage that raises is recorded too.
+
+    Parameters:
+    name (str): The stage name, e.g. 'encode'. Must be a valid Prometheus label value and
+        Server-Timing metric name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stage_histogram(name).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def timed(name):
+    """
+    Decorator form of stage: times every call of the decorated function as the stage name.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, amount=1):
+    """
+    Add to a counter.
+
+    Parameters:
+    name (str): The counter name, e.g. 'semantic_cache_hits'.
+    amount (int): The amount to add.
+    """
+    with _registry_lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_lookup(best_score, hit, matched=True):
+    """
+    Record the outcome of a semantic cache lookup.
+
+    Parameters:
+    best_score (float): The similarity of the closest cached question.
+    hit (bool): Whether the lookup was served from the cache.
+    matched (bool): Whether there was a cached question to compare with. The lookup functions
+        report a score of 0.0 against an empty cache, so that score is only observed when this is set.
+    """
+    increment('semantic_cache_hits' if hit else 'semantic_cache_misses')
+    if matched:
+        similarity_scores.observe(best_score)
+
+
+def start_request():
+    """
+    Start collecting stage timings for the current request.
+
+    Returns:
+    Token: Pass to end_request.
+    """
+    return _request_timings.set({})
+
+
+def end_request(token):
+    """
+    Stop collecting stage timings for the current request.
+
+    Parameters:
+    token (Token): The token returned by start_request.
+
+    Returns:
+    dict: A mapping of stage name to seconds spent in it during the request.
+    """
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    return timings or {}
+
+
+def _histogram_lines(name, labels, snapshot_buckets, count, total):
+    # Prometheus buckets are cumulative; ours count each bucket separately.
+    lines = []
+    seen = 0
+    for bound, bucket_count in snapshot_buckets.items():
+        seen += bucket_count
+        lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {seen}')
+    label_set = f'{{{labels.rstrip(",")}}}' if labels else ''
+    lines.append(f'{name}_count{label_set} {count}')
+    lines.append(f'{name}_sum{label_set} {total}')
+    return lines
+
+
+def render_prometheus():
+    """
+    Render the metrics of this process in the Prometheus text exposition format.
+
+    Returns:
+    str: The stage latency histograms, the counters, the embedding cache hits and misses, the
+        best similarity score histogram and the upstream latency histograms and circuit states.
+    """
+    lines = [
+        '# HELP chat_stage_duration_milliseconds Time spent in each chat pipeline stage.',
+        '# TYPE chat_stage_duration_milliseconds histogram',
+    ]
+    with _registry_lock:
+        stages = sorted(_stages.items())
+        counters = sorted(_counters.items())
+    for name, histogram in stages:
+        snapshot = histogram.snapshot()
+        lines += _histogram_lines('chat_stage_duration_milliseconds', f'stage="{name}",',
+                                  snapshot['buckets_ms'], snapshot['count'], snapshot['sum_ms'])
+
+    for name, value in counters:
+        lines.append(f'# TYPE chat_{name}_total counter')
+        lines.append(f'chat_{name}_total {value}')
+
+    embedding = embedding_cache.stats()
+    lines.append('# HELP chat_embedding_cache_hits_total Texts whose embedding was found in the in-process or shared cache.')
+    lines.append('# TYPE chat_embedding_cache_hits_total counter')
+    lines.append(f"chat_embedding_cache_hits_total {embedding['hits']}")
+    lines.append('# HELP chat_embedding_cache_misses_total Texts that had to be encoded.')
+    lines.append('# TYPE chat_embedding_cache_misses_total counter')
+    lines.append(f"chat_embedding_cache_misses_total {embedding['misses']}")
+
+    lines.append('# HELP chat_semantic_cache_best_score Similarity of the closest cached question per lookup.')
+    lines.append('# TYPE chat_semantic_cache_best_score histogram')
+    snapshot = similarity_scores.snapshot()
+    lines += _histogram_lines('chat_semantic_cache_best_score', '', snapshot['buckets'], snapshot['count'], snapshot['sum'])
+
+    lines.append('# HELP chat_upstream_duration_milliseconds Latency of upstream calls, retries included.')
+    lines.append('# TYPE chat_upstream_duration_milliseconds histogram')
+    for name, client in sorted(upstreams.items()):
+        snapshot = client.latency.snapshot()
+        lines += _histogram_lines('chat_upstream_duration_milliseconds', f'upstream="{name}",',
+                                  snapshot['buckets_ms'], snapshot['count'], snapshot['sum_ms'])
+    lines.append('# HELP chat_upstream_circuit_open Whether the circuit breaker of an upstream is open.')
+    lines.append('# TYPE chat_upstream_circuit_open gauge')
+    for name, client in sorted(upstreams.items()):
+        lines.append(f'chat_upstream_circuit_open{{upstream="{name}"}} {int(client.breaker.state == client.breaker.OPEN)}')
+    return '\n'.join(lines) + '\n'
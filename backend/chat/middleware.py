@@ -0,0 +1,82 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from .metrics import end_request, start_request
+from .profiling import SamplingProfiler
+
+METRICS = {
+    'SERVER_TIMING': True,
+    'PROFILING': False,
+    'PROFILE_INTERVAL': 0.005,
+    **getattr(settings, 'METRICS', {}),
+}
+
+
+class ServerTimingMiddleware:
+    """
+    Report the time each pipeline stage took in a Server-Timing response header.
+
+    The stages are those timed with chat.metrics.stage while the request was served, plus
+    'total' for the whole request. Streaming responses get no header, as their stages run
+    after the headers are sent.
+
+    The middleware is both sync and async capable, so under ASGI the async views are not
+    pushed onto a worker thread through it.
+
+    With METRICS['PROFILING'] set, a request served by WSGI with a `profile` query parameter
+    is run under chat.profiling.SamplingProfiler and answered with the collapsed stacks
+    instead of the view's response, whose status is returned in the X-Profiled-Status header.
+    Under ASGI the view runs on another thread than the middleware, so there is nothing to sample.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        profiler = None
+        if METRICS['PROFILING'] and 'profile' in request.GET:
+            profiler = SamplingProfiler(interval=METRICS['PROFILE_INTERVAL'])
+            profiler.start()
+
+        token = start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            timings = end_request(token)
+            if profiler is not None:
+                profiler.stop()
+
+        if profiler is not None:
+            profile = HttpResponse(profiler.collapsed(), content_type='text/plain; charset=utf-8')
+            profile['X-Profiled-Status'] = str(response.status_code)
+            return profile
+        return self._add_header(response, timings, total)
+
+    async def _acall(self, request):
+        token = start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            timings = end_request(token)
+        return self._add_header(response, timings, total)
+
+    def _add_header(self, response, timings, total):
+        if METRICS['SERVER_TIMING'] and not response.streaming:
+            entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+            entries.append(f'total;dur={total * 1000:.1f}')
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def backfill_previews(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    batch = []
+    for chat in Chat.objects.only('id', 'input_response_pairs').iterator(chunk_size=500):
+        messages = chat.input_response_pairs
+        if messages and isinstance(messages[0], dict):
+            text = ' '.join(str(messages[0].get('text') or '').split())
+            chat.preview = text if len(text) <= 120 else text[:119] + '…'
+            batch.append(chat)
+        if len(batch) >= 500:
+            Chat.objects.bulk_update(batch, ['preview'])
+            batch = []
+    if batch:
+        Chat.objects.bulk_update(batch, ['preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_cachewarmjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='preview',
+            field=models.CharField(blank=True, default='', max_length=120),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['-created_at', '-id'], name='chat_created_at_id_idx'),
+        ),
+        migrations.RunPython(backfill_previews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_messages_to_table(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    batch = []
+    chats = Chat.objects.exclude(input_response_pairs=[]).only('id', 'input_response_pairs')
+    for chat in chats.iterator(chunk_size=200):
+        for ordinal, message in enumerate(chat.input_response_pairs or []):
+            if not isinstance(message, dict):
+                continue
+            batch.append(Message(
+                chat_id=chat.id,
+                ordinal=ordinal,
+                message_id=str(message.get('id') or ''),
+                text=message.get('text') or '',
+                is_bot=bool(message.get('isBot')),
+            ))
+        if len(batch) >= 1000:
+            Message.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Message.objects.bulk_create(batch)
+    chats.update(input_response_pairs=[])
+
+
+def move_messages_to_json(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    for chat in Chat.objects.only('id').iterator(chunk_size=200):
+        chat.input_response_pairs = [
+            {"id": message_id, "text": text, "isBot": is_bot}
+            for message_id, text, is_bot in Message.objects.filter(chat_id=chat.id)
+            .order_by('ordinal').values_list('message_id', 'text', 'is_bot')
+        ]
+        chat.save(update_fields=['input_response_pairs'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chat_preview_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chat',
+            name='input_response_pairs',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordinal', models.PositiveIntegerField()),
+                ('message_id', models.CharField(blank=True, default='', max_length=64)),
+                ('text', models.TextField(blank=True, default='')),
+                ('is_bot', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chat.chat')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('chat', 'ordinal'), name='message_chat_ordinal_uniq')],
+            },
+        ),
+        migrations.RunPython(move_messages_to_table, move_messages_to_json),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# The PostgreSQL counterpart of the FTS5 index in 0005: a GIN index on the same to_tsvector()
+# expression chat/search.py matches against, so keyword search does not scan every message.
+CREATE_INDEX = "CREATE INDEX IF NOT EXISTS chat_message_text_tsv ON chat_message USING GIN (to_tsvector('english', text))"
+DROP_INDEX = "DROP INDEX IF EXISTS chat_message_text_tsv"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
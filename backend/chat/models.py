@@ -1,4 +1,23 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+
+PREVIEW_LENGTH = 120
+
+
+def make_preview(messages):
+    """
+    Build the sidebar preview of a chat: the text of its first message, truncated.
+
+    Args:
+    messages (list): The chat's messages, as dicts with a 'text' key.
+
+    Returns:
+    str: At most PREVIEW_LENGTH characters of the first message's text.
+    """
+    if not messages or not isinstance(messages[0], dict):
+        return ''
+    text = ' '.join(str(messages[0].get('text') or '').split())
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1] + '…'
+
 
 class Chat(models.Model):
     """
@@ -6,18 +25,29 @@ class Chat(models.Model):
 
     Attributes:
     id (AutoField): A unique identifier for the chat conversation.
-    input_response_pairs (JSONField): A JSON object to store user inputs and responses.
+    input_response_pairs (JSONField): Legacy storage of the messages. Migration 0004 moved
+        them to Message rows; it is no longer written.
     created_at (DateTimeField): The date and time when the chat conversation was created.
+    preview (CharField): The start of the first message, stored when that message is saved
+        so the chat list never has to load the messages.
 
     Methods:
     __str__(self): Returns a string representation of the Chat object.
+    append_messages(self, messages): Appends messages to the end of the chat conversation.
     add_message(self, message_id, text, is_bot): Adds a new message to the chat conversation.
 
     """
 
     id = models.AutoField(primary_key=True)
-    input_response_pairs = models.JSONField() 
+    input_response_pairs = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the chat list walks this index
+            models.Index(fields=['-created_at', '-id'], name='chat_created_at_id_idx'),
+        ]
 
     def __str__(self):
         """
@@ -33,6 +63,46 @@ class Chat(models.Model):
         """
         return f"Chat {self.id} - {self.created_at}"
 
+    def append_messages(self, messages):
+        """
+        Appends messages to the end of the chat conversation.
+
+        The messages are inserted with one bulk INSERT after the current last ordinal, read
+        from the (chat, ordinal) index, so the cost does not grow with the conversation. If a
+        concurrent append takes the same ordinals, the insert is retried after it.
+
+        Args:
+        self (Chat): An instance of the Chat model.
+        messages (list): Dicts with 'text', 'isBot' and optionally 'id' keys, as sent by the frontend.
+
+        Returns:
+        list: The created Message objects.
+        """
+        if not messages:
+            return []
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    last = self.messages.order_by('-ordinal').values_list('ordinal', flat=True).first()
+                    start = 0 if last is None else last + 1
+                    created = Message.objects.bulk_create([
+                        Message(
+                            chat=self,
+                            ordinal=start + offset,
+                            message_id=str(message.get('id') or ''),
+                            text=message.get('text') or '',
+                            is_bot=bool(message.get('isBot')),
+                        )
+                        for offset, message in enumerate(messages)
+                    ])
+                    if start == 0:
+                        self.preview = make_preview(messages)
+                        Chat.objects.filter(pk=self.pk).update(preview=self.preview)
+                return created
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+
     def add_message(self, message_id, text, is_bot):
         """
         Adds a new message to the chat conversation.
@@ -46,8 +116,134 @@ class Chat(models.Model):
         Returns:
         None
         """
-        # Assuming input_response_pairs is a list of messages
-        messages = self.input_response_pairs or []
-        messages.append({"id": message_id, "text": text, "isBot": is_bot})
-        self.input_response_pairs = messages
-        self.save()
\ No newline at end of file
+        self.append_messages([{"id": message_id, "text": text, "isBot": is_bot}])
+
+
+class Message(models.Model):
+    """
+    A single message of a chat conversation.
+
+    Messages are only ever inserted; a conversation is read back in ordinal order.
+
+    Attributes:
+    chat (ForeignKey): The chat conversation the message belongs to.
+    ordinal (PositiveIntegerField): The position of the message in the conversation, from 0.
+    message_id (CharField): The identifier the frontend gave the message.
+    text (TextField): The text content of the message.
+    is_bot (BooleanField): Whether the message is from the bot.
+    created_at (DateTimeField): The date and time when the message was saved.
+
+    Methods:
+    as_dict(self): Returns the message in the format used by the frontend.
+    """
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
+    ordinal = models.PositiveIntegerField()
+    message_id = models.CharField(max_length=64, blank=True, default='')
+    text = models.TextField(blank=True, default='')
+    is_bot = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Also the index used to read a conversation in order and to find its last message
+            models.UniqueConstraint(fields=['chat', 'ordinal'], name='message_chat_ordinal_uniq'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the Message object.
+
+        Returns:
+        str: A string in the format "Message {chat_id}.{ordinal}".
+        """
+        return f"Message {self.chat_id}.{self.ordinal}"
+
+    def as_dict(self):
+        """
+        Returns the message in the format used by the frontend.
+
+        Returns:
+        dict: {"id": ..., "text": ..., "isBot": ...}
+        """
+        return {"id": self.message_id, "text": self.text, "isBot": self.is_bot}
+
+
+class MessageEmbedding(models.Model):
+    """
+    The sentence embedding of a message, for semantic search over chat history.
+
+    Written when messages are saved if CHAT_SEARCH['SEMANTIC'] is set, or afterwards by the
+    `index_message_embeddings` management command. Rows are only ever inserted, so a search
+    index catches up by reading the rows with an id above the last one it has seen.
+
+    Attributes:
+    message (OneToOneField): The embedded message.
+    vector (BinaryField): The L2-normalized float32 embedding, as raw bytes.
+    """
+
+    message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name='embedding')
+    vector = models.BinaryField()
+
+    def __str__(self):
+        """
+        Returns a string representation of the MessageEmbedding object.
+
+        Returns:
+        str: A string in the format "MessageEmbedding {message_id}".
+        """
+        return f"MessageEmbedding {self.message_id}"
+
+
+class CacheWarmJob(models.Model):
+    """
+    A durable request to warm the semantic question cache with one question.
+
+    Jobs are written by the chat views and consumed by the `run_cache_worker` management
+    command. question_key is unique, so a question that is already queued, in flight or
+    cached is never enqueued twice.
+
+    Attributes:
+    question (TextField): The question to fetch an answer for.
+    question_key (CharField): The SHA-1 of the normalized question text.
+    status (CharField): One of 'pending', 'running', 'done' or 'failed'.
+    attempts (PositiveIntegerField): How many times a worker has tried this job.
+    claimed_by (CharField): The identifier of the worker processing the job.
+    error (TextField): The last error raised while processing the job.
+    created_at (DateTimeField): The date and time when the job was enqueued.
+    updated_at (DateTimeField): The date and time when the job last changed state.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    question = models.TextField()
+    question_key = models.CharField(max_length=40, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=64, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the CacheWarmJob object.
+
+        Returns:
+        str: A string in the format "CacheWarmJob {id} ({status}) - {question}".
+        """
+        return f"CacheWarmJob {self.id} ({self.status}) - {self.question}"
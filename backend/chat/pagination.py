@@ -0,0 +1,46 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class ChatCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the chat list, newest first.
+
+    Each page is fetched with a `created_at < cursor` range scan on the
+    chat_created_at_id_idx index, so a page costs the same however much history there is.
+    The response is {"next": url, "previous": url, "results": [...]}; follow `next` to
+    load older chats. `limit` sets the page size.
+    """
+
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+
+
+class MessageCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the messages of one chat, oldest first.
+
+    Pagination is opt-in: without a `limit` query parameter the whole conversation is
+    returned as a plain list, as before. With one, the response is
+    {"next": url, "previous": url, "results": [...]}, each page read from the
+    (chat, ordinal) index.
+    """
+
+    page_size = None
+    page_size_query_param = 'limit'
+    max_page_size = 500
+    ordering = 'ordinal'
+
+
+class SearchPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination for ranked search results.
+
+    Results are ordered by relevance rather than by a column, so they cannot be keyset
+    paginated; each page of a keyword search is one LIMIT/OFFSET query on the FTS index.
+    The response is {"count": n, "next": url, "previous": url, "results": [...]}.
+    """
+
+    default_limit = 20
+    max_limit = 100
@@ -0,0 +1,212 @@
+import random
+from collections import namedtuple
+
+import requests
+from django.conf import settings
+
+from .coalescing import SingleFlight
+from .embeddings import encode, text_key
+from .feedback import CACHE_FEEDBACK, decision_log, record_decision
+from .metrics import record_lookup, stage, timed
+from .prefetch import schedule_warm
+from .semantic_cache import SEMANTIC_CACHE, lookup_entry
+from .upstream import upstreams
+
+# Cosine similarity above which a cached question is served instead of calling the upstreams,
+# unless SEMANTIC_CACHE['THRESHOLDS'] sets one for the answer mode.
+SIMILARITY_THRESHOLD = SEMANTIC_CACHE['THRESHOLD']
+
+# The outcome of a semantic cache lookup; decision_id is None unless decisions are logged.
+CacheDecision = namedtuple('CacheDecision', ['score', 'data', 'decision_id'])
+
+COALESCING = {
+    'ENABLED': True,
+    'THRESHOLD': SIMILARITY_THRESHOLD,
+    'ALIAS': None,
+    'LOCK_TIMEOUT': 60,
+    'RESULT_TIMEOUT': 10,
+    'WAIT_TIMEOUT': 30,
+    **getattr(settings, 'REQUEST_COALESCING', {}),
+}
+
+
+class StageError(Exception):
+    """
+    Raised by answer_question when an upstream call fails.
+
+    The message names the failed stage and is returned to the client as the response status.
+    """
+
+
+def _build_coalescer():
+    if not COALESCING['ENABLED']:
+        return None
+    return SingleFlight(
+        COALESCING['THRESHOLD'],
+        alias=COALESCING['ALIAS'],
+        lock_timeout=COALESCING['LOCK_TIMEOUT'],
+        result_timeout=COALESCING['RESULT_TIMEOUT'],
+        wait_timeout=COALESCING['WAIT_TIMEOUT'],
+    )
+
+
+# Shares one upstream computation between concurrent requests for the same question, or None.
+coalescer = _build_coalescer()
+
+
+def similarity_threshold(option):
+    """
+    Return the cache hit threshold for an answer mode.
+
+    Parameters:
+    option (str): The answer mode, e.g. 'Generation'.
+
+    Returns:
+    float: SEMANTIC_CACHE['THRESHOLDS'][option] if set, otherwise SEMANTIC_CACHE['THRESHOLD'].
+    """
+    return SEMANTIC_CACHE['THRESHOLDS'].get(option, SIMILARITY_THRESHOLD)
+
+
+def lookup_cached_answer(user_input, threshold=None, option='Generation'):
+    """
+    Look up the cached question most similar to the user input.
+
+    With CACHE_FEEDBACK['LOG_PATH'] set, the decision is logged for calibration (see
+    chat.feedback), and with CACHE_FEEDBACK['EXPLORE_RATE'] a small fraction of questions
+    scoring up to EXPLORE_MARGIN below the threshold are served from the cache so that
+    users can rate them.
+
+    Parameters:
+    user_input (str): The user's question.
+    threshold (float, optional): The minimum cosine similarity for a cache hit. Defaults to the threshold of the answer mode.
+    option (str, optional): The answer mode.
+
+    Returns:
+    CacheDecision: (best_score, data, decision_id) where data is the cached response payload, or None on a miss.
+    """
+    if threshold is None:
+        threshold = similarity_threshold(option)
+    explore = decision_log is not None and CACHE_FEEDBACK['EXPLORE_RATE'] > 0
+    with stage('encode'):
+        vector = encode([user_input])[0]
+    with stage('cache_lookup'):
+        best_score, entry_id, entry = lookup_entry(vector, threshold - CACHE_FEEDBACK['EXPLORE_MARGIN'] if explore else threshold)
+    explored = entry is not None and best_score <= threshold
+    if explored and random.random() >= CACHE_FEEDBACK['EXPLORE_RATE']:
+        entry, explored = None, False
+    record_lookup(best_score, entry is not None, matched=entry_id is not None)
+    decision_id = record_decision(user_input, option, best_score, entry_id, entry, explored)
+    return CacheDecision(best_score, entry['data'] if entry is not None else None, decision_id)
+
+
+@timed('optimize_query')
+def optimize_query(user_input):
+    """
+    Rewrite the user input with the query optimization service.
+
+    Parameters:
+    user_input (str): The user's question.
+
+    Returns:
+    str: The optimized query, or the user input if the service returned none.
+
+    Raises:
+    requests.exceptions.RequestException: If the service call fails.
+    """
+    response = upstreams['query_optimizer'].post('/process_query', json={"query": user_input})
+    response.raise_for_status()
+    return response.json().get('optimized_query', user_input)
+
+
+@timed('rag_query')
+def query_rag(query, mode, **kwargs):
+    """
+    Send a query to the RAG API.
+
+    Parameters:
+    query (str): The query to answer.
+    mode (str): The answer mode, e.g. 'Generation' or 'mapping'.
+    **kwargs: Passed to the upstream client, e.g. stream=True.
+
+    Returns:
+    requests.Response: The successful response.
+
+    Raises:
+    requests.exceptions.RequestException: If the call fails.
+    """
+    response = upstreams['rag'].post('/api/query', json={"query": query, "mode": mode}, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+@timed('ask')
+def ask_related(query):
+    """
+    Fetch related questions for a query from the /ask service.
+
+    Parameters:
+    query (str): The optimized query.
+
+    Returns:
+    dict: The response payload, with 'top_3_questions' and 'highest_similar_question'.
+
+    Raises:
+    requests.exceptions.RequestException: If the call fails.
+    """
+    response = upstreams['ask'].post('/ask', json={"chat_data": query})
+    response.raise_for_status()
+    return response.json()
+
+
+def _answer_from_upstreams(user_input, option):
+    try:
+        optimized_query = optimize_query(user_input)
+    except requests.exceptions.RequestException as e:
+        raise StageError(f"Query optimization API request error: {str(e)}") from e
+
+    try:
+        bot_response = query_rag(optimized_query, option).json().get('answer', 'No response from second API')
+    except requests.exceptions.RequestException as e:
+        raise StageError(f"External API request error: {str(e)}") from e
+
+    try:
+        api_response_data = ask_related(optimized_query)
+    except requests.exceptions.RequestException as e:
+        raise StageError(f"Send data API request error: {str(e)}") from e
+
+    # Warm the cache with answers to top_3_questions; this runs concurrently and,
+    # with CACHE_PREFETCH['BACKGROUND'], after the response has been returned
+    schedule_warm(api_response_data.get('top_3_questions', []))
+
+    return {
+        'answer': bot_response,
+        'highest_similar_question': api_response_data.get('highest_similar_question', ''),
+    }
+
+
+def answer_question(user_input, option):
+    """
+    Answer a question that missed the semantic cache with the upstream services.
+
+    Concurrent calls for the same question (up to normalization), or for questions whose
+    embeddings are more similar than both REQUEST_COALESCING['THRESHOLD'] and the mode's cache
+    hit threshold, share one set of upstream calls; see chat.coalescing.SingleFlight. A mode
+    whose hit threshold was raised by calibration is thus never coalesced more loosely.
+
+    Parameters:
+    user_input (str): The user's question.
+    option (str): The answer mode, e.g. 'Generation'.
+
+    Returns:
+    dict: The response payload, with 'answer' and 'highest_similar_question'.
+
+    Raises:
+    StageError: If an upstream call fails.
+    """
+    if coalescer is None:
+        return _answer_from_upstreams(user_input, option)
+    # The embedding was memoized by lookup_cached_answer, so this does not re-encode.
+    vector = encode([user_input])[0]
+    threshold = max(similarity_threshold(option), COALESCING['THRESHOLD'])
+    return coalescer.do(text_key(user_input), lambda: _answer_from_upstreams(user_input, option),
+                        vector=vector, scope=option, threshold=threshold)
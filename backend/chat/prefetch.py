@@ -0,0 +1,123 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+from django.db import connections
+
+from .embeddings import encode
+from .metrics import stage
+from .semantic_cache import insert_entries
+from .upstream import upstreams
+
+logger = logging.getLogger(__name__)
+
+PREFETCH = {
+    'WORKERS': 4,
+    'TIMEOUT': 10,
+    'BACKGROUND': True,
+    'QUEUE': False,
+    **getattr(settings, 'CACHE_PREFETCH', {}),
+}
+
+# Shared by every request in the process, so the number of concurrent prefetch calls is bounded.
+_executor = ThreadPoolExecutor(max_workers=PREFETCH['WORKERS'], thread_name_prefix='prefetch')
+# Runs whole warm-up jobs; kept separate so a job never waits on a slot it is occupying.
+_warm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-warm')
+
+
+def _fetch_answer(question):
+    response = upstreams['rag'].post('/api/query', json={"query": question, "mode": "generation"}, timeout=PREFETCH['TIMEOUT'])
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_answers(questions):
+    """
+    Fetch answers for several questions concurrently.
+
+    Each call has its own timeout; a question whose call fails is logged and left out of the
+    result instead of failing the whole batch.
+
+    Parameters:
+    questions (list): The questions to fetch answers for.
+
+    Returns:
+    dict: A mapping of question to response payload for every call that succeeded.
+    """
+    futures = {_executor.submit(_fetch_answer, question): question for question in questions}
+    answers = {}
+    for future in as_completed(futures):
+        question = futures[future]
+        try:
+            answers[question] = future.result()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Prefetch failed for question %r: %s", question, e)
+    return answers
+
+
+def add_answers(answers):
+    """
+    Add fetched answers to the semantic cache, encoding their questions in a single batch.
+
+    Parameters:
+    answers (dict): A mapping of question to response payload.
+
+    Returns:
+    int: The number of questions added to the cache; questions already cached are skipped.
+    """
+    if not answers:
+        return 0
+    questions = list(answers)
+    vectors = encode(questions)
+    return insert_entries([(question, answers[question], vector) for question, vector in zip(questions, vectors)])
+
+
+def warm_questions(questions):
+    """
+    Fetch answers for questions and add them to the semantic cache.
+
+    Parameters:
+    questions (list): The questions to warm the cache with.
+
+    Returns:
+    int: The number of questions added to the cache.
+    """
+    with stage('prefetch'):
+        return add_answers(fetch_answers(questions))
+
+
+def schedule_warm(questions):
+    """
+    Warm the semantic cache with questions, off the request path when CACHE_PREFETCH['BACKGROUND'] is set.
+
+    With CACHE_PREFETCH['QUEUE'] the questions are written to the durable job queue instead
+    and picked up by the `run_cache_worker` management command.
+
+    Parameters:
+    questions (list): The questions to warm the cache with.
+
+    Returns:
+    None
+    """
+    questions = [question for question in dict.fromkeys(questions) if question]
+    if not questions:
+        return
+    if PREFETCH['QUEUE']:
+        # Imported here because chat.jobs depends on this module.
+        from .jobs import enqueue_warm
+        enqueue_warm(questions)
+    elif PREFETCH['BACKGROUND']:
+        _warm_executor.submit(_warm_in_background, questions)
+    else:
+        warm_questions(questions)
+
+
+def _warm_in_background(questions):
+    try:
+        warm_questions(questions)
+    except Exception:
+        logger.exception("Background cache warming failed")
+    finally:
+        # The worker thread opened its own database connection for the cache tables.
+        connections.close_all()
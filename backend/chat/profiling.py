@@ -0,0 +1,57 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler for one thread.
+
+    A background thread samples the stack of the profiled thread every interval seconds
+    with sys._current_frames, so the profiled code runs at full speed between samples.
+    The result is in the collapsed-stack format read by flamegraph.pl and speedscope.
+
+    Attributes:
+    thread_id (int): The ident of the profiled thread.
+    interval (float): Seconds between samples.
+    samples (Counter): Sample counts keyed by collapsed stack.
+
+    Methods:
+    start(self): Starts sampling.
+    stop(self): Stops sampling and waits for the sampler thread to exit.
+    collapsed(self): Returns the samples as collapsed stacks, most frequent first.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common()) + '\n'
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
@@ -0,0 +1,36 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renderer for clients that accept only text/event-stream.
+
+    Streaming views return a StreamingHttpResponse and bypass renderers; this renderer lets
+    content negotiation succeed for them, and renders any regular Response (such as a 400
+    error) as a single 'error' event.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data)}\n\n".encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renderer for clients that accept only application/x-ndjson.
+
+    Like EventStreamRenderer, it lets content negotiation succeed for views that stream
+    newline-delimited JSON, and renders any regular Response as a single JSON line.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data) + "\n").encode(self.charset)
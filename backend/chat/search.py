@@ -0,0 +1,256 @@
+import logging
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .embeddings import encode
+from .models import Message, MessageEmbedding
+from .vector_index import build_vector_index
+
+logger = logging.getLogger(__name__)
+
+CHAT_SEARCH = {
+    'SEMANTIC': False,
+    'INDEX': 'exact',
+    'OPTIONS': {},
+    'THRESHOLD': 0.3,
+    'MAX_RESULTS': 200,
+    **getattr(settings, 'CHAT_SEARCH', {}),
+}
+
+KEYWORD_SQL = """
+    SELECT m.id, m.chat_id, m.ordinal, m.message_id, m.text, m.is_bot, c.preview,
+           bm25(chat_message_fts), snippet(chat_message_fts, 0, '[', ']', '…', 12)
+    FROM chat_message_fts
+    JOIN chat_message m ON m.id = chat_message_fts.rowid
+    JOIN chat_chat c ON c.id = m.chat_id
+    WHERE chat_message_fts MATCH %s
+    ORDER BY bm25(chat_message_fts), m.id
+    LIMIT %s OFFSET %s
+"""
+KEYWORD_COUNT_SQL = "SELECT count(*) FROM chat_message_fts WHERE chat_message_fts MATCH %s"
+
+# On PostgreSQL the same search runs against the GIN index on to_tsvector('english', text)
+# from migration 0006; the expression must match the index's for it to be used.
+POSTGRES_KEYWORD_SQL = """
+    SELECT m.id, m.chat_id, m.ordinal, m.message_id, m.text, m.is_bot, c.preview,
+           ts_rank(to_tsvector('english', m.text), q.query),
+           ts_headline('english', m.text, q.query, 'StartSel=[, StopSel=], MaxWords=12, MinWords=4')
+    FROM chat_message m
+    JOIN chat_chat c ON c.id = m.chat_id
+    CROSS JOIN plainto_tsquery('english', %s) AS q(query)
+    WHERE to_tsvector('english', m.text) @@ q.query
+    ORDER BY 8 DESC, m.id
+    LIMIT %s OFFSET %s
+"""
+POSTGRES_KEYWORD_COUNT_SQL = """
+    SELECT count(*) FROM chat_message WHERE to_tsvector('english', text) @@ plainto_tsquery('english', %s)
+"""
+
+
+def _hit(message, preview, score, snippet=None):
+    return {
+        "chat_id": message.chat_id,
+        "chat_preview": preview,
+        "ordinal": message.ordinal,
+        **message.as_dict(),
+        "score": score,
+        "snippet": snippet,
+    }
+
+
+def _fts_query(text):
+    # Quote every word so user input is never parsed as FTS5 syntax; the words are ANDed.
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"' for word in words)
+
+
+class KeywordResults:
+    """
+    The messages matching a keyword query, best first, fetched lazily one page at a time.
+
+    On SQLite the query runs against the chat_message_fts index (migration 0005) and hits are
+    ranked by BM25; on PostgreSQL against the GIN text search index (migration 0006), ranked
+    by ts_rank. On any other database it falls back to a case-insensitive substring match,
+    newest first, which scans every message. Slicing runs one LIMIT/OFFSET query, so it can
+    be handed to a DRF paginator.
+
+    Methods:
+    count(self): Returns the number of matching messages.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.vendor = connection.vendor
+        if self.vendor == 'sqlite':
+            self.match = _fts_query(query)
+        elif self.vendor == 'postgresql':
+            # plainto_tsquery ANDs the words and ignores any operators in them
+            self.match = ' '.join(re.findall(r'\w+', query))
+        else:
+            self.match = query
+
+    def count(self):
+        if not self.match:
+            return 0
+        if self.vendor not in ('sqlite', 'postgresql'):
+            return Message.objects.filter(text__icontains=self.match).count()
+        with connection.cursor() as cursor:
+            cursor.execute(KEYWORD_COUNT_SQL if self.vendor == 'sqlite' else POSTGRES_KEYWORD_COUNT_SQL, [self.match])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, page):
+        start, stop = page.start or 0, page.stop
+        if not self.match or stop <= start:
+            return []
+        if self.vendor not in ('sqlite', 'postgresql'):
+            messages = (
+                Message.objects.filter(text__icontains=self.match)
+                .select_related('chat').order_by('-id')[start:stop]
+            )
+            return [_hit(message, message.chat.preview, None) for message in messages]
+        with connection.cursor() as cursor:
+            cursor.execute(KEYWORD_SQL if self.vendor == 'sqlite' else POSTGRES_KEYWORD_SQL, [self.match, stop - start, start])
+            rows = cursor.fetchall()
+        # bm25() is lower for better matches; negate it so a higher score is better, as with ts_rank().
+        sign = -1 if self.vendor == 'sqlite' else 1
+        return [
+            _hit(Message(id=pk, chat_id=chat_id, ordinal=ordinal, message_id=message_id, text=text, is_bot=bool(is_bot)),
+                 preview, sign * rank, snippet)
+            for pk, chat_id, ordinal, message_id, text, is_bot, preview, rank, snippet in rows
+        ]
+
+
+def keyword_chat_ids(query):
+    """
+    Return the ids of the chats with a message matching a keyword query.
+
+    Parameters:
+    query (str): The words to search for.
+
+    Returns:
+    list: Chat ids, best match first, at most CHAT_SEARCH['MAX_RESULTS'] of them.
+    """
+    hits = KeywordResults(query)[0:CHAT_SEARCH['MAX_RESULTS']]
+    return list(dict.fromkeys(hit['chat_id'] for hit in hits))
+
+
+class MessageIndex:
+    """
+    An in-memory nearest-neighbour index over the stored message embeddings.
+
+    MessageEmbedding rows are only inserted, so the index catches up before each search by
+    loading the rows with an id above the last one it has loaded. Messages deleted since
+    they were loaded are dropped from the results when the hits are read back.
+
+    Methods:
+    search(self, vector, k): Returns up to k (score, message id) tuples, best first.
+    """
+
+    def __init__(self):
+        self.index = build_vector_index(CHAT_SEARCH['INDEX'], CHAT_SEARCH['OPTIONS'])
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, batch_size=2000):
+        with self._lock:
+            while True:
+                rows = list(
+                    MessageEmbedding.objects.filter(id__gt=self.last_id).order_by('id')
+                    .values_list('id', 'message_id', 'vector')[:batch_size]
+                )
+                for _, message_id, vector in rows:
+                    self.index.add(message_id, np.frombuffer(vector, dtype=np.float32))
+                if rows:
+                    self.last_id = rows[-1][0]
+                if len(rows) < batch_size:
+                    return
+
+    def search(self, vector, k):
+        self.refresh()
+        return self.index.search(vector, k)
+
+
+_message_index = None
+_message_index_lock = threading.Lock()
+
+
+def _get_message_index():
+    global _message_index
+    if _message_index is None:
+        with _message_index_lock:
+            if _message_index is None:
+                _message_index = MessageIndex()
+    return _message_index
+
+
+def semantic_search(query):
+    """
+    Find the messages most similar in meaning to a query.
+
+    Parameters:
+    query (str): The text to search for.
+
+    Returns:
+    list: Hits with a similarity of at least CHAT_SEARCH['THRESHOLD'], best first, at most
+        CHAT_SEARCH['MAX_RESULTS'] of them.
+    """
+    matches = _get_message_index().search(encode([query])[0], CHAT_SEARCH['MAX_RESULTS'])
+    matches = [(score, message_id) for score, message_id in matches if score >= CHAT_SEARCH['THRESHOLD']]
+    messages = {
+        message.id: message
+        for message in Message.objects.filter(id__in=[message_id for _, message_id in matches]).select_related('chat')
+    }
+    return [
+        _hit(messages[message_id], messages[message_id].chat.preview, score)
+        for score, message_id in matches
+        if message_id in messages
+    ]
+
+
+def index_messages(messages, batch_size=256):
+    """
+    Store the embeddings of saved messages for semantic search.
+
+    Messages without text are skipped, as are messages that already have an embedding.
+
+    Parameters:
+    messages (list): Saved Message objects.
+    batch_size (int): Messages encoded together.
+
+    Returns:
+    int: The number of messages encoded.
+    """
+    messages = [message for message in messages if message.text]
+    for start in range(0, len(messages), batch_size):
+        batch = messages[start:start + batch_size]
+        vectors = encode([message.text for message in batch])
+        MessageEmbedding.objects.bulk_create(
+            [MessageEmbedding(message_id=message.id, vector=vector.tobytes()) for message, vector in zip(batch, vectors)],
+            ignore_conflicts=True,
+        )
+    return len(messages)
+
+
+def index_new_messages(messages):
+    """
+    Store the embeddings of just-saved messages if CHAT_SEARCH['SEMANTIC'] is set.
+
+    A failure is logged rather than raised, so it never fails the write that saved the
+    messages; `python manage.py index_message_embeddings` fills in what was missed.
+
+    Parameters:
+    messages (list): Saved Message objects.
+    """
+    if not CHAT_SEARCH['SEMANTIC']:
+        return
+    try:
+        index_messages(messages)
+    except Exception:
+        logger.exception("Could not store the embeddings of %d message(s)", len(messages))
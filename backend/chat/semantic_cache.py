@@ -0,0 +1,581 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from .embedding_store import build_embedding_store
+from .embeddings import text_key
+from .vector_index import StoreIndex, build_vector_index
+
+question_cache = caches['question']
+# The log, its head and snapshot, and the locks must always be read from the shared cache,
+# so they live in the default cache, which has no per-process layer.
+log_cache = caches['default']
+# Host-local copy of the embeddings shared by all workers, or None (settings.EMBEDDING_STORE)
+embedding_store = build_embedding_store()
+
+SEMANTIC_CACHE = {
+    'THRESHOLD': 0.5,
+    'THRESHOLDS': {},
+    'MAX_ENTRIES': 100000,
+    'EVICTION': 'lru',
+    'TTL': DEFAULT_TIMEOUT,
+    **getattr(settings, 'SEMANTIC_CACHE', {}),
+}
+
+# Storage layout in the question cache. Each cached question is stored under its own keys,
+# named by the text_key of the question:
+#   semantic:entry:<id>   {'question', 'data', 'created_at'}: the answer payload
+#   semantic:vector:<id>  the normalized float32 embedding, as raw bytes
+#   semantic:usage:<id>   last hit time (LRU) or hit count (LFU), for eviction
+# Additions and removals are recorded in an append-only log in log_cache, one key per operation,
+#   semantic:log:<seq>    ('add', id) or ('remove', id)
+# whose slots are claimed with cache.add, so concurrent writers never overwrite each other.
+# semantic:head is the highest sequence number written; it tells readers when to catch up.
+# Every SNAPSHOT_EVERY operations the live ids are written to semantic:snapshot, which new
+# processes load instead of replaying the whole log; older log entries then expire after
+# LOG_RETENTION seconds.
+HEAD_KEY = 'semantic:head'
+SNAPSHOT_KEY = 'semantic:snapshot'
+# The highest log slot that may have expired; readers behind it reload the snapshot
+COMPACTED_KEY = 'semantic:compacted'
+SNAPSHOT_LOCK_KEY = 'semantic:snapshot:lock'
+EVICT_LOCK_KEY = 'semantic:evict:lock'
+SNAPSHOT_EVERY = 1000
+LOG_RETENTION = 60 * 60
+LOG_CHUNK = 1000
+LOG_PROBE = 16
+
+# Keys of the single-list format used before entries were stored individually. Read only by
+# import_legacy_questions().
+QUESTIONS_KEY = 'cached_questions'
+EMBEDDINGS_KEY = 'cached_question_embeddings'
+VERSION_KEY = 'cached_questions_version'
+
+
+def _entry_key(entry_id):
+    return f'semantic:entry:{entry_id}'
+
+
+def _vector_key(entry_id):
+    return f'semantic:vector:{entry_id}'
+
+
+def _usage_key(entry_id):
+    return f'semantic:usage:{entry_id}'
+
+
+def _log_key(seq):
+    return f'semantic:log:{seq}'
+
+
+class SemanticCacheIndex:
+    """
+    An in-memory nearest-neighbour index over the embeddings of the cached questions.
+
+    Only entry ids and embeddings are held in memory; answer payloads are read from the
+    question cache on a hit. Lookups go through a vector index (see chat.vector_index)
+    selected by settings.SEMANTIC_CACHE, so a query never re-encodes the cached questions.
+
+    Attributes:
+    index (VectorIndex): The nearest-neighbour index, keyed by entry id.
+    seq (int): The last log sequence number applied to this index.
+
+    Methods:
+    add(self, entry_id, vector): Adds or replaces the embedding of an entry.
+    remove(self, entry_id): Removes an entry.
+    ids(self): Returns the ids of all entries.
+    contains(self, question): Checks whether a question, up to normalization, is cached.
+    search(self, vector, k): Returns the ids of the k most similar entries for a query vector.
+    search_many(self, vectors, k): Runs search for each row of a matrix of query vectors.
+    best_match(self, vector, threshold): Returns the id of the most similar entry scoring above the threshold.
+    """
+
+    def __init__(self, index=None):
+        self.index = index if index is not None else _new_vector_index()
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, entry_id, vector):
+        """
+        Adds or replaces the embedding of an entry.
+
+        Args:
+        entry_id (str): The text_key of the question.
+        vector (ndarray): The embedding of the question; it is normalized before being stored.
+
+        Returns:
+        None
+        """
+        self.index.add(entry_id, _normalize(vector))
+
+    def remove(self, entry_id):
+        """
+        Removes an entry. Unknown ids are ignored.
+
+        Args:
+        entry_id (str): The text_key of the question.
+
+        Returns:
+        None
+        """
+        self.index.remove(entry_id)
+
+    def ids(self):
+        return self.index.keys()
+
+    def contains(self, question):
+        """
+        Checks whether a question is cached, ignoring case and whitespace differences.
+
+        Args:
+        question (str): The question text.
+
+        Returns:
+        bool: True if the question has a live entry.
+        """
+        return text_key(question) in self.index
+
+    def search(self, vector, k=1):
+        """
+        Returns the k most similar entries for a query vector.
+
+        Args:
+        vector (ndarray): The query embedding.
+        k (int): The number of results to return.
+
+        Returns:
+        list: (score, entry_id) tuples sorted by descending cosine similarity.
+        """
+        return self.index.search(_normalize(vector), k)
+
+    def search_many(self, vectors, k=1):
+        """
+        Returns the k most similar entries for each of several query vectors, searched together.
+
+        Args:
+        vectors (ndarray): An (n, dim) array of query embeddings.
+        k (int): The number of results to return per query.
+
+        Returns:
+        list: One list of (score, entry_id) tuples per query, as returned by search.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return self.index.search_many(vectors / np.where(norms == 0, 1, norms), k)
+
+    def best_match(self, vector, threshold):
+        """
+        Returns the most similar entry if its similarity exceeds the threshold.
+
+        Args:
+        vector (ndarray): The query embedding.
+        threshold (float): The minimum cosine similarity for a match.
+
+        Returns:
+        tuple: (score, entry_id) for the best match, or (best_score, None) when nothing clears the threshold.
+        """
+        results = self.search(vector, k=1)
+        if not results:
+            return 0.0, None
+        score, entry_id = results[0]
+        if score > threshold:
+            return score, entry_id
+        return score, None
+
+
+def _new_vector_index():
+    # With an embedding store, exact search runs on the shared mapping instead of a copy
+    if embedding_store is not None and SEMANTIC_CACHE.get('INDEX', 'exact') == 'exact':
+        return StoreIndex(embedding_store)
+    return build_vector_index()
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return vector
+    return vector / norm
+
+
+# Per-process copy of the index, brought up to date from the log when the head moves.
+_index = None
+_sync_lock = threading.Lock()
+
+
+def load_index():
+    """
+    Returns the semantic cache index, applying any log entries written since the last call.
+
+    When nothing changed this costs one read of the head key. Otherwise only the new log
+    entries and the embeddings of newly added questions are read. A process starting up,
+    or one whose log entries were compacted away, rebuilds its index from the snapshot.
+
+    Returns:
+    SemanticCacheIndex: The current index.
+    """
+    global _index
+
+    with _sync_lock:
+        head = log_cache.get(HEAD_KEY) or 0
+        if _index is None:
+            _index = _load_snapshot()
+        elif head <= _index.seq:
+            return _index
+        ops, missing = _read_log(_index.seq, head)
+        if missing is not None and missing <= (log_cache.get(COMPACTED_KEY) or 0):
+            _index = _load_snapshot()
+            ops, _ = _read_log(_index.seq, head)
+        _apply(_index, ops)
+        return _index
+
+
+def _load_snapshot():
+    index = SemanticCacheIndex()
+    snapshot = log_cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        return index
+    for entry_id, vector in _fetch_vectors(snapshot['ids']).items():
+        index.add(entry_id, vector)
+    index.seq = snapshot['seq']
+    return index
+
+
+def _fetch_vectors(entry_ids):
+    # Read from the embedding store when there is one; vectors it lacks (entries added by
+    # another host, or before the store was set up) come from the question cache and are
+    # added to it.
+    vectors = embedding_store.get_many(entry_ids) if embedding_store is not None else {}
+    missing = [entry_id for entry_id in entry_ids if entry_id not in vectors]
+    fetched = {}
+    for start in range(0, len(missing), LOG_CHUNK):
+        batch = missing[start:start + LOG_CHUNK]
+        stored = question_cache.get_many([_vector_key(entry_id) for entry_id in batch])
+        fetched.update(
+            (entry_id, np.frombuffer(stored[_vector_key(entry_id)], dtype=np.float32))
+            for entry_id in batch if _vector_key(entry_id) in stored
+        )
+    if embedding_store is not None and fetched:
+        embedding_store.add(list(fetched), np.vstack(list(fetched.values())))
+    vectors.update(fetched)
+    return vectors
+
+
+def _read_log(seq, head):
+    # Returns the (seq, op) pairs after seq and the first slot up to head that is missing,
+    # or None. A missing slot was either compacted away or is a hole left by a claim that
+    # failed without raising (the database cache returns False from add() when the
+    # database is locked); holes are skipped. Slots past head are probed too: a writer may
+    # have claimed them without having updated the head yet.
+    ops = []
+    missing = None
+    while seq < head:
+        slots = range(seq + 1, min(head, seq + LOG_CHUNK) + 1)
+        found = log_cache.get_many([_log_key(slot) for slot in slots])
+        for slot in slots:
+            if _log_key(slot) in found:
+                ops.append((slot, found[_log_key(slot)]))
+            elif missing is None:
+                missing = slot
+        seq = slots[-1]
+    while True:
+        slots = range(seq + 1, seq + LOG_PROBE + 1)
+        found = log_cache.get_many([_log_key(slot) for slot in slots])
+        for slot in slots:
+            if _log_key(slot) not in found:
+                return ops, missing
+            ops.append((slot, found[_log_key(slot)]))
+        seq = slots[-1]
+
+
+def _apply(index, ops):
+    if not ops:
+        return
+    # Only the last operation on each id matters
+    final = {}
+    for _, (action, entry_id) in ops:
+        final[entry_id] = action
+    removed = [entry_id for entry_id, action in final.items() if action == 'remove']
+    for entry_id in removed:
+        index.remove(entry_id)
+    if embedding_store is not None and removed:
+        embedding_store.remove(removed)
+    added = [entry_id for entry_id, action in final.items() if action == 'add']
+    for entry_id, vector in _fetch_vectors(added).items():
+        index.add(entry_id, vector)
+    index.seq = ops[-1][0]
+
+
+def _append_log(ops):
+    # Claim the next free slots after the head; cache.add succeeds for at most one writer per
+    # slot. The log can still have holes: an add() that fails without raising (a locked
+    # database cache) moves on to the next slot, and compacted slots expire. _read_log skips
+    # missing slots up to the head and stops at the first missing one past it, and a reader
+    # only reloads the snapshot when the first hole it met lies at or below semantic:compacted.
+    seq = max(log_cache.get(HEAD_KEY) or 0, _index.seq if _index is not None else 0)
+    first = seq + 1
+    for op in ops:
+        seq += 1
+        while not log_cache.add(_log_key(seq), op, None):
+            seq += 1
+    if (log_cache.get(HEAD_KEY) or 0) < seq:
+        log_cache.set(HEAD_KEY, seq, None)
+    if seq // SNAPSHOT_EVERY > (first - 1) // SNAPSHOT_EVERY:
+        _write_snapshot()
+
+
+def _write_snapshot():
+    # Record the live ids and expire the log entries that the previous snapshot covered, so
+    # the log stays bounded. Processes still behind the expired entries reload the snapshot.
+    # Entries are expired rather than deleted: a writer that read an old head may still be
+    # claiming slots there, and must find them taken.
+    if not log_cache.add(SNAPSHOT_LOCK_KEY, 1, 60):
+        return
+    try:
+        index = load_index()
+        previous = log_cache.get(SNAPSHOT_KEY) or {'seq': 0, 'compacted': 0}
+        if index.seq <= previous['seq']:
+            return
+        log_cache.set(SNAPSHOT_KEY, {'seq': index.seq, 'ids': index.ids(), 'compacted': previous['seq']}, None)
+        log_cache.set(COMPACTED_KEY, previous['seq'], None)
+        for slot in range(previous['compacted'] + 1, previous['seq'] + 1):
+            log_cache.touch(_log_key(slot), LOG_RETENTION)
+    finally:
+        log_cache.delete(SNAPSHOT_LOCK_KEY)
+
+
+def lookup_entry(vector, threshold):
+    """
+    Find the cached entry whose question is most similar to a query embedding.
+
+    A hit refreshes the entry's usage for eviction. An entry that expired since it was
+    indexed counts as a miss and is dropped from the index.
+
+    Parameters:
+    vector (ndarray): The query embedding.
+    threshold (float): The minimum cosine similarity for a hit.
+
+    Returns:
+    tuple: (best_score, entry_id, entry). entry_id is the closest cached question's, hit or
+        not, or None if there is none; entry is {'question', 'data', 'created_at'} on a hit
+        and None on a miss.
+    """
+    results = load_index().search(vector, k=1)
+    if not results:
+        return 0.0, None, None
+    score, entry_id = results[0]
+    if score <= threshold:
+        return score, entry_id, None
+    entry = question_cache.get(_entry_key(entry_id))
+    if entry is None:
+        remove_entries([entry_id])
+        return score, None, None
+    _record_hit(entry_id)
+    return score, entry_id, entry
+
+
+def lookup_answer(vector, threshold):
+    """
+    Find the cached answer whose question is most similar to a query embedding.
+
+    Parameters:
+    vector (ndarray): The query embedding.
+    threshold (float): The minimum cosine similarity for a hit.
+
+    Returns:
+    tuple: (best_score, data) where data is the cached response payload, or None on a miss.
+    """
+    score, _, entry = lookup_entry(vector, threshold)
+    return score, entry['data'] if entry is not None else None
+
+
+def cached_question(entry_id):
+    """
+    Return the text of a cached question.
+
+    Parameters:
+    entry_id (str): The text_key of the question.
+
+    Returns:
+    str: The question as it was cached, or None if the entry has expired.
+    """
+    entry = question_cache.get(_entry_key(entry_id))
+    return entry['question'] if entry is not None else None
+
+
+def lookup_entries(vectors, threshold):
+    """
+    Find the cached entries for several query embeddings with one index search and one cache read.
+
+    Parameters:
+    vectors (ndarray): An (n, dim) array of query embeddings.
+    threshold (float): The minimum cosine similarity for a hit.
+
+    Returns:
+    list: One (best_score, entry_id, entry) tuple per query, as returned by lookup_entry.
+    """
+    matches = [results[0] if results else (0.0, None) for results in load_index().search_many(vectors, k=1)]
+    entry_ids = {entry_id for score, entry_id in matches if entry_id is not None and score > threshold}
+    stored = question_cache.get_many([_entry_key(entry_id) for entry_id in entry_ids])
+    expired = [entry_id for entry_id in entry_ids if _entry_key(entry_id) not in stored]
+    if expired:
+        remove_entries(expired)
+    results = []
+    for score, entry_id in matches:
+        if entry_id is None or score <= threshold:
+            results.append((score, entry_id, None))
+        elif _entry_key(entry_id) not in stored:
+            results.append((score, None, None))
+        else:
+            _record_hit(entry_id)
+            results.append((score, entry_id, stored[_entry_key(entry_id)]))
+    return results
+
+
+def _record_hit(entry_id):
+    key = _usage_key(entry_id)
+    if SEMANTIC_CACHE['EVICTION'] == 'lfu':
+        try:
+            question_cache.incr(key)
+        except ValueError:
+            question_cache.set(key, 1, SEMANTIC_CACHE['TTL'])
+    else:
+        question_cache.set(key, time.time(), SEMANTIC_CACHE['TTL'])
+
+
+def insert_entries(items):
+    """
+    Add questions and their answers to the semantic cache.
+
+    Each entry is inserted with cache.add, so a question that is already cached (up to
+    normalization) is left untouched, even when two processes insert it at once. When the
+    cache grows past MAX_ENTRIES, the least recently (LRU) or least frequently (LFU) used
+    entries are evicted down to 90% of capacity.
+
+    Parameters:
+    items (list): (question, data, vector) tuples, where data is the response payload to
+        serve on a hit and vector the question's embedding.
+
+    Returns:
+    int: The number of entries inserted.
+    """
+    ttl = SEMANTIC_CACHE['TTL']
+    initial_usage = 1 if SEMANTIC_CACHE['EVICTION'] == 'lfu' else time.time()
+    inserted = {}
+    for question, data, vector in items:
+        entry_id = text_key(question)
+        if not question_cache.add(_entry_key(entry_id), {'question': question, 'data': data, 'created_at': time.time()}, ttl):
+            continue
+        vector = _normalize(vector)
+        question_cache.set_many({
+            _vector_key(entry_id): vector.tobytes(),
+            _usage_key(entry_id): initial_usage,
+        }, ttl)
+        inserted[entry_id] = vector
+    if not inserted:
+        return 0
+    if embedding_store is not None:
+        embedding_store.add(list(inserted), np.vstack(list(inserted.values())))
+
+    _append_log([('add', entry_id) for entry_id in inserted])
+    index = load_index()
+    if len(index) > SEMANTIC_CACHE['MAX_ENTRIES']:
+        evict(len(index) - int(SEMANTIC_CACHE['MAX_ENTRIES'] * 0.9))
+    return len(inserted)
+
+
+def remove_entries(entry_ids):
+    """
+    Remove entries from the semantic cache.
+
+    Parameters:
+    entry_ids (list): The text_keys of the questions to remove.
+
+    Returns:
+    None
+    """
+    if not entry_ids:
+        return
+    question_cache.delete_many(
+        [key for entry_id in entry_ids for key in (_entry_key(entry_id), _vector_key(entry_id), _usage_key(entry_id))]
+    )
+    _append_log([('remove', entry_id) for entry_id in entry_ids])
+    load_index()
+
+
+def evict(count):
+    """
+    Evict the count entries with the lowest usage under the configured policy.
+
+    Only one process evicts at a time; a call made while another eviction runs does nothing.
+
+    Parameters:
+    count (int): How many entries to evict.
+
+    Returns:
+    list: The ids of the evicted entries.
+    """
+    if count <= 0 or not log_cache.add(EVICT_LOCK_KEY, 1, 60):
+        return []
+    try:
+        entry_ids = load_index().ids()
+        usage = {}
+        for start in range(0, len(entry_ids), LOG_CHUNK):
+            batch = entry_ids[start:start + LOG_CHUNK]
+            stored = question_cache.get_many([_usage_key(entry_id) for entry_id in batch])
+            usage.update({entry_id: stored.get(_usage_key(entry_id), 0) for entry_id in batch})
+        victims = sorted(entry_ids, key=usage.__getitem__)[:count]
+        remove_entries(victims)
+    finally:
+        log_cache.delete(EVICT_LOCK_KEY)
+    return victims
+
+
+def import_legacy_questions(encode, source=None, batch_size=500):
+    """
+    Import questions stored in the single-list format into per-entry records.
+
+    Stored embeddings are reused when they match the list; otherwise the questions are
+    encoded. The legacy keys are deleted once every entry has been imported.
+
+    Parameters:
+    encode (callable): A function mapping a list of strings to an (n, dim) array of embeddings.
+    source (BaseCache, optional): The cache holding the legacy keys. Defaults to the question cache.
+    batch_size (int): How many entries to encode and insert at a time.
+
+    Returns:
+    tuple: (imported, skipped), where skipped counts removed or already cached questions.
+    """
+    source = source if source is not None else question_cache
+    entries = source.get(QUESTIONS_KEY) or []
+    matrix = source.get(EMBEDDINGS_KEY)
+    if matrix is not None and len(matrix) != len(entries):
+        matrix = None
+
+    imported = skipped = 0
+    for start in range(0, len(entries), batch_size):
+        batch = [
+            (position, entry) for position, entry in enumerate(entries[start:start + batch_size], start)
+            if entry is not None
+        ]
+        skipped += min(batch_size, len(entries) - start) - len(batch)
+        if not batch:
+            continue
+        if matrix is not None:
+            vectors = [matrix[position] for position, _ in batch]
+        else:
+            vectors = encode([entry['question'] for _, entry in batch])
+        count = insert_entries([
+            (entry['question'], entry['data'], vector) for (_, entry), vector in zip(batch, vectors)
+        ])
+        imported += count
+        skipped += len(batch) - count
+
+    source.delete_many([QUESTIONS_KEY, EMBEDDINGS_KEY, VERSION_KEY])
+    return imported, skipped
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Chat
+from .search import index_new_messages
 
 class ChatSerializer(serializers.ModelSerializer):
     """
@@ -15,6 +16,29 @@ class ChatSerializer(serializers.ModelSerializer):
     - serializer (ChatSerializer): An instance of the ChatSerializer class.
     """
 
+    input_response_pairs = serializers.ListField(child=serializers.DictField(), required=False, write_only=True)
+
+    class Meta:
+        model = Chat
+        fields = '__all__'
+
+    def create(self, validated_data):
+        messages = validated_data.pop('input_response_pairs', [])
+        chat = Chat.objects.create(**validated_data)
+        index_new_messages(chat.append_messages(messages))
+        return chat
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['input_response_pairs'] = [message.as_dict() for message in instance.messages.order_by('ordinal')]
+        return data
+
+
+class ChatSummarySerializer(serializers.ModelSerializer):
+    """
+    Serializer for the chat list: the id, creation date and preview of a chat, without its messages.
+    """
+
     class Meta:
         model = Chat
-        fields = '__all__'
\ No newline at end of file
+        fields = ['id', 'created_at', 'preview']
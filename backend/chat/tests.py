@@ -1,3 +1,1175 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+import requests
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.cache import caches
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import async_views, batch, conversations, feedback, jobs, pipeline, search, semantic_cache, views
+from .async_upstream import AsyncUpstreamClient
+from .cache_backends import TieredCache, _stores
+from .coalescing import SingleFlight
+from .metrics import stage
+from .middleware import ServerTimingMiddleware
+from .upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+from .embedding_server import EmbeddingClient, MicroBatcher, make_server
+from .embedding_store import EmbeddingStore
+from .vector_index import QUERY_CHUNK, ExactIndex, IVFIndex, StoreIndex
+from .models import CacheWarmJob, Chat, Message
+from .pipeline import CacheDecision, StageError
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def unit_vector(seed, dim=16):
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeUpstream:
+    """
+    A local HTTP server answering every POST with the next (status, delay) of a script;
+    the last step is repeated once the script runs out. Counts the requests it received.
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.hits = 0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, delay = upstream.script[min(upstream.hits, len(upstream.script) - 1)]
+                upstream.hits += 1
+                time.sleep(delay)
+                body = b'{"answer": "ok"}'
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def clear_l1():
+    # The L1 stores outlive the test transactions that roll back L2
+    for store in _stores.values():
+        with store.lock:
+            store.entries.clear()
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        # Only the trial goes through
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_unresolved_trial_expires(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+
+
+class UpstreamClientTests(SimpleTestCase):
+
+    def upstream_client(self, *script, **options):
+        upstream = FakeUpstream(*script)
+        self.addCleanup(upstream.close)
+        return upstream, UpstreamClient('test', upstream.url, backoff=0, **options)
+
+    def test_retries_5xx_responses(self):
+        upstream, client = self.upstream_client((503, 0), (200, 0), retries=2)
+        self.assertEqual(client.post('/ask', json={}).status_code, 200)
+        self.assertEqual(upstream.hits, 2)
+        self.assertEqual(client.breaker.failures, 0)
+
+    def test_does_not_retry_read_timeouts(self):
+        upstream, client = self.upstream_client((200, 0.5), read_timeout=0.1, retries=2)
+        # With read=0, urllib3 reports the timeout as retries exhausted, a ConnectionError
+        with self.assertRaises(requests.exceptions.RequestException):
+            client.post('/ask', json={})
+        self.assertEqual(upstream.hits, 1)
+        self.assertEqual(client.breaker.failures, 1)
+
+    def test_retries_connection_errors(self):
+        upstream, client = self.upstream_client((200, 0), retries=1)
+        upstream.close()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.post('/ask', json={})
+        self.assertEqual(client.breaker.failures, 1)
+
+    def test_open_circuit_short_circuits(self):
+        upstream, client = self.upstream_client((500, 0), retries=0, failure_threshold=2)
+        for _ in range(2):
+            self.assertEqual(client.post('/ask', json={}).status_code, 500)
+        with self.assertRaises(CircuitOpenError):
+            client.post('/ask', json={})
+        self.assertEqual(upstream.hits, 2)
+
+    def test_unexpected_error_resolves_the_trial(self):
+        upstream, client = self.upstream_client((200, 0), failure_threshold=1, reset_timeout=0.05)
+        client.breaker.record_failure()
+        time.sleep(0.06)
+        with mock.patch.object(client.session, 'post', side_effect=ValueError("bad payload")):
+            with self.assertRaises(ValueError):
+                client.post('/ask', json={})
+        self.assertEqual(client.breaker.state, client.breaker.OPEN)
+        time.sleep(0.06)
+        self.assertEqual(client.post('/ask', json={}).status_code, 200)
+        self.assertEqual(client.breaker.state, client.breaker.CLOSED)
+
+
+class AsyncUpstreamClientTests(SimpleTestCase):
+
+    def upstream_client(self, *script, read_timeout=30, **options):
+        upstream = FakeUpstream(*script)
+        self.addCleanup(upstream.close)
+        sync_client = UpstreamClient('test', upstream.url, **options)
+        return upstream, AsyncUpstreamClient(sync_client, read_timeout=read_timeout, backoff=0)
+
+    def open_until_trial(self, client):
+        client.breaker.failure_threshold = 1
+        client.breaker.reset_timeout = 0.05
+        client.breaker.record_failure()
+        time.sleep(0.06)
+
+    def test_does_not_retry_read_timeouts(self):
+        upstream, client = self.upstream_client((200, 0.5), read_timeout=0.1)
+        with self.assertRaises(httpx.ReadTimeout):
+            asyncio.run(client.post('/ask', json={}))
+        self.assertEqual(upstream.hits, 1)
+        self.assertEqual(client.breaker.failures, 1)
+
+    def test_cancelled_trial_lets_the_next_call_through(self):
+        upstream, client = self.upstream_client((200, 0.5))
+        self.open_until_trial(client)
+
+        async def cancelled_call():
+            task = asyncio.ensure_future(client.post('/ask', json={}))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelled_call())
+        self.assertTrue(client.breaker.allow())
+        self.assertEqual(client.breaker.state, client.breaker.HALF_OPEN)
+
+    def test_unexpected_error_resolves_the_trial(self):
+        upstream, client = self.upstream_client((200, 0))
+        self.open_until_trial(client)
+        with mock.patch.object(httpx.AsyncClient, 'post', side_effect=httpx.TooManyRedirects("redirects")):
+            with self.assertRaises(httpx.TooManyRedirects):
+                asyncio.run(client.post('/ask', json={}))
+        self.assertEqual(client.breaker.state, client.breaker.OPEN)
+        time.sleep(0.06)
+        self.assertEqual(asyncio.run(client.post('/ask', json={})).status_code, 200)
+        self.assertEqual(client.breaker.state, client.breaker.CLOSED)
+
+
+class EmbeddingServerTests(SimpleTestCase):
+
+    def encoder(self, texts):
+        self.encoded.append(list(texts))
+        if 'bad' in texts:
+            raise ValueError("cannot encode 'bad'")
+        return np.stack([unit_vector(len(text)) for text in texts])
+
+    def setUp(self):
+        self.encoded = []
+        self.batcher = MicroBatcher(self.encoder, max_wait=0.2)
+        self.server = make_server('http://127.0.0.1:0', self.batcher)
+        # The timeout test hangs up on a request the server still answers
+        self.server.handle_error = lambda request, client_address: None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = EmbeddingClient(f'http://127.0.0.1:{self.server.server_address[1]}', timeout=5)
+
+    def test_encode(self):
+        vectors = self.client.encode(["a", "bb"])
+        np.testing.assert_allclose(vectors, np.stack([unit_vector(1), unit_vector(2)]))
+
+    def test_rejects_texts_that_are_not_a_list_of_strings(self):
+        for texts in ("a string", [1, 2], None):
+            with self.subTest(texts=texts):
+                connection = self.client._connection()
+                connection.request('POST', '/encode', json.dumps({'texts': texts}).encode('utf-8'))
+                response = connection.getresponse()
+                response.read()
+                self.assertEqual(response.status, 400)
+        self.assertEqual(self.encoded, [])
+
+    def test_bad_request_does_not_fail_its_batch(self):
+        results = {}
+
+        def encode(texts):
+            try:
+                results[texts[0]] = self.batcher.encode(texts)
+            except ValueError as e:
+                results[texts[0]] = e
+
+        threads = [threading.Thread(target=encode, args=([text],)) for text in ("good", "bad", "fine")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIsInstance(results['bad'], ValueError)
+        np.testing.assert_allclose(results['good'], [unit_vector(4)])
+        np.testing.assert_allclose(results['fine'], [unit_vector(4)])
+        # One batch for all three, then each request on its own
+        self.assertEqual(len(self.encoded[0]), 3)
+
+    def test_read_timeout_is_not_retried(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.batcher.encoder = lambda texts: release.wait() and self.encoder(texts)
+        self.client.timeout = 0.2
+        with self.assertRaises(ConnectionError):
+            self.client.encode(["slow"])
+        release.set()
+        time.sleep(0.3)
+        # A retry would have queued a second encode of the same text
+        self.assertEqual(self.encoded, [["slow"]])
+
+
+class VectorIndexTests(SimpleTestCase):
+
+    def test_remove_and_re_add(self):
+        for index in (ExactIndex(), IVFIndex(nlist=2, nprobe=2, train_size=4)):
+            with self.subTest(index=type(index).__name__):
+                for seed in range(6):
+                    index.add(seed, unit_vector(seed))
+                index.remove(3)
+                self.assertNotIn(3, index)
+                self.assertNotEqual(index.search(unit_vector(3))[0][1], 3)
+                index.add(3, unit_vector(3))
+                self.assertEqual(index.search(unit_vector(3))[0][1], 3)
+                # Replacing a key moves it to the new vector
+                index.add(3, unit_vector(30))
+                self.assertEqual(index.search(unit_vector(30))[0][1], 3)
+                self.assertEqual(len(index), 6)
+
+    def test_ivf_probing_every_bucket_is_exact(self):
+        exact, ivf = ExactIndex(), IVFIndex(nlist=4, nprobe=4, train_size=50)
+        for seed in range(200):
+            for index in (exact, ivf):
+                index.add(seed, unit_vector(seed))
+        for seed in range(0, 200, 7):
+            ivf.remove(seed)
+            exact.remove(seed)
+        self.assertIsNotNone(ivf._centroids)
+        for seed in range(1000, 1020):
+            self.assertEqual([key for _, key in ivf.search(unit_vector(seed), k=5)],
+                             [key for _, key in exact.search(unit_vector(seed), k=5)])
+
+    def test_evicted_rows_are_reused(self):
+        index = ExactIndex()
+        for seed in range(1000):
+            index.add(seed, unit_vector(seed))
+            if seed >= 10:
+                index.remove(seed - 10)
+        # An LRU cache of 10 entries never holds more than 11 rows
+        self.assertLessEqual(len(index._keys), 11)
+        self.assertEqual(sorted(index.keys()), list(range(990, 1000)))
+        self.assertEqual([key for _, key in index.search(unit_vector(995), k=1)], [995])
+
+
+class EmbeddingStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def fill(self, store, seeds):
+        store.add([str(seed) for seed in seeds], np.stack([unit_vector(seed) for seed in seeds]))
+
+    def test_other_processes_see_added_and_removed_rows(self):
+        writer, reader = EmbeddingStore(self.path), EmbeddingStore(self.path)
+        self.fill(writer, range(5))
+        self.assertEqual(len(reader), 5)
+        self.assertEqual(writer.add(['4', '5'], np.stack([unit_vector(4), unit_vector(5)])), 1)
+        writer.remove(['2', 'unknown'])
+        self.assertNotIn('2', reader)
+        self.assertEqual(sorted(reader.get_many(['1', '2', '5'])), ['1', '5'])
+        np.testing.assert_array_equal(reader.get_many(['5'])['5'], unit_vector(5))
+        self.assertNotEqual(reader.search(unit_vector(2))[0][1], '2')
+        # A removed id can be added again, as a new row
+        writer.add(['2'], unit_vector(20).reshape(1, -1))
+        self.assertEqual(reader.search(unit_vector(20))[0][1], '2')
+        self.assertEqual(len(reader), 6)
+
+    def test_quantized_stores_rerank_to_exact_scores(self):
+        vectors = np.stack([unit_vector(seed, dim=64) for seed in range(300)])
+        query = unit_vector(1000, dim=64)
+        exact = vectors @ query
+        for dtype, itemsize in (('float16', 2), ('int8', 1)):
+            with self.subTest(dtype=dtype):
+                path = os.path.join(self.path, dtype)
+                store = EmbeddingStore(path, dtype=dtype, rerank=32)
+                store.add([str(seed) for seed in range(300)], vectors)
+                self.assertEqual(os.path.getsize(os.path.join(path, 'vectors-0.bin')), 300 * 64 * itemsize)
+                results = store.search(query, k=5)
+                self.assertEqual([int(key) for _, key in results], list(np.argsort(-exact)[:5]))
+                np.testing.assert_allclose([score for score, _ in results], np.sort(exact)[::-1][:5], rtol=1e-5)
+                # Lookups by id return the float32 rows, not the codes
+                np.testing.assert_array_equal(store.get_many(['7'])['7'], vectors[7])
+
+                # Without re-ranking the scores come from the codes
+                store.rerank = 0
+                approximate = store.search(query, k=5)
+                np.testing.assert_allclose([score for score, _ in approximate], np.sort(exact)[::-1][:5], atol=0.05)
+
+    def test_unknown_dtype(self):
+        with self.assertRaises(ValueError):
+            EmbeddingStore(self.path, dtype='int4')
+
+    def test_reader_of_the_previous_manifest_survives_a_compaction(self):
+        writer = EmbeddingStore(self.path, compact_min_rows=0)
+        self.fill(writer, range(10))
+        reader = EmbeddingStore(self.path)
+        reader.refresh()
+        writer.remove([str(seed) for seed in range(8)])
+        self.assertEqual(writer.generation, 1)
+        # The reader read the manifest just before the compaction and has not mapped the rows yet
+        with mock.patch.object(reader, 'refresh'):
+            self.assertEqual(reader.search(unit_vector(9))[0][1], '9')
+        self.assertEqual(reader.search(unit_vector(9))[0][1], '9')
+        self.assertEqual(reader.generation, 1)
+        # The next compaction deletes the files of generation 0
+        writer.compact()
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'vectors-0.bin')))
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'vectors-1.bin')))
+
+
+class SearchManyTests(SimpleTestCase):
+    # Batched search scores QUERY_CHUNK queries at a time and must agree with one search per query
+
+    def assert_same_results(self, index):
+        queries = np.stack([unit_vector(seed + 1000) for seed in range(QUERY_CHUNK + 5)])
+        batched = index.search_many(queries, k=3)
+        self.assertEqual(len(batched), len(queries))
+        for query, results in zip(queries, batched):
+            expected = index.search(query, k=3)
+            self.assertEqual(len(expected), 3)
+            self.assertEqual([key for _, key in results], [key for _, key in expected])
+            np.testing.assert_allclose([score for score, _ in results], [score for score, _ in expected], rtol=1e-5)
+
+    def test_exact_index(self):
+        index = ExactIndex()
+        for seed in range(200):
+            index.add(seed, unit_vector(seed))
+        index.remove(5)
+        self.assert_same_results(index)
+
+    def test_store_index(self):
+        for dtype in ('float32', 'float16', 'int8'):
+            with self.subTest(dtype=dtype), tempfile.TemporaryDirectory() as path:
+                store = EmbeddingStore(path, dtype=dtype, rerank=8)
+                store.add([str(seed) for seed in range(200)], np.stack([unit_vector(seed) for seed in range(200)]))
+                index = StoreIndex(store)
+                for seed in range(200):
+                    if seed != 5:
+                        index.add(str(seed), None)
+                self.assert_same_results(index)
+
+    def test_empty_index(self):
+        self.assertEqual(ExactIndex().search_many(np.stack([unit_vector(1)])), [[]])
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def start_leader(self, flight, key, vector=None, scope=''):
+        # Start a call that blocks until release is set; returns once it is in flight
+        release = threading.Event()
+        thread = threading.Thread(target=flight.do, args=(key, lambda: release.wait() and 'leader'),
+                                  kwargs={'vector': vector, 'scope': scope})
+        thread.start()
+        while not flight._calls:
+            time.sleep(0.001)
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        return release
+
+    def follow(self, flight, key, **kwargs):
+        # Returns 'leader' if the call joined the one in flight, 'own' if it computed its own result
+        result = []
+        thread = threading.Thread(target=lambda: result.append(flight.do(key, lambda: 'own', **kwargs)))
+        thread.start()
+        thread.join(0.2)
+        return result[0] if result else 'leader'
+
+    def test_same_key_shares_the_call(self):
+        flight = SingleFlight(0.5)
+        release = self.start_leader(flight, 'question')
+        result = []
+        thread = threading.Thread(target=lambda: result.append(flight.do('question', lambda: 'own')))
+        thread.start()
+        release.set()
+        thread.join()
+        self.assertEqual(result, ['leader'])
+
+    def test_leader_error_is_raised_in_followers(self):
+        flight = SingleFlight(0.5)
+        started, release, errors = threading.Event(), threading.Event(), []
+
+        def fail():
+            started.set()
+            release.wait()
+            raise RuntimeError("upstream down")
+
+        def call(fn):
+            try:
+                flight.do('question', fn)
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call, args=(fail,))]
+        threads[0].start()
+        started.wait()
+        threads.append(threading.Thread(target=call, args=(lambda: 'own',)))
+        threads[1].start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 2)
+
+    def test_similar_questions_share_the_call_within_a_scope(self):
+        flight = SingleFlight(0.5)
+        self.start_leader(flight, 'a', vector=unit_vector(1), scope='Generation')
+        self.assertEqual(self.follow(flight, 'b', vector=unit_vector(1), scope='Generation'), 'leader')
+        self.assertEqual(self.follow(flight, 'c', vector=unit_vector(1), scope='mapping'), 'own')
+        self.assertEqual(self.follow(flight, 'd', vector=-unit_vector(1), scope='Generation'), 'own')
+
+    def test_per_call_threshold_is_exclusive(self):
+        flight = SingleFlight(0.5)
+        vector = unit_vector(1)
+        self.start_leader(flight, 'a', vector=vector)
+        score = float(vector @ vector)
+        # Like the semantic cache, a score equal to the threshold is not a match
+        self.assertEqual(self.follow(flight, 'b', vector=vector, threshold=score), 'own')
+        self.assertEqual(self.follow(flight, 'c', vector=vector, threshold=score - 0.01), 'leader')
+
+    def test_answer_question_uses_the_mode_threshold(self):
+        with mock.patch.object(pipeline, 'coalescer') as coalescer, \
+                mock.patch.object(pipeline, 'encode', return_value=[unit_vector(1)]), \
+                mock.patch.dict(semantic_cache.SEMANTIC_CACHE['THRESHOLDS'], {'Generation': 0.6}), \
+                mock.patch.dict(pipeline.COALESCING, {'THRESHOLD': 0.5}):
+            pipeline.answer_question("What is RAG?", 'Generation')
+            self.assertEqual(coalescer.do.call_args.kwargs['threshold'], 0.6)
+            pipeline.answer_question("What is RAG?", 'Summary')
+            self.assertEqual(coalescer.do.call_args.kwargs['threshold'], 0.5)
+
+
+class MessageMigrationTests(TransactionTestCase):
+    databases = {'default', 'cache'}
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('chat', target)])
+        return executor.loader.project_state([('chat', target)]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationLoader(connection).graph.leaf_nodes('chat')[0][1])
+
+    def test_moves_messages_to_rows_and_back(self):
+        apps = self.migrate('0003_chat_preview_created_at_index')
+        pairs = [{'id': 'q', 'text': "Question", 'isBot': False}, {'id': 'a', 'text': "Answer", 'isBot': True}, "garbage"]
+        chat_id = apps.get_model('chat', 'Chat').objects.create(input_response_pairs=pairs).id
+
+        apps = self.migrate('0004_message')
+        messages = apps.get_model('chat', 'Message').objects.filter(chat_id=chat_id).order_by('ordinal')
+        self.assertEqual([(m.ordinal, m.message_id, m.text, m.is_bot) for m in messages],
+                         [(0, 'q', "Question", False), (1, 'a', "Answer", True)])
+        self.assertEqual(apps.get_model('chat', 'Chat').objects.get(id=chat_id).input_response_pairs, [])
+
+        apps = self.migrate('0003_chat_preview_created_at_index')
+        self.assertEqual(apps.get_model('chat', 'Chat').objects.get(id=chat_id).input_response_pairs, pairs[:2])
+
+
+class CacheWarmJobTests(TestCase):
+    databases = {'default', 'cache'}
+
+    class Index:
+        def __init__(self, *questions):
+            self.questions = set(questions)
+
+        def contains(self, question):
+            return question in self.questions
+
+    def test_enqueue_skips_cached_and_queued_questions(self):
+        self.assertEqual(jobs.enqueue_warm(["A?", "B?", "a?", "Cached?", ""], self.Index("Cached?")), 2)
+        self.assertEqual(jobs.enqueue_warm(["A?", "C?"], self.Index()), 1)
+        self.assertEqual(sorted(CacheWarmJob.objects.values_list('question', flat=True)), ["A?", "B?", "C?"])
+        # A finished job whose question is not cached any more is queued again
+        CacheWarmJob.objects.filter(question="A?").update(status=CacheWarmJob.DONE, attempts=1)
+        self.assertEqual(jobs.enqueue_warm(["A?", "B?"], self.Index()), 1)
+        self.assertEqual(CacheWarmJob.objects.get(question="A?").status, CacheWarmJob.PENDING)
+
+    def test_workers_claim_disjoint_jobs_oldest_first(self):
+        jobs.enqueue_warm([f"Q{n}?" for n in range(5)], self.Index())
+        first = jobs.claim_jobs('worker-1', 3)
+        second = jobs.claim_jobs('worker-2', 3)
+        self.assertEqual([job.question for job in first], ["Q0?", "Q1?", "Q2?"])
+        self.assertEqual([job.question for job in second], ["Q3?", "Q4?"])
+        self.assertEqual(jobs.claim_jobs('worker-3', 3), [])
+        self.assertEqual({job.attempts for job in first + second}, {1})
+        self.assertEqual(set(CacheWarmJob.objects.values_list('claimed_by', flat=True)), {'worker-1', 'worker-2'})
+
+    def test_failed_jobs_are_retried_then_failed(self):
+        jobs.enqueue_warm(["Good?", "Bad?", "Cached?"], self.Index())
+        fetch = mock.Mock(side_effect=lambda questions: {question: {'answer': "ok"} for question in questions if question == "Good?"})
+        with mock.patch.object(jobs, 'load_index', return_value=self.Index("Cached?")), \
+                mock.patch.object(jobs, 'fetch_answers', fetch), mock.patch.object(jobs, 'add_answers') as add:
+            self.assertEqual(jobs.process_jobs(jobs.claim_jobs('worker', 10), max_attempts=2), {'done': 2, 'retried': 1, 'failed': 0})
+            # Questions cached since they were queued are not fetched
+            self.assertEqual(sorted(fetch.call_args.args[0]), ["Bad?", "Good?"])
+            add.assert_called_once_with({"Good?": {'answer': "ok"}})
+            self.assertEqual(jobs.process_jobs(jobs.claim_jobs('worker', 10), max_attempts=2), {'done': 0, 'retried': 0, 'failed': 1})
+        self.assertEqual(jobs.queue_stats()['failed'], 1)
+
+    def test_stale_running_jobs_are_requeued(self):
+        jobs.enqueue_warm(["A?"], self.Index())
+        jobs.claim_jobs('lost-worker', 1)
+        self.assertEqual(jobs.requeue_stale(older_than=60), 0)
+        CacheWarmJob.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(jobs.requeue_stale(older_than=60), 1)
+        self.assertEqual([job.question for job in jobs.claim_jobs('worker', 1)], ["A?"])
+
+
+class SemanticCacheLogTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        clear_l1()
+        semantic_cache._index = None
+        self.addCleanup(setattr, semantic_cache, '_index', None)
+
+    def insert(self, seed):
+        question = f"Question {seed} {uuid.uuid4().hex}?"
+        semantic_cache.insert_entries([(question, {'answer': f"Answer {seed}"}, unit_vector(seed))])
+        return semantic_cache.text_key(question)
+
+    def replayed_ids(self):
+        # What a process starting now sees: no snapshot has been written yet, so it replays the log
+        semantic_cache._index = None
+        return set(semantic_cache.load_index().ids())
+
+    def test_lookup_finds_inserted_entry(self):
+        self.insert(1)
+        score, entry_id, entry = semantic_cache.lookup_entry(unit_vector(1), 0.5)
+        self.assertAlmostEqual(score, 1.0, places=5)
+        self.assertEqual(entry['data'], {'answer': "Answer 1"})
+
+    def test_empty_cache_is_a_miss(self):
+        self.assertEqual(semantic_cache.lookup_entry(unit_vector(1), 0.5), (0.0, None, None))
+
+    def test_replay_applies_adds_and_removes(self):
+        first, second = self.insert(1), self.insert(2)
+        semantic_cache.remove_entries([first])
+        self.assertEqual(self.replayed_ids(), {second})
+
+    def test_replay_skips_holes_below_head(self):
+        first = self.insert(1)
+        # A slot whose claim failed without raising: the head moved past it, nothing was written
+        head = semantic_cache.log_cache.get(semantic_cache.HEAD_KEY)
+        semantic_cache.log_cache.set(semantic_cache.HEAD_KEY, head + 1, None)
+        second = self.insert(2)
+        self.assertEqual(self.replayed_ids(), {first, second})
+
+    def test_replay_reads_slots_claimed_past_head(self):
+        first = self.insert(1)
+        second = self.insert(2)
+        # The second writer claimed its slot but has not moved the head yet
+        head = semantic_cache.log_cache.get(semantic_cache.HEAD_KEY)
+        semantic_cache.log_cache.set(semantic_cache.HEAD_KEY, head - 1, None)
+        self.assertEqual(self.replayed_ids(), {first, second})
+
+    def test_running_process_catches_up_after_a_hole(self):
+        first = self.insert(1)
+        index = semantic_cache.load_index()
+        head = semantic_cache.log_cache.get(semantic_cache.HEAD_KEY)
+        semantic_cache.log_cache.set(semantic_cache.HEAD_KEY, head + 1, None)
+        second = self.insert(2)
+        self.assertIs(semantic_cache.load_index(), index)
+        self.assertEqual(set(index.ids()), {first, second})
+
+    def test_writer_with_stale_head_does_not_overwrite_claimed_slots(self):
+        first = self.insert(1)
+        # A writer that read an older head must find the claimed slot taken and move on
+        semantic_cache.log_cache.set(semantic_cache.HEAD_KEY, 0, None)
+        semantic_cache._index.seq = 0
+        second = self.insert(2)
+        self.assertEqual(self.replayed_ids(), {first, second})
+
+
+class TieredCacheTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        clear_l1()
+        self.key = f'tiered-{uuid.uuid4().hex}'
+
+    def process(self, name, l1_timeout=60):
+        # Two instances with their own L1 store over the same L2 behave like two processes
+        return TieredCache(f'test-{name}-{uuid.uuid4().hex}', {'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': l1_timeout}})
+
+    def test_round_trip_with_compression(self):
+        cache = self.process('a')
+        value = {'answer': 'x' * 5000}
+        cache.set(self.key, value)
+        self.assertEqual(cache.get(self.key), value)
+        clear_l1()
+        self.assertEqual(cache.get(self.key), value)
+        self.assertEqual(cache.stats()['compressed_sets'], 1)
+
+    def test_l1_serves_stale_value_until_l1_timeout(self):
+        a, b = self.process('a', l1_timeout=0.2), self.process('b')
+        a.set(self.key, 'old')
+        b.set(self.key, 'new')
+        self.assertEqual(a.get(self.key), 'old')
+        time.sleep(0.25)
+        self.assertEqual(a.get(self.key), 'new')
+
+    def test_add_is_decided_by_l2(self):
+        a, b = self.process('a'), self.process('b')
+        self.assertTrue(a.add(self.key, 'a'))
+        # Present in L2 but not in b's L1
+        self.assertFalse(b.add(self.key, 'b'))
+        b.delete(self.key)
+        # Still in a's L1, but gone from L2
+        self.assertTrue(a.add(self.key, 'a again'))
+        self.assertEqual(b.get(self.key), 'a again')
+
+    def test_incr_is_left_to_l2(self):
+        a, b = self.process('a'), self.process('b')
+        a.set(self.key, 1)
+        self.assertEqual(caches['shared'].get(a.make_key(self.key)), 1)
+        self.assertEqual(b.incr(self.key), 2)
+        self.assertEqual(a.incr(self.key, 5), 7)
+        self.assertEqual(a.get(self.key), 7)
+        self.assertEqual(b.decr(self.key), 6)
+        with self.assertRaises(ValueError):
+            a.incr(f'{self.key}-missing')
+
+    def test_clear_only_removes_keys_of_its_alias(self):
+        options = {'OPTIONS': {'L2': 'shared'}}
+        a = TieredCache(f'test-{uuid.uuid4().hex}', {**options, 'KEY_PREFIX': 'a'})
+        b = TieredCache(f'test-{uuid.uuid4().hex}', {**options, 'KEY_PREFIX': 'b'})
+        unprefixed = TieredCache(f'test-{uuid.uuid4().hex}', options)
+        for cache in (a, b, unprefixed):
+            cache.set(self.key, 'value')
+        a.clear()
+        self.assertIsNone(a.get(self.key))
+        self.assertEqual(b.get(self.key), 'value')
+        self.assertEqual(unprefixed.get(self.key), 'value')
+        unprefixed.clear()
+        self.assertIsNone(unprefixed.get(self.key))
+        self.assertEqual(b.get(self.key), 'value')
+
+    def test_l1_disabled_always_reads_l2(self):
+        a = TieredCache(f'test-{uuid.uuid4().hex}', {'OPTIONS': {'L2': 'shared', 'L1_MAX_ENTRIES': 0}})
+        b = self.process('b')
+        a.set(self.key, 'old')
+        b.set(self.key, 'new')
+        self.assertEqual(a.get(self.key), 'new')
+
+
+class ConversationFlushTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        clear_l1()
+        patcher = mock.patch.dict(conversations.CONVERSATION_BUFFER, {'BACKGROUND': False, 'FLUSH_SIZE': 50})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def turn(self, conversation_id, n, chat_id=None):
+        return conversations.buffer_messages(conversation_id, [
+            {'id': f'q{n}', 'text': f"Question {n}", 'isBot': False},
+            {'id': f'a{n}', 'text': f"Answer {n}", 'isBot': True},
+        ], chat_id)
+
+    def texts(self, chat_id):
+        return list(Message.objects.filter(chat_id=chat_id).order_by('ordinal').values_list('text', flat=True))
+
+    def test_flush_writes_buffered_messages_in_order(self):
+        first, second = conversations.new_conversation_id(), conversations.new_conversation_id()
+        self.turn(first, 1)
+        self.turn(second, 2)
+        self.turn(first, 3)
+        self.assertEqual(Message.objects.count(), 0)
+
+        flushed = conversations.flush_conversations()
+        self.assertEqual(set(flushed), {first, second})
+        self.assertEqual(self.texts(flushed[first]), ["Question 1", "Answer 1", "Question 3", "Answer 3"])
+        self.assertEqual(Chat.objects.get(id=flushed[second]).preview, "Question 2")
+        self.assertEqual(conversations.get_conversation(first)['pending'], [])
+        self.assertEqual(conversations.flush_conversations(), {})
+
+    def test_later_turns_append_to_the_same_chat(self):
+        conversation_id = conversations.new_conversation_id()
+        self.turn(conversation_id, 1)
+        chat_id = conversations.flush_conversations()[conversation_id]
+        self.turn(conversation_id, 2)
+        self.assertEqual(conversations.flush_conversations(), {conversation_id: chat_id})
+        self.assertEqual(self.texts(chat_id), ["Question 1", "Answer 1", "Question 2", "Answer 2"])
+
+    def test_continues_an_existing_chat(self):
+        chat = Chat.objects.create()
+        chat.append_messages([{'text': "Saved earlier", 'isBot': False}])
+        conversation_id = conversations.new_conversation_id()
+        self.turn(conversation_id, 1, chat_id=chat.id)
+        self.assertEqual(conversations.flush_conversations([conversation_id]), {conversation_id: chat.id})
+        self.assertEqual(self.texts(chat.id), ["Saved earlier", "Question 1", "Answer 1"])
+
+    def test_flush_size_triggers_a_flush(self):
+        conversations.CONVERSATION_BUFFER['FLUSH_SIZE'] = 2
+        self.turn(conversations.new_conversation_id(), 1)
+        self.assertEqual(Message.objects.count(), 0)
+        self.turn(conversations.new_conversation_id(), 2)
+        self.assertEqual(Message.objects.count(), 4)
+
+    def test_failed_write_keeps_conversations_dirty(self):
+        conversation_id = conversations.new_conversation_id()
+        self.turn(conversation_id, 1)
+        with mock.patch.object(conversations, '_write_buffers', side_effect=RuntimeError("database down")):
+            with self.assertRaises(RuntimeError):
+                conversations.flush_conversations()
+        self.assertIn(conversation_id, conversations.flush_conversations())
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_flush_skips_holes_in_the_dirty_log(self):
+        first = conversations.new_conversation_id()
+        self.turn(first, 1)
+        head = conversations.conversation_cache.get(conversations.DIRTY_HEAD_KEY)
+        conversations.conversation_cache.set(conversations.DIRTY_HEAD_KEY, head + 1, None)
+        second = conversations.new_conversation_id()
+        self.turn(second, 2)
+        self.assertEqual(set(conversations.flush_conversations()), {first, second})
+
+    def test_entry_claimed_in_a_hole_during_a_flush_is_logged_again(self):
+        first = conversations.new_conversation_id()
+        self.turn(first, 1)
+        head = conversations.conversation_cache.get(conversations.DIRTY_HEAD_KEY)
+        conversations.conversation_cache.set(conversations.DIRTY_HEAD_KEY, head + 1, None)
+        late = conversations.new_conversation_id()
+        read_dirty_log = conversations._read_dirty_log
+
+        def read_then_claim_hole(seq, head):
+            result = read_dirty_log(seq, head)
+            # A writer with a stale head claims the hole the flusher has just found empty
+            conversations.conversation_cache.set(conversations._buffer_key(late), {
+                'chat_id': None, 'pending': [{'id': 'q', 'text': "Late", 'isBot': False}],
+            })
+            conversations.conversation_cache.add(conversations._dirty_key(late), time.time())
+            conversations.conversation_cache.add(conversations._dirty_log_key(head), (late, time.time()))
+            return result
+
+        with mock.patch.object(conversations, '_read_dirty_log', side_effect=read_then_claim_hole):
+            self.assertEqual(set(conversations.flush_conversations()), {first})
+        self.assertEqual(set(conversations.flush_conversations()), {late})
+        self.assertEqual(Message.objects.filter(text="Late").count(), 1)
+
+    def test_flush_due_waits_for_size_or_interval(self):
+        self.turn(conversations.new_conversation_id(), 1)
+        self.assertEqual(conversations.flush_due(), {})
+        with mock.patch.dict(conversations.CONVERSATION_BUFFER, {'FLUSH_INTERVAL': 0}):
+            self.assertEqual(len(conversations.flush_due()), 1)
+
+
+class ServerTimingMiddlewareTests(SimpleTestCase):
+
+    def test_sync_view_timings(self):
+        def view(request):
+            with stage('encode'):
+                pass
+            return HttpResponse()
+
+        middleware = ServerTimingMiddleware(view)
+        self.assertFalse(iscoroutinefunction(middleware))
+        self.assertRegex(middleware(RequestFactory().get('/'))['Server-Timing'], r'^encode;dur=[\d.]+, total;dur=')
+
+    def test_async_view_is_awaited_and_keeps_executor_timings(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+
+        def encode():
+            with stage('encode'):
+                pass
+
+        async def view(request):
+            # As async_views does for the embedding and cache lookup
+            await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, encode)
+            return HttpResponse()
+
+        middleware = ServerTimingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertRegex(response['Server-Timing'], r'^encode;dur=[\d.]+, total;dur=')
+
+
+class AsyncViewTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        clear_l1()
+        patcher = mock.patch.dict(conversations.CONVERSATION_BUFFER, {'BACKGROUND': False, 'FLUSH_SIZE': 50})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def save_chat(self, body):
+        return async_to_sync(AsyncClient().post)('/async/save_chat_to_cache/', body, content_type='application/json')
+
+    def test_miss_is_answered_through_answer_question(self):
+        chat_data = {'chat_data': [{'text': "What is RAG?", 'isBot': False}], 'option': 'Generation'}
+        with mock.patch.object(async_views, 'lookup_cached_answer', return_value=CacheDecision(0.1, None, None)), \
+                mock.patch.object(async_views, 'answer_question',
+                                  return_value={'answer': "Retrieval", 'highest_similar_question': "RAG?"}) as answer:
+            response = self.save_chat(chat_data)
+        self.assertEqual(response.status_code, 200)
+        answer.assert_called_once_with("What is RAG?", 'Generation')
+        self.assertEqual(response.json()['chat_data'][0]['text'], "Retrieval")
+        self.assertEqual(response.json()['similar_question'], "RAG?")
+        self.assertIn('buffer;dur=', response['Server-Timing'])
+        conversation = conversations.get_conversation(response.json()['conversation_id'])
+        self.assertEqual([message['text'] for message in conversation['pending']], ["What is RAG?", "Retrieval"])
+
+    def test_hit_is_served_from_the_cache(self):
+        chat_data = {'chat_data': [{'text': "What is RAG?", 'isBot': False}]}
+        cached = CacheDecision(0.9, {'answer': "Cached", 'highest_similar_question': ''}, None)
+        with mock.patch.object(async_views, 'lookup_cached_answer', return_value=cached), \
+                mock.patch.object(async_views, 'answer_question') as answer:
+            response = self.save_chat(chat_data)
+        answer.assert_not_called()
+        self.assertEqual(response.json()['chat_data'][0]['text'], "Cached")
+
+    def test_upstream_failure_is_a_bad_gateway(self):
+        chat_data = {'chat_data': [{'text': "What is RAG?", 'isBot': False}]}
+        with mock.patch.object(async_views, 'lookup_cached_answer', return_value=CacheDecision(0.1, None, None)), \
+                mock.patch.object(async_views, 'answer_question', side_effect=StageError("External API request error: down")):
+            response = self.save_chat(chat_data)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.json()['status'], "External API request error: down")
+
+    def test_body_must_be_a_json_object(self):
+        for body in ('not json', '[1, 2]', '"text"'):
+            with self.subTest(body=body):
+                self.assertEqual(self.save_chat(body).status_code, 400)
+
+
+class SearchChatsViewTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        self.solar = Chat.objects.create(preview="Solar panels")
+        self.solar.append_messages([
+            {'text': "How efficient are solar panels in orbit?", 'isBot': False},
+            {'text': "Solar panels in orbit convert about 30% of sunlight.", 'isBot': True},
+        ])
+        self.launch = Chat.objects.create(preview="Launch")
+        self.launch.append_messages([{'text': "When is the next launch window?", 'isBot': False}])
+
+    def search(self, **params):
+        return self.client.get('/search_chats/', params)
+
+    def test_keyword_search(self):
+        response = self.search(q="solar orbit")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['count'], 2)
+        self.assertEqual({hit['chat_id'] for hit in body['results']}, {self.solar.id})
+        self.assertIn('[', body['results'][0]['snippet'])
+        page = self.search(q="solar orbit", limit=1).json()
+        self.assertEqual(len(page['results']), 1)
+        self.assertIsNotNone(page['next'])
+
+    def test_keyword_query_syntax_is_not_interpreted(self):
+        response = self.search(q='launch" (window*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([hit['chat_id'] for hit in response.json()['results']], [self.launch.id])
+
+    def test_semantic_search(self):
+        axes = np.eye(16, dtype=np.float32)
+        vectors = {message.text: axes[i] for i, message in enumerate(Message.objects.order_by('id'))}
+        vectors["next launch"] = axes[2]
+        encode = mock.Mock(side_effect=lambda texts: np.stack([vectors[text] for text in texts]))
+        with mock.patch.dict(search.CHAT_SEARCH, {'SEMANTIC': True}), mock.patch.object(search, 'encode', encode), \
+                mock.patch.object(search, '_message_index', None):
+            search.index_messages(list(Message.objects.all()))
+            response = self.search(q="next launch", mode='semantic')
+        self.assertEqual(response.status_code, 200)
+        [hit] = response.json()['results']
+        self.assertEqual((hit['chat_id'], hit['text']), (self.launch.id, "When is the next launch window?"))
+
+    def test_rejects_bad_searches(self):
+        self.assertEqual(self.search(q=" ").status_code, 400)
+        self.assertEqual(self.search(q="solar", mode='fuzzy').status_code, 400)
+        with mock.patch.dict(search.CHAT_SEARCH, {'SEMANTIC': False}):
+            self.assertEqual(self.search(q="solar", mode='semantic').status_code, 400)
+
+
+class StreamChatViewTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        clear_l1()
+        patcher = mock.patch.dict(conversations.CONVERSATION_BUFFER, {'BACKGROUND': False, 'FLUSH_SIZE': 50})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def events(self, **patches):
+        with mock.patch.multiple(views, **patches):
+            response = self.client.post('/stream_chat/', {'chat_data': [{'text': "What is RAG?", 'isBot': False}]},
+                                        content_type='application/json')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            body = b''.join(response.streaming_content).decode()
+        events = []
+        for block in body.strip().split('\n\n'):
+            event, data = block.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+
+    def test_cache_hit(self):
+        hit = CacheDecision(0.9, {'answer': "Retrieval", 'highest_similar_question': "RAG?"}, 'd1')
+        events = self.events(lookup_cached_answer=mock.Mock(return_value=hit))
+        self.assertEqual([event for event, _ in events], ['cache', 'answer', 'similar_question', 'done'])
+        self.assertEqual(events[0][1], {'hit': True, 'score': 0.9, 'decision_id': 'd1'})
+        done = events[-1][1]
+        self.assertEqual(done['chat_data'][0]['text'], "Retrieval")
+        self.assertEqual([message['text'] for message in conversations.get_conversation(done['conversation_id'])['pending']],
+                         ["What is RAG?", "Retrieval"])
+
+    def test_miss_relays_a_streamed_answer(self):
+        streamed = mock.Mock(headers={'Content-Type': 'text/plain'}, encoding='utf-8')
+        streamed.iter_content.return_value = iter(["Retrie", "", "val"])
+        events = self.events(
+            lookup_cached_answer=mock.Mock(return_value=CacheDecision(0.1, None, None)),
+            optimize_query=mock.Mock(return_value="RAG"),
+            query_rag=mock.Mock(return_value=streamed),
+            ask_related=mock.Mock(return_value={'top_3_questions': [], 'highest_similar_question': "RAG?"}),
+            schedule_warm=mock.Mock(),
+        )
+        self.assertEqual([event for event, _ in events],
+                         ['cache', 'optimized_query', 'answer_chunk', 'answer_chunk', 'answer', 'similar_question', 'done'])
+        self.assertEqual(events[4][1], {'text': "Retrieval"})
+
+    def test_upstream_failure_ends_the_stream(self):
+        events = self.events(
+            lookup_cached_answer=mock.Mock(return_value=CacheDecision(0.1, None, None)),
+            optimize_query=mock.Mock(side_effect=requests.exceptions.ConnectionError("down")),
+        )
+        self.assertEqual([event for event, _ in events], ['cache', 'error'])
+
+
+class BatchChatViewTests(TestCase):
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        clear_l1()
+        semantic_cache._index = None
+        self.addCleanup(setattr, semantic_cache, '_index', None)
+        axes = np.eye(16, dtype=np.float32)
+        semantic_cache.insert_entries([("Cached?", {'answer': "From the cache"}, axes[0])])
+        vectors = {"Cached?": axes[0], "New?": axes[1], "new?": axes[1], "Boom?": axes[2]}
+        self.answered = []
+
+        def answer_question(question, option):
+            self.answered.append(question)
+            if question == "Boom?":
+                raise StageError("RAG API request error")
+            return {'answer': f"Answer to {question}", 'highest_similar_question': ''}
+
+        for patcher in (mock.patch.object(batch, 'encode', side_effect=lambda questions: np.stack([vectors[q] for q in questions])),
+                        mock.patch.object(batch, 'answer_question', side_effect=answer_question)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, body):
+        return self.client.post('/batch_chat/', body, content_type='application/json')
+
+    def test_results_in_question_order(self):
+        response = self.post({'questions': ["New?", "Cached?", "Boom?", "new?"], 'stream': False})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertEqual((results[1]['cached'], results[1]['answer']), (True, "From the cache"))
+        self.assertEqual((results[0]['cached'], results[0]['answer']), (False, "Answer to New?"))
+        self.assertEqual(results[2]['error'], "RAG API request error")
+        # Questions that only differ in case share one pipeline
+        self.assertEqual(results[3]['answer'], "Answer to New?")
+        self.assertEqual(sorted(self.answered), ["Boom?", "New?"])
+
+    def test_streams_ndjson(self):
+        response = self.post({'questions': ["New?", "Cached?"], 'stream': True})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        results = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        # Cache hits come first
+        self.assertEqual([result['index'] for result in results], [1, 0])
+
+    def test_rejects_invalid_batches(self):
+        for body in ({}, {'questions': "New?"}, {'questions': ["New?", " "]}, {'questions': ["New?"], 'option': 'mapping'}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        with mock.patch.dict(batch.CHAT_BATCH, {'MAX_QUESTIONS': 1}):
+            self.assertEqual(self.post({'questions': ["New?", "Cached?"]}).status_code, 400)
+        self.assertEqual(self.answered, [])
+
+
+class CalibrationTests(SimpleTestCase):
+
+    def decisions(self, count, score, served=True, helpful=None, option='Generation'):
+        records = []
+        for _ in range(count):
+            decision_id = uuid.uuid4().hex
+            records.append({'type': 'lookup', 'id': decision_id, 'option': option, 'score': score, 'served': served})
+            if helpful is not None:
+                records.append({'type': 'feedback', 'id': decision_id, 'helpful': helpful})
+        return records
+
+    def test_recommends_the_lowest_accurate_threshold(self):
+        records = (self.decisions(30, 0.95, helpful=True) + self.decisions(10, 0.87, helpful=False)
+                   + self.decisions(10, 0.5, served=False))
+        report = feedback.calibrate(records, [0.8, 0.85, 0.9])['Generation']
+        self.assertEqual(report['lookups'], 50)
+        self.assertEqual(report['recommended'], 0.9)
+        low, _, high = report['rows']
+        self.assertEqual((low['labels'], low['error_rate'], low['hit_rate']), (40, 0.25, 0.8))
+        self.assertEqual((high['labels'], high['error_rate'], high['hit_rate']), (30, 0.0, 0.6))
+
+    def test_threshold_far_below_every_rated_score_is_not_recommended(self):
+        report = feedback.calibrate(self.decisions(25, 0.95, helpful=True), [0.7, 0.9])['Generation']
+        self.assertEqual(report['rows'][0]['lowest_rated'], 0.95)
+        self.assertEqual(report['recommended'], 0.9)
+
+    def test_too_few_labels(self):
+        report = feedback.calibrate(self.decisions(5, 0.95, helpful=True), [0.9])['Generation']
+        self.assertIsNone(report['recommended'])
+
+    def test_latest_rating_wins_and_modes_are_separate(self):
+        records = self.decisions(1, 0.95, helpful=False)
+        records.append({**records[-1], 'helpful': True})
+        records += self.decisions(1, 0.95, helpful=False, option='Summarization')
+        report = feedback.calibrate(records, [0.9], min_labels=1)
+        self.assertEqual(report['Generation']['rows'][0]['error_rate'], 0.0)
+        self.assertEqual(report['Summarization']['rows'][0]['error_rate'], 1.0)
+
+
+class CacheFeedbackViewTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = feedback.DecisionLog(os.path.join(directory.name, 'decisions.log'))
+        patcher = mock.patch.object(feedback, 'decision_log', self.log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_records_feedback(self):
+        response = self.client.post('/cache_feedback/', {'decision_id': 'abc', 'helpful': False}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        [record] = self.log.read()
+        self.assertEqual((record['type'], record['id'], record['helpful']), ('feedback', 'abc', False))
+
+    def test_rejects_bad_feedback(self):
+        response = self.client.post('/cache_feedback/', {'decision_id': 'abc', 'helpful': 'yes'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        with mock.patch.object(feedback, 'decision_log', None):
+            response = self.client.post('/cache_feedback/', {'decision_id': 'abc', 'helpful': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(self.log.read()), [])
+
+
+class BenchmarkSmokeTests(SimpleTestCase):
+    # Each benchmark runs in a subprocess against the scratch databases of benchmarks/bench_settings.py
+
+    def run_benchmark(self, script, *args):
+        env = {key: value for key, value in os.environ.items() if key not in ('DJANGO_SETTINGS_MODULE', 'REDIS_URL')}
+        result = subprocess.run(
+            [sys.executable, os.path.join('benchmarks', script), *args],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=600,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        return result.stdout
+
+    def rows(self, output, first_column):
+        return [line.split() for line in output.splitlines() if line.split()[:1] and line.split()[0] in first_column]
+
+    def test_chat_pipeline(self):
+        output = self.run_benchmark('chat_pipeline.py', '--sizes', '50', '--requests', '20', '--concurrency', '4',
+                                    '--chats', '10', '--messages', '4', '--latency', '0')
+        rows = self.rows(output, {'save_chat_to_cache', 'list_chats', 'fetch_chat_from_db'})
+        self.assertEqual(len(rows), 3, output)
+        for row in rows:
+            self.assertEqual(row[6], '0', f"errors in {row[0]}:\n{output}")
+
+    def test_concurrent_writes(self):
+        output = self.run_benchmark('concurrent_writes.py', '--processes', '2', '--threads', '2', '--turns', '10')
+        rows = self.rows(output, {'rollback', 'wal', 'wal-split'})
+        self.assertEqual(len(rows), 3, output)
+        for row in rows:
+            # failed counts of the three steps, then dropped cache writes
+            self.assertEqual([row[4], row[7], row[10], row[11]], ['0', '0', '0', '0'], f"{row[0]}:\n{output}")
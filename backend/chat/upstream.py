@@ -0,0 +1,272 @@
+import bisect
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+UPSTREAM_DEFAULTS = {
+    'CONNECT_TIMEOUT': 3,
+    'READ_TIMEOUT': 30,
+    'RETRIES': 2,
+    'BACKOFF': 0.2,
+    'POOL_SIZE': 10,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 30,
+}
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open.
+
+    It subclasses ConnectionError so callers that handle RequestException treat a short-circuited
+    call like any other failed request.
+    """
+
+
+class CircuitBreaker:
+    """
+    A consecutive-failure circuit breaker.
+
+    After failure_threshold consecutive failures the circuit opens and calls are rejected
+    immediately. Once reset_timeout seconds have passed a single trial call is let through;
+    its success closes the circuit and its failure opens it again. A trial that has not
+    reported back within another reset_timeout is given up on and the next call is let through
+    as a new trial, so a lost outcome cannot keep the circuit half open.
+
+    Methods:
+    allow(self): Returns whether a call may be made now.
+    record_success(self): Records a successful call.
+    record_failure(self): Records a failed call.
+    release(self): Ends a call that finished without an outcome, e.g. because it was cancelled.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_at = now
+                return True
+            if self.state == self.HALF_OPEN and now - self._trial_at >= self.reset_timeout:
+                self._trial_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        with self._lock:
+            # A trial without an outcome hands over to the next call straight away
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+
+class LatencyHistogram:
+    """
+    A fixed-bucket histogram of call latencies.
+
+    Methods:
+    observe(self, seconds): Records one call duration.
+    snapshot(self): Returns the bucket counts, total count and sum, and estimated percentiles.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        milliseconds = seconds * 1000
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, milliseconds)] += 1
+            self.count += 1
+            self.sum += milliseconds
+
+    def percentile(self, fraction):
+        """
+        Estimates a percentile as the upper bound of the bucket that contains it.
+
+        Args:
+        fraction (float): The percentile as a fraction, e.g. 0.95.
+
+        Returns:
+        float: The estimated latency in milliseconds, or None if nothing has been observed.
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            target = fraction * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+                seen += count
+                if seen >= target:
+                    return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            buckets = dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts))
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'sum_ms': total,
+            'mean_ms': total / count if count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets_ms': buckets,
+        }
+
+
+class UpstreamClient:
+    """
+    A pooled, keep-alive HTTP client for one upstream service.
+
+    Connections are reused through a requests.Session whose adapter keeps up to pool_size
+    connections to the host. Calls get connect/read timeouts, retries with exponential
+    backoff on connection errors and 502/503/504 responses (never on read timeouts), and a
+    circuit breaker so a failing upstream is skipped instead of tying up worker threads on
+    timeouts.
+
+    Attributes:
+    name (str): The name of the upstream, used in error messages and stats.
+    base_url (str): The scheme, host and port of the upstream.
+    breaker (CircuitBreaker): The circuit breaker guarding calls.
+    latency (LatencyHistogram): The latency of completed calls, retries included.
+
+    Methods:
+    post(self, path, **kwargs): Sends a POST request to a path on the upstream.
+    stats(self): Returns the breaker state and latency histogram.
+    """
+
+    def __init__(self, name, base_url, connect_timeout=3, read_timeout=30, retries=2, backoff=0.2,
+                 pool_size=10, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyHistogram()
+
+        retry = Retry(
+            total=retries,
+            # A read timeout or dropped response is not retried: the upstream may still be
+            # working on the request, and each retry would hold the worker for another
+            # read_timeout before the breaker sees a single failure.
+            read=0,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            # The upstream endpoints are read-only queries, so POSTs are safe to retry.
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, path, **kwargs):
+        """
+        Sends a POST request to a path on the upstream.
+
+        Args:
+        path (str): The path of the endpoint, e.g. '/api/query'.
+        **kwargs: Passed to requests.Session.post; timeout defaults to the client's timeouts.
+
+        Returns:
+        requests.Response: The response. Callers are expected to call raise_for_status().
+
+        Raises:
+        CircuitOpenError: If the circuit breaker is open.
+        requests.exceptions.RequestException: If the request fails.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for upstream '{self.name}'")
+
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.post(f'{self.base_url}{path}', **kwargs)
+            failed = response.status_code >= 500
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+            # Every call reports back, whatever it raised, or a trial would keep the circuit half open
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return response
+
+    def stats(self):
+        return {
+            'url': self.base_url,
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'latency': self.latency.snapshot(),
+        }
+
+
+def _build_upstreams():
+    clients = {}
+    for name, config in getattr(settings, 'UPSTREAMS', {}).items():
+        config = {**UPSTREAM_DEFAULTS, **config}
+        clients[name] = UpstreamClient(
+            name,
+            config['URL'],
+            connect_timeout=config['CONNECT_TIMEOUT'],
+            read_timeout=config['READ_TIMEOUT'],
+            retries=config['RETRIES'],
+            backoff=config['BACKOFF'],
+            pool_size=config['POOL_SIZE'],
+            failure_threshold=config['FAILURE_THRESHOLD'],
+            reset_timeout=config['RESET_TIMEOUT'],
+        )
+    return clients
+
+
+upstreams = _build_upstreams()
+
+
+def upstream_stats():
+    """
+    Return the circuit state and latency histogram of every upstream client in this process.
+
+    Returns:
+    dict: A mapping of upstream name to its stats.
+    """
+    return {name: client.stats() for name, client in upstreams.items()}
@@ -0,0 +1,331 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+
+# Queries scored together by ExactIndex.search_many
+QUERY_CHUNK = 64
+
+
+class VectorIndex:
+    """
+    Base class for the nearest-neighbour indexes behind the semantic cache.
+
+    Vectors are expected to be L2-normalized, so the inner product is the cosine similarity.
+    Each vector is stored under a caller-supplied key; subclasses decide how candidates are found.
+    The row of a removed vector is reused by the next one added, so the index never holds
+    more rows than the most vectors it has held at once.
+
+    Methods:
+    add(self, key, vector): Inserts a vector under the given key.
+    remove(self, key): Deletes the vector stored under the given key.
+    search(self, vector, k): Returns up to k (score, key) tuples sorted by descending similarity.
+    search_many(self, vectors, k): Runs search for each row of a matrix of query vectors.
+    keys(self): Returns the keys of all stored vectors.
+    """
+
+    def __init__(self):
+        self._vectors = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._keys = []
+        self._nodes = {}
+        self._free = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    def keys(self):
+        with self._lock:
+            return list(self._nodes)
+
+    def add(self, key, vector):
+        """
+        Inserts a vector under the given key, replacing any vector already stored under it.
+
+        Args:
+        key (hashable): The identifier returned by search for this vector.
+        vector (ndarray): The L2-normalized vector.
+
+        Returns:
+        None
+        """
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if key in self._nodes:
+                self._remove(key)
+            node = self._append(key, vector)
+            self._insert(node, vector)
+
+    def remove(self, key):
+        """
+        Deletes the vector stored under the given key. Unknown keys are ignored.
+
+        Args:
+        key (hashable): The identifier of the vector to delete.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            if key in self._nodes:
+                self._remove(key)
+
+    def search(self, vector, k=1):
+        """
+        Returns the approximate k nearest neighbours of a query vector.
+
+        Args:
+        vector (ndarray): The L2-normalized query vector.
+        k (int): The number of results to return.
+
+        Returns:
+        list: (score, key) tuples sorted by descending similarity.
+        """
+        if not self._nodes:
+            return []
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        return [(score, self._keys[node]) for score, node in self._search(vector, k)]
+
+    def search_many(self, vectors, k=1):
+        """
+        Returns the approximate k nearest neighbours of each of several query vectors.
+
+        Args:
+        vectors (ndarray): An (n, dim) array of L2-normalized query vectors.
+        k (int): The number of results to return per query.
+
+        Returns:
+        list: One list of (score, key) tuples per query, as returned by search.
+        """
+        return [self.search(vector, k) for vector in vectors]
+
+    def _append(self, key, vector):
+        if self._free:
+            node = self._free.pop()
+            self._keys[node] = key
+        else:
+            node = len(self._keys)
+            if self._vectors is None:
+                self._vectors = np.zeros((16, vector.shape[0]), dtype=np.float32)
+                self._alive = np.zeros(16, dtype=bool)
+            elif node == len(self._vectors):
+                self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+                self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+            self._keys.append(key)
+        self._vectors[node] = vector
+        self._alive[node] = True
+        self._nodes[key] = node
+        return node
+
+    def _remove(self, key):
+        node = self._nodes.pop(key)
+        self._alive[node] = False
+        self._keys[node] = None
+        self._delete(node)
+        self._free.append(node)
+
+    def _top_k(self, nodes, scores, k):
+        # Select the k best alive nodes from parallel arrays of node ids and scores.
+        scores = np.where(self._alive[nodes], scores, -np.inf)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(nodes[i])) for i in top if scores[i] != -np.inf]
+
+    def _insert(self, node, vector):
+        pass
+
+    def _delete(self, node):
+        pass
+
+    def _search(self, vector, k):
+        raise NotImplementedError
+
+
+class ExactIndex(VectorIndex):
+    """
+    Brute-force exact search: a single matrix-vector product over every stored vector.
+    """
+
+    def _search(self, vector, k):
+        count = len(self._keys)
+        scores = self._vectors[:count] @ vector
+        return self._top_k(np.arange(count), scores, k)
+
+    def search_many(self, vectors, k=1):
+        # Score QUERY_CHUNK queries per matrix-matrix product instead of one product per
+        # query; a chunk's score matrix is entries x QUERY_CHUNK, not entries x queries.
+        if not self._nodes:
+            return [[] for _ in vectors]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        count = len(self._keys)
+        nodes = np.arange(count)
+        results = []
+        for start in range(0, len(vectors), QUERY_CHUNK):
+            scores = self._vectors[:count] @ vectors[start:start + QUERY_CHUNK].T
+            results.extend(
+                [(score, self._keys[node]) for score, node in self._top_k(nodes, scores[:, column], k)]
+                for column in range(scores.shape[1])
+            )
+        return results
+
+
+class StoreIndex(VectorIndex):
+    """
+    Exact search over the rows of a shared EmbeddingStore (see chat.embedding_store).
+
+    Vectors are never copied into the process: the store's memory map is searched directly
+    and the index only tracks which keys it holds. Vectors passed to add() are ignored, so
+    they must already be in the store.
+    """
+
+    # Extra results fetched from the store, to make up for rows of keys this index lacks
+    SLACK = 8
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def add(self, key, vector):
+        with self._lock:
+            self._nodes[key] = None
+
+    def remove(self, key):
+        with self._lock:
+            self._nodes.pop(key, None)
+
+    def search(self, vector, k=1):
+        if not self._nodes:
+            return []
+        return self._filter(self.store.search(vector, k + self.SLACK), k)
+
+    def search_many(self, vectors, k=1):
+        if not self._nodes:
+            return [[] for _ in vectors]
+        return [self._filter(results, k) for results in self.store.search_many(vectors, k + self.SLACK)]
+
+    def _filter(self, results, k):
+        return [(score, key) for score, key in results if key in self._nodes][:k]
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file index: vectors are bucketed by their nearest k-means centroid and a query
+    only scans the nprobe buckets whose centroids are closest to it.
+
+    Until train_size vectors have been added the index answers queries exactly; it then
+    trains its centroids once and assigns new vectors to buckets as they arrive.
+
+    Args:
+    nlist (int): The number of buckets.
+    nprobe (int): The number of buckets scanned per query.
+    train_size (int, optional): The number of vectors to collect before training. Defaults to 32 * nlist.
+    iterations (int): The number of k-means iterations used for training.
+    """
+
+    def __init__(self, nlist=256, nprobe=8, train_size=None, iterations=10, seed=0):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size or 32 * nlist
+        self.iterations = iterations
+        self.seed = seed
+        self._centroids = None
+        self._lists = []
+        self._list_arrays = []
+        self._assignment = {}
+
+    def _insert(self, node, vector):
+        if self._centroids is not None:
+            self._assign(node, int(np.argmax(self._centroids @ vector)))
+        elif len(self._nodes) >= self.train_size:
+            self._train()
+
+    def _delete(self, node):
+        bucket = self._assignment.pop(node, None)
+        if bucket is not None:
+            self._lists[bucket].remove(node)
+            self._list_arrays[bucket] = None
+
+    def _assign(self, node, bucket):
+        self._lists[bucket].append(node)
+        self._list_arrays[bucket] = None
+        self._assignment[node] = bucket
+
+    def _train(self):
+        nodes = np.fromiter(self._nodes.values(), dtype=np.int64)
+        rng = np.random.default_rng(self.seed)
+        self.nlist = min(self.nlist, len(nodes))
+        sample = rng.choice(nodes, size=min(len(nodes), 64 * self.nlist), replace=False)
+        data = self._vectors[sample]
+        centroids = data[rng.choice(len(data), size=self.nlist, replace=False)]
+        for _ in range(self.iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for bucket in range(self.nlist):
+                members = data[labels == bucket]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[bucket] = centroid / (np.linalg.norm(centroid) or 1)
+
+        self._centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self._lists = [[] for _ in range(self.nlist)]
+        self._list_arrays = [None] * self.nlist
+        labels = np.argmax(self._vectors[nodes] @ self._centroids.T, axis=1)
+        for node, bucket in zip(nodes.tolist(), labels.tolist()):
+            self._assign(node, bucket)
+
+    def _bucket_array(self, bucket):
+        array = self._list_arrays[bucket]
+        if array is None:
+            array = np.array(self._lists[bucket], dtype=np.int64)
+            self._list_arrays[bucket] = array
+        return array
+
+    def _search(self, vector, k):
+        if self._centroids is None:
+            count = len(self._keys)
+            return self._top_k(np.arange(count), self._vectors[:count] @ vector, k)
+
+        nprobe = min(self.nprobe, self.nlist)
+        buckets = np.argpartition(-(self._centroids @ vector), nprobe - 1)[:nprobe]
+        nodes = np.concatenate([self._bucket_array(bucket) for bucket in buckets])
+        if not len(nodes):
+            return []
+        return self._top_k(nodes, self._vectors[nodes] @ vector, k)
+
+
+INDEX_BACKENDS = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+}
+
+
+def build_vector_index(backend=None, options=None):
+    """
+    Create an empty vector index of the configured type.
+
+    The backend and its options default to settings.SEMANTIC_CACHE['INDEX'] and
+    settings.SEMANTIC_CACHE['OPTIONS'].
+
+    Parameters:
+    backend (str, optional): One of 'exact' or 'ivf'.
+    options (dict, optional): Keyword arguments passed to the index class.
+
+    Returns:
+    VectorIndex: A new, empty index.
+    """
+    config = getattr(settings, 'SEMANTIC_CACHE', {})
+    backend = backend or config.get('INDEX', 'exact')
+    if options is None:
+        options = config.get('OPTIONS', {})
+    try:
+        index_class = INDEX_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown semantic cache index '{backend}', expected one of {sorted(INDEX_BACKENDS)}")
+    return index_class(**options)
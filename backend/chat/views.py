@@ -1,34 +1,48 @@
+import json
 import uuid
 import requests
-from rest_framework.decorators import api_view
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
-from django.core.cache import caches
-from .models import Chat
-from .serializers import ChatSerializer
-from sentence_transformers import SentenceTransformer, util
-
-# Use the default cache
-default_cache = caches['default']
-question_cache = caches['question']
-
-# Initialize SentenceTransformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from .batch import CHAT_BATCH, answer_batch
+from .cache_backends import cache_stats
+from .embeddings import embedding_cache
+from .conversations import buffer_messages, flush_conversations, get_conversation, new_conversation_id
+from .metrics import render_prometheus, stage
+from .models import Chat, Message
+from .pagination import ChatCursorPagination, MessageCursorPagination, SearchPagination
+from .serializers import ChatSerializer, ChatSummarySerializer
+from .feedback import record_feedback
+from .pipeline import StageError, answer_question, ask_related, lookup_cached_answer, optimize_query, query_rag
+from .prefetch import schedule_warm
+from .renderers import EventStreamRenderer, NDJSONRenderer
+from .search import CHAT_SEARCH, KeywordResults, semantic_search
+from .upstream import upstream_stats
 
 @api_view(['GET'])
 def list_chats(request):
     """
-    Retrieve and return a list of all chats in the database, sorted by creation date in descending order.
+    Retrieve one page of chat summaries, sorted by creation date in descending order.
+
+    Only the id, creation date and preview of each chat are loaded; the messages are
+    fetched per chat with fetch_chat_from_db.
 
     Parameters:
-    request (Request): The incoming request object containing any query parameters or data.
+    request (Request): The incoming request object. Accepts the `cursor` returned in a
+        previous page's `next` link and an optional `limit` (page size, at most 200).
 
     Returns:
-    Response: A response object containing the serialized data of all chats. The HTTP status code is set to 200 OK.
+    Response: A response object with "results" (the chat summaries) and "next"/"previous"
+        page links. The HTTP status code is set to 200 OK.
     """
-    chats = Chat.objects.all().order_by('-created_at')
-    serializer = ChatSerializer(chats, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    chats = Chat.objects.only('id', 'created_at', 'preview')
+    paginator = ChatCursorPagination()
+    page = paginator.paginate_queryset(chats, request)
+    serializer = ChatSummarySerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['POST'])
 def save_chat(request):
@@ -58,12 +72,15 @@ def save_chat_to_cache(request):
     Parameters:
     - chat_data (dict): A JSON object containing the chat data.
     - option (str, optional): An optional parameter specifying the mode for processing the chat data. Defaults to 'Generation'.
+    - conversation_id (str, optional): The conversation the message belongs to, as returned by a previous call. A new conversation is started if omitted.
+    - chat_id (int, optional): The saved chat a new conversation continues.
 
     Returns:
-    - Response: A Django REST Framework response object containing the chat data and a similar question if available.
+    - Response: A Django REST Framework response object containing the chat data, the conversation ID, a similar question if available and the ID of the cache decision to rate with cache_feedback.
     """
     chat_data = request.data.get('chat_data')
     option = request.data.get('option', 'Generation')
+    conversation_id = request.data.get('conversation_id') or new_conversation_id()
 
     if not chat_data:
         return Response({"status": "No chat data provided"}, status=status.HTTP_400_BAD_REQUEST)
@@ -74,89 +91,30 @@ def save_chat_to_cache(request):
 
     user_input = chat_data[-1].get('text')
     if option == 'mapping':
-        api_url = "http://127.0.0.1:5000/api/query"
         try:
-            response = requests.post(api_url, json={"query": user_input, "mode": option})
-            response.raise_for_status()
-            response_data = response.json()
+            response_data = query_rag(user_input, option).json()
             return Response({"status": "Chat saved to cache", "response_data": response_data}, status=status.HTTP_200_OK)
         except requests.exceptions.RequestException as e:
             return Response({"status": f"External API request error: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
 
     try:
-        # Retrieve cached questions from the cache
-        cached_questions = question_cache.get('cached_questions', [])
-        matched_question_data = None
-        
-        # Convert user input to vector
-        user_input_vector = model.encode(user_input, convert_to_tensor=True)
-        threshold = 0.5
-        best_match_score = 0
-        
-        # Check if the user_input matches any question in the cached_questions list
-        for cached_question in cached_questions:
-            cached_question_vector = model.encode(cached_question['question'], convert_to_tensor=True)
-            similarity = util.pytorch_cos_sim(user_input_vector, cached_question_vector).item()
-            if similarity > threshold and similarity > best_match_score:
-                matched_question_data = cached_question['data']
-                best_match_score = similarity
+        # Find the closest cached question; cached embeddings are never re-encoded
+        best_match_score, matched_question_data, decision_id = lookup_cached_answer(user_input, option=option)
 
         if matched_question_data:
             # Retrieve response from the cache
-            print(matched_question_data)
             bot_response = matched_question_data.get('answer', 'No response from cached data')
             similar_question = matched_question_data.get('highest_similar_question', '')
         else:
-            # Process query and get response from external APIs
-            query_optimization_url = "http://127.0.0.1:5050/process_query"
+            # Process query and get response from external APIs; concurrent requests for
+            # the same question share one set of upstream calls
             try:
-                response = requests.post(query_optimization_url, json={"query": user_input})
-                response.raise_for_status()
-                query_response_data = response.json()
-                optimized_query = query_response_data.get('optimized_query', user_input)
-            except requests.exceptions.RequestException as e:
-                return Response({"status": f"Query optimization API request error: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+                answer_data = answer_question(user_input, option)
+            except StageError as e:
+                return Response({"status": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
 
-            external_api_url = "http://127.0.0.1:5000/api/query"
-            try:
-                response = requests.post(external_api_url, json={"query": optimized_query, "mode": option})
-                response.raise_for_status()
-                response_data = response.json()
-                bot_response = response_data.get('answer', 'No response from second API')
-            except requests.exceptions.RequestException as e:
-                return Response({"status": f"External API request error: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
-
-            send_data_api_url = "http://127.0.0.1:5060/ask"
-            try:
-                send_data_response = requests.post(send_data_api_url, json={"chat_data": optimized_query})
-                send_data_response.raise_for_status()
-                api_response_data = send_data_response.json()
-            except requests.exceptions.RequestException as e:
-                return Response({"status": f"Send data API request error: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
-
-            # Send each question in top_3_questions to external_api_url and save responses
-            top_3_questions = api_response_data.get('top_3_questions', [])
-            for question in top_3_questions:
-                if question:
-                    try:
-                        response = requests.post(external_api_url, json={"query": question, "mode": "generation"})
-                        response.raise_for_status()
-                        question_response_data = response.json()
-                        # Save each question and its response
-                        cached_questions.append({
-                            'question': question,
-                            'data': question_response_data
-                        })
-                    except requests.exceptions.RequestException as e:
-                        return Response({"status": f"Question API request error: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
-
-            # Cache the new response with all questions and their responses
-            question_cache.set('cached_questions', cached_questions)
-
-            similar_question = api_response_data.get('highest_similar_question', '')
-
-        # Handle question cache
-        question_cache.delete('current_chat')
+            bot_response = answer_data['answer']
+            similar_question = answer_data['highest_similar_question']
 
         # Append bot response to chat_data
         bot_message_id = str(uuid.uuid4())
@@ -169,60 +127,322 @@ def save_chat_to_cache(request):
     except Exception as e:
         return Response({"status": f"Unexpected error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    # Save the last response to cache
+    # Buffer the user message and the response in the conversation's cache entry
     last_response = chat_data[-1]  # Assuming the last response is the bot's message
-    default_cache.set('current_chat', [last_response])
+    with stage('buffer'):
+        buffer_messages(conversation_id, chat_data[-2:], request.data.get('chat_id'))
+
+    return Response({"status": "Chat saved to cache", "chat_data": [last_response], "conversation_id": conversation_id, "similar_question": similar_question, "decision_id": decision_id}, status=status.HTTP_200_OK)
 
-    return Response({"status": "Chat saved to cache", "chat_data": [last_response], "similar_question": similar_question}, status=status.HTTP_200_OK)
+def _sse(event, data):
+    # Format one Server-Sent Event.
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _chat_events(user_message, option, conversation_id, chat_id=None):
+    """
+    Run the chat pipeline and yield each stage as a Server-Sent Event as soon as it completes.
+
+    Events, in order: 'cache' (hit and best score), 'optimized_query' (misses only),
+    'answer_chunk' (only if the RAG API streams its answer), 'answer', 'similar_question'
+    and finally 'done' with the same payload save_chat_to_cache returns. A failure yields
+    a single 'error' event and ends the stream.
+    """
+    user_input = user_message.get('text')
+    try:
+        if option == 'mapping':
+            response_data = query_rag(user_input, option).json()
+            yield _sse('done', {"status": "Chat saved to cache", "response_data": response_data})
+            return
+
+        best_match_score, matched_question_data, decision_id = lookup_cached_answer(user_input, option=option)
+        yield _sse('cache', {"hit": matched_question_data is not None, "score": best_match_score, "decision_id": decision_id})
+
+        if matched_question_data:
+            bot_response = matched_question_data.get('answer', 'No response from cached data')
+            yield _sse('answer', {"text": bot_response})
+            similar_question = matched_question_data.get('highest_similar_question', '')
+        else:
+            try:
+                optimized_query = optimize_query(user_input)
+            except requests.exceptions.RequestException as e:
+                yield _sse('error', {"status": f"Query optimization API request error: {str(e)}"})
+                return
+            yield _sse('optimized_query', {"optimized_query": optimized_query})
+
+            try:
+                response = query_rag(optimized_query, option, stream=True)
+                if response.headers.get('Content-Type', '').startswith('application/json'):
+                    bot_response = response.json().get('answer', 'No response from second API')
+                else:
+                    # Relay a streamed answer chunk by chunk
+                    response.encoding = response.encoding or 'utf-8'
+                    chunks = []
+                    for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                        if chunk:
+                            chunks.append(chunk)
+                            yield _sse('answer_chunk', {"text": chunk})
+                    bot_response = ''.join(chunks)
+            except requests.exceptions.RequestException as e:
+                yield _sse('error', {"status": f"External API request error: {str(e)}"})
+                return
+            yield _sse('answer', {"text": bot_response})
+
+            try:
+                api_response_data = ask_related(optimized_query)
+            except requests.exceptions.RequestException as e:
+                yield _sse('error', {"status": f"Send data API request error: {str(e)}"})
+                return
+            schedule_warm(api_response_data.get('top_3_questions', []))
+            similar_question = api_response_data.get('highest_similar_question', '')
+
+        yield _sse('similar_question', {"similar_question": similar_question})
+
+        last_response = {"id": str(uuid.uuid4()), "text": bot_response, "isBot": True}
+        buffer_messages(conversation_id, [user_message, last_response], chat_id)
+        yield _sse('done', {"status": "Chat saved to cache", "chat_data": [last_response], "conversation_id": conversation_id, "similar_question": similar_question, "decision_id": decision_id})
+    except Exception as e:
+        yield _sse('error', {"status": f"Unexpected error: {str(e)}"})
 
 @api_view(['POST'])
-def save_cache_to_db(request):
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def stream_chat(request):
     """
-    Save the chat data from cache to the database.
+    Streaming version of save_chat_to_cache.
+
+    The pipeline stages are sent as Server-Sent Events as they complete, so a cache hit is shown immediately and a miss shows its answer before the related questions have been fetched. See _chat_events for the event types.
 
     Parameters:
-    - request (Request): The incoming request object containing the chat data and an optional parameter 'chat_id'.
     - chat_data (dict): A JSON object containing the chat data.
-    - chat_id (int, optional): An optional parameter specifying the ID of the chat to be saved. Defaults to None.
+    - option (str, optional): An optional parameter specifying the mode for processing the chat data. Defaults to 'Generation'.
+    - conversation_id (str, optional): The conversation the message belongs to. A new conversation is started if omitted.
+    - chat_id (int, optional): The saved chat a new conversation continues.
 
     Returns:
-    - Response: A Django REST Framework response object containing the chat data and a status message.
+    - StreamingHttpResponse: A text/event-stream response, or a 400 BAD REQUEST response if no chat data is provided.
     """
-    chat_data = default_cache.get('current_chat')
-    chat_id = request.data.get('chat_id')
+    chat_data = request.data.get('chat_data')
+    option = request.data.get('option', 'Generation')
+    conversation_id = request.data.get('conversation_id') or new_conversation_id()
 
     if not chat_data:
-        return Response({"status": "No chat found in cache"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"status": "No chat data provided"}, status=status.HTTP_400_BAD_REQUEST)
 
+    user_message = {**chat_data[-1], "id": str(uuid.uuid4())}
+    events = _chat_events(user_message, option, conversation_id, request.data.get('chat_id'))
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _ndjson(results):
+    # Format results as newline-delimited JSON; a failure ends the stream with a status line.
     try:
-        if chat_id:
-            chat = Chat.objects.get(id=chat_id)
-            chat.input_response_pairs = [chat_data[-1]]  # Only save the latest response
-            chat.save()
-        else:
-            chat = Chat.objects.create(input_response_pairs=[chat_data[-1]])
-            chat_id = chat.id
+        for result in results:
+            yield json.dumps(result) + "\n"
+    except Exception as e:
+        yield json.dumps({"status": f"Unexpected error: {str(e)}"}) + "\n"
+
+@api_view(['POST'])
+@renderer_classes([JSONRenderer, NDJSONRenderer])
+def batch_chat(request):
+    """
+    Answer a list of questions in one request.
+
+    The questions are encoded in one batch and looked up in the semantic cache together; the misses are sent to the upstream services with bounded concurrency (CHAT_BATCH['WORKERS']). See batch.answer_batch. The questions are not added to any conversation.
+
+    Parameters:
+    - questions (list): The questions, as strings; at most CHAT_BATCH['MAX_QUESTIONS'] of them.
+    - option (str, optional): The answer mode. Defaults to 'Generation'; 'mapping' is not supported.
+    - stream (bool, optional): Stream the results as newline-delimited JSON as they complete. Defaults to true for batches of CHAT_BATCH['STREAM_MIN_QUESTIONS'] questions or more.
+
+    Returns:
+    - Response: A response object with "results", one per question in the order given, each with its "index" and either "answer", "similar_question", "cached" and "score" or an "error". When streamed, an application/x-ndjson response with one result per line in completion order. 400 BAD REQUEST if the questions are missing or invalid.
+    """
+    questions = request.data.get('questions')
+    option = request.data.get('option', 'Generation')
+
+    if not questions or not isinstance(questions, list) or not all(isinstance(question, str) and question.strip() for question in questions):
+        return Response({"status": "Provide questions as a list of non-empty strings"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(questions) > CHAT_BATCH['MAX_QUESTIONS']:
+        return Response({"status": f"At most {CHAT_BATCH['MAX_QUESTIONS']} questions per batch"}, status=status.HTTP_400_BAD_REQUEST)
+    if option == 'mapping':
+        return Response({"status": "The mapping option is not supported in batches"}, status=status.HTTP_400_BAD_REQUEST)
+
+    stream = request.data.get('stream', len(questions) >= CHAT_BATCH['STREAM_MIN_QUESTIONS'])
+    results = answer_batch(questions, option)
+    if stream:
+        response = StreamingHttpResponse(_ndjson(results), content_type='application/x-ndjson')
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    try:
+        ordered = sorted(results, key=lambda result: result['index'])
+    except Exception as e:
+        return Response({"status": f"Unexpected error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({"status": "Batch answered", "results": ordered}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+def save_cache_to_db(request):
+    """
+    Save the buffered messages of a conversation to the database now.
+
+    Parameters:
+    - request (Request): The incoming request object containing the conversation ID and an optional parameter 'chat_id'.
+    - conversation_id (str): The conversation returned by save_chat_to_cache.
+    - chat_id (int, optional): An optional parameter specifying the ID of the chat to be saved. Defaults to None.
+
+    Returns:
+    - Response: A Django REST Framework response object containing the chat ID and a status message.
+    """
+    conversation_id = request.data.get('conversation_id')
+    chat_id = request.data.get('chat_id')
 
-        default_cache.delete('current_chat')
-        return Response({"status": "Chat saved to DB", "chat_id": chat_id}, status=status.HTTP_200_OK)
-    except Chat.DoesNotExist:
+    if not conversation_id or get_conversation(conversation_id) is None:
+        return Response({"status": "No chat found in cache"}, status=status.HTTP_400_BAD_REQUEST)
+    if chat_id and not Chat.objects.filter(id=chat_id).exists():
         return Response({"error": "Chat not found"}, status=status.HTTP_404_NOT_FOUND)
 
+    if chat_id:
+        buffer_messages(conversation_id, [], chat_id)
+    flush_conversations([conversation_id])
+    chat_id = get_conversation(conversation_id)['chat_id']
+    return Response({"status": "Chat saved to DB", "chat_id": chat_id}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+def flush_cache_to_db(request):
+    """
+    Save the buffered messages of all conversations, or of the given ones, to the database in one batch.
+
+    Conversations are otherwise flushed in the background, see CONVERSATION_BUFFER in settings.
+
+    Parameters:
+    - conversation_ids (list, optional): Only flush these conversations. Defaults to all with unsaved messages.
+
+    Returns:
+    - Response: A response object mapping each flushed conversation ID to its chat ID.
+    """
+    flushed = flush_conversations(request.data.get('conversation_ids'))
+    return Response({"status": "Conversations saved to DB", "chat_ids": flushed}, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 def fetch_chat_from_db(request, chat_id: int) -> Response:
     """
-    Retrieve a chat message from the database by its ID.
+    Retrieve the messages of a chat from the database by its ID.
 
     Parameters:
-    - request (Request): The incoming request object containing the chat ID.
+    - request (Request): The incoming request object containing the chat ID. Pass `limit` to page through long conversations, then follow the `next` link.
     - chat_id (int): The unique identifier of the chat message to be retrieved.
 
     Returns:
-    - Response: A Django REST Framework response object containing the chat message data. If the chat message is not found, the response will contain an error message with status code 404 NOT FOUND.
+    - Response: A Django REST Framework response object containing the chat messages in order, or with `limit` one page of them with "next"/"previous" links. If the chat message is not found, the response will contain an error message with status code 404 NOT FOUND.
     """
-    try:
-        chat = Chat.objects.get(id=chat_id)
-        return Response(chat.input_response_pairs, status=status.HTTP_200_OK)
-    except Chat.DoesNotExist:
+    if not Chat.objects.filter(id=chat_id).exists():
         return Response({"error": "Chat not found"}, status=status.HTTP_404_NOT_FOUND)
 
+    messages = Message.objects.filter(chat_id=chat_id).order_by('ordinal')
+    paginator = MessageCursorPagination()
+    page = paginator.paginate_queryset(messages, request)
+    if page is None:
+        return Response([message.as_dict() for message in messages], status=status.HTTP_200_OK)
+    return paginator.get_paginated_response([message.as_dict() for message in page])
+
+@api_view(['GET'])
+def search_chats(request):
+    """
+    Search the messages of all saved chats.
+
+    Keyword searches use the full-text index on the messages (ranked by BM25 on SQLite) and
+    return a snippet with the matched words in [brackets]. Semantic searches compare the
+    query's embedding with the stored message embeddings and need CHAT_SEARCH['SEMANTIC'].
+
+    Parameters:
+    - q (str): The search query.
+    - mode (str, optional): 'keyword' (the default) or 'semantic'.
+    - limit, offset (int, optional): The page size (at most 100) and the number of hits to skip.
+
+    Returns:
+    - Response: A response object with "count", "next"/"previous" page links and "results", the hits best first, each with the chat ID and preview, the message and its score. 400 BAD REQUEST if the query is empty, the mode is unknown or semantic search is disabled.
+    """
+    query = request.query_params.get('q', '').strip()
+    mode = request.query_params.get('mode', 'keyword')
+    if not query:
+        return Response({"error": "No search query provided"}, status=status.HTTP_400_BAD_REQUEST)
+    if mode == 'keyword':
+        results = KeywordResults(query)
+    elif mode == 'semantic':
+        if not CHAT_SEARCH['SEMANTIC']:
+            return Response({"error": "Semantic search is disabled"}, status=status.HTTP_400_BAD_REQUEST)
+        results = semantic_search(query)
+    else:
+        return Response({"error": f"Unknown search mode {mode!r}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = SearchPagination()
+    page = paginator.paginate_queryset(results, request)
+    return paginator.get_paginated_response(page)
+
+@api_view(['POST'])
+def cache_feedback(request):
+    """
+    Record whether the user found an answer helpful, for calibrating the cache threshold.
+
+    Parameters:
+    - decision_id (str): The decision ID returned with the answer.
+    - helpful (bool): Whether the answer was correct.
+
+    Returns:
+    - Response: A response object with a status message. 400 BAD REQUEST if a parameter is missing or decisions are not being logged (CACHE_FEEDBACK['LOG_PATH']).
+    """
+    decision_id = request.data.get('decision_id')
+    helpful = request.data.get('helpful')
+    if not decision_id or not isinstance(helpful, bool):
+        return Response({"status": "Provide a decision_id and a boolean helpful"}, status=status.HTTP_400_BAD_REQUEST)
+    if not record_feedback(decision_id, helpful):
+        return Response({"status": "Cache decisions are not being logged"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"status": "Feedback recorded"}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def get_upstream_stats(request):
+    """
+    Return the circuit breaker state and latency histogram of each upstream service.
+
+    The stats are kept per worker process, so they describe the calls made by the process that serves this request.
+
+    Parameters:
+    request (Request): The incoming request object.
+
+    Returns:
+    Response: A response object mapping each upstream name to its stats. The HTTP status code is set to 200 OK.
+    """
+    return Response(upstream_stats(), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def get_cache_stats(request):
+    """
+    Return the hit rates and compression counters of the tiered caches and the embedding cache.
+
+    The stats are kept per worker process, so they describe the cache use of the process that serves this request.
+
+    Parameters:
+    request (Request): The incoming request object.
+
+    Returns:
+    Response: A response object mapping each cache alias to its stats, plus the embedding cache's
+        hits, misses, hit_rate and size under 'embedding'. The HTTP status code is set to 200 OK.
+    """
+    return Response({**cache_stats(), 'embedding': embedding_cache.stats()}, status=status.HTTP_200_OK)
+
+
+@require_GET
+def metrics(request):
+    """
+    Return the pipeline stage timings, cache hit/miss counters, best similarity scores and upstream latencies in the Prometheus text format.
+
+    The metrics are kept per worker process, so they describe the requests served by the process that serves this request.
+
+    Parameters:
+    request (HttpRequest): The incoming request object.
+
+    Returns:
+    HttpResponse: A text/plain response in the Prometheus exposition format, version 0.0.4.
+    """
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -6,7 +6,7 @@ import sendBtn from './assets/send.svg';
 import userIcon from './assets/my-face.jpg';
 import gptImgLogo from './assets/chat_bot_icon.jpeg';
 import { useSpring, useTrail, animated, config } from '@react-spring/web';
-import { saveChatToCache, saveCacheToDb, fetchChatFromDb, fetchChats } from './services/api';
+import { saveChatToCache, streamChat, saveCacheToDb, fetchChatFromDb, fetchChats } from './services/api';
 import L from 'leaflet';
 import 'leaflet/dist/leaflet.css';
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome';
@@ -21,7 +21,9 @@ function App() {
   const [option, setOption] = useState("generation");
   const [messages, setMessages] = useState([]);
   const [chatId, setChatId] = useState(null);
+  const [conversationId, setConversationId] = useState(null);
   const [previousChats, setPreviousChats] = useState([]);
+  const [nextChatsPage, setNextChatsPage] = useState(null);
   const [similarQuestion, setSimilarQuestion] = useState("");
   const [previousResponses, setPreviousResponses] = useState([]);
   const [mappingData, setMappingData] = useState(null);
@@ -35,8 +37,9 @@ function App() {
   useEffect(() => {
     const loadChats = async () => {
       try {
-        const chats = await fetchChats();
-        setPreviousChats(chats);
+        const page = await fetchChats();
+        setPreviousChats(page.results);
+        setNextChatsPage(page.next);
       } catch (error) {
         console.error('Error loading chats', error);
       }
@@ -54,6 +57,19 @@ function App() {
     setSimilarQuestion("");
   };
 
+  // Convert the markup response to plain text and remove everything after "SQL_query"
+  const toDisplayText = (markup) => {
+    let text = htmlToText(markup, {
+      wordwrap: 130
+    });
+
+    const sqlQueryIndex = text.indexOf('SQL_query:');
+    if (sqlQueryIndex !== -1) {
+      text = text.substring(0, sqlQueryIndex).trim();
+    }
+    return text;
+  };
+
   const handleSend = async () => {
     const text = input;
     setInput('');
@@ -63,26 +79,17 @@ function App() {
     setPreviousResponses(prevResponses => [...prevResponses, userMessage]);
 
     try {
-      const response = await saveChatToCache([userMessage], option);
+      if (option === 'mapping') {
+        const response = await saveChatToCache([userMessage], option, conversationId, chatId);
 
-      console.log('API Response:', response); // Log the full response
+        console.log('API Response:', response); // Log the full response
 
-      if (option === 'mapping') {
         const generationData = response.data.response_data?.generation_data;
         if (!generationData) {
           throw new Error('No generation data found in response');
         }
 
-        // Convert the markup response to plain text
-        let botResponse = htmlToText(generationData.answer, {
-          wordwrap: 130
-        });
-
-        // Remove everything after "SQL_query"
-        const sqlQueryIndex = botResponse.indexOf('SQL_query:');
-        if (sqlQueryIndex !== -1) {
-          botResponse = botResponse.substring(0, sqlQueryIndex).trim();
-        }
+        const botResponse = toDisplayText(generationData.answer);
 
         const botMessage = { text: botResponse, isBot: true, option };
         setMessages(prevMessages => [...prevMessages, botMessage]);
@@ -94,30 +101,36 @@ function App() {
         }
         setMappingData(mappingData);
       } else {
-        const chatData = response.chat_data;
-        const similarQ = response.similar_question || "";
-        setSimilarQuestion(similarQ);
-
-        if (!chatData || !Array.isArray(chatData)) {
-          throw new Error('chat_data is missing or not an array');
-        }
-
-        const botMessages = chatData.map(msg => {
-          let text = htmlToText(msg.text, {
-            wordwrap: 130
-          });
-
-          // Remove everything after "SQL_query"
-          const sqlQueryIndex = text.indexOf('SQL_query:');
-          if (sqlQueryIndex !== -1) {
-            text = text.substring(0, sqlQueryIndex).trim();
+        // Render the bot message as soon as the first part of the answer arrives,
+        // then replace it in place as more of the answer streams in
+        let botMessageShown = false;
+        let streamedText = '';
+        const showBotText = (text) => {
+          const botMessage = { text: toDisplayText(text), isBot: true, option };
+          const replaceLast = botMessageShown;
+          const update = prev => replaceLast ? [...prev.slice(0, -1), botMessage] : [...prev, botMessage];
+          setMessages(update);
+          setPreviousResponses(update);
+          botMessageShown = true;
+        };
+
+        const result = await streamChat([userMessage], option, (event, data) => {
+          if (event === 'answer_chunk') {
+            streamedText += data.text;
+            showBotText(streamedText);
+          } else if (event === 'answer') {
+            showBotText(data.text);
+          } else if (event === 'similar_question') {
+            setSimilarQuestion(data.similar_question || "");
           }
+        }, conversationId, chatId);
+        if (result.conversation_id) {
+          setConversationId(result.conversation_id);
+        }
 
-          return { text, isBot: msg.isBot, option };
-        });
-
-        setMessages(prevMessages => [...prevMessages, ...botMessages]);
-        setPreviousResponses(prevResponses => [...prevResponses, ...botMessages]);
+        if (!botMessageShown) {
+          throw new Error('No answer received');
+        }
       }
     } catch (error) {
       console.error('Error during chat processing:', error.message, error);
@@ -135,8 +148,8 @@ function App() {
 
   const handleNewChat = async () => {
     try {
-      if (messages.length > 0) {
-        await saveCacheToDb(chatId);
+      if (conversationId) {
+        await saveCacheToDb(conversationId, chatId);
       }
     } catch (error) {
       console.error('Error saving cache to db', error);
@@ -144,23 +157,36 @@ function App() {
 
     setMessages([]);
     setChatId(null);
+    setConversationId(null);
     setSimilarQuestion("");
     setPreviousResponses([]);
 
     try {
-      const updatedChats = await fetchChats();
-      setPreviousChats(updatedChats);
+      const page = await fetchChats();
+      setPreviousChats(page.results);
+      setNextChatsPage(page.next);
     } catch (error) {
       console.error('Error loading updated chats', error);
     }
   };
 
+  const loadOlderChats = async () => {
+    try {
+      const page = await fetchChats(nextChatsPage);
+      setPreviousChats(prevChats => [...prevChats, ...page.results]);
+      setNextChatsPage(page.next);
+    } catch (error) {
+      console.error('Error loading older chats', error);
+    }
+  };
+
   const loadPreviousChat = async (id) => {
     try {
       const chatData = await fetchChatFromDb(id);
       setMessages(chatData);
       setPreviousResponses(chatData);
       setChatId(id);
+      setConversationId(null);
       setSimilarQuestion("");
     } catch (error) {
       console.error('Error fetching chat from db', error);
@@ -282,9 +308,14 @@ function App() {
               className='query'
               onClick={() => loadPreviousChat(chat.id)}
             >
-              Chat {chat.id} - {new Date(chat.created_at).toLocaleString()}
+              {chat.preview || `Chat ${chat.id}`} - {new Date(chat.created_at).toLocaleString()}
             </animated.button>
           ))}
+          {nextChatsPage && (
+            <button className='query' onClick={loadOlderChats}>
+              Load older chats
+            </button>
+          )}
         </div>
       </animated.div>
 
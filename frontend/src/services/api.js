@@ -28,16 +28,20 @@ export const createChat = async (messages) => {
  *
  * @param {Object} chatData - The chat data to be saved.
  * @param {string} option - The option for saving the chat data.
+ * @param {string} [conversationId] - The conversation_id returned by a previous call. Omit to start a new conversation.
+ * @param {number} [chatId] - The saved chat a new conversation continues.
  *
- * @returns {Promise<Object>} - A promise that resolves with the API response data.
+ * @returns {Promise<Object>} - A promise that resolves with the API response data, including its conversation_id.
  *
  * @throws {Error} - If the API request fails, the promise will be rejected with an error.
  */
-export const saveChatToCache = async (chatData, option) => {
+export const saveChatToCache = async (chatData, option, conversationId, chatId) => {
     try {
         const response = await axios.post(`${API_URL}save_chat_to_cache/`, {
             chat_data: chatData,
-            option: option
+            option: option,
+            conversation_id: conversationId,
+            chat_id: chatId
         });
 
         // Check if the response status code indicates success
@@ -58,17 +62,91 @@ export const saveChatToCache = async (chatData, option) => {
 };
 
 /**
- * Saves chat data from the cache to the database by sending a POST request to the API.
+ * Streams the chat pipeline for a message, calling onEvent for each Server-Sent Event.
+ *
+ * Events arrive as the backend completes each stage: 'cache', 'optimized_query',
+ * 'answer_chunk', 'answer', 'similar_question' and finally 'done'. An 'error' event
+ * rejects the promise.
+ *
+ * @param {Object[]} chatData - The chat data to be sent.
+ * @param {string} option - The option for processing the chat data.
+ * @param {function(string, Object): void} onEvent - Called with the event name and its parsed data.
+ * @param {string} [conversationId] - The conversation_id returned by a previous call. Omit to start a new conversation.
+ * @param {number} [chatId] - The saved chat a new conversation continues.
+ *
+ * @returns {Promise<Object>} - A promise that resolves with the data of the 'done' event, including its conversation_id.
+ *
+ * @throws {Error} - If the request fails or the stream reports an error.
+ */
+export const streamChat = async (chatData, option, onEvent, conversationId, chatId) => {
+    const response = await fetch(`${API_URL}stream_chat/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify({ chat_data: chatData, option: option, conversation_id: conversationId, chat_id: chatId })
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error(`API error: ${response.statusText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            const data = dataLines.length ? JSON.parse(dataLines.join('\n')) : {};
+
+            if (event === 'error') {
+                throw new Error(data.status || 'Stream error');
+            }
+            if (event === 'done') {
+                result = data;
+            }
+            onEvent(event, data);
+        }
+    }
+
+    if (!result) {
+        throw new Error('Stream ended before the chat completed');
+    }
+    return result;
+};
+
+/**
+ * Saves the buffered messages of a conversation to the database by sending a POST request to the API.
  *
+ * @param {string} conversationId - The conversation_id returned by saveChatToCache or streamChat.
  * @param {string} chatId - The ID of the chat to be saved.
  *
  * @returns {Promise<Object>} - A promise that resolves with the API response data.
  *
  * @throws {Error} - If the API request fails, the promise will be rejected with an error.
  */
-export const saveCacheToDb = async (chatId) => {
+export const saveCacheToDb = async (conversationId, chatId) => {
     try {
-        const response = await axios.post(`${API_URL}save_cache_to_db/`, { chat_id: chatId });
+        const response = await axios.post(`${API_URL}save_cache_to_db/`, { conversation_id: conversationId, chat_id: chatId });
 
         if (response.status !== 200) {
             throw new Error(`API error: ${response.statusText}`);
@@ -106,15 +184,17 @@ export const fetchChatFromDb = async (chatId) => {
 };
 
 /**
- * Fetches a list of chats from the database by sending a GET request to the API.
+ * Fetches one page of chat summaries (id, created_at, preview), newest first.
+ *
+ * @param {string} [pageUrl] - The `next` link of a previous page. Omit to fetch the first page.
  *
- * @returns {Promise<Object[]>} - A promise that resolves with an array of API response data.
+ * @returns {Promise<Object>} - A promise that resolves with `{ results, next, previous }`.
  *
  * @throws {Error} - If the API request fails, the promise will be rejected with an error.
  */
-export const fetchChats = async () => {
+export const fetchChats = async (pageUrl) => {
     try {
-        const response = await axios.get(`${API_URL}list_chats/`);
+        const response = await axios.get(pageUrl || `${API_URL}list_chats/`);
 
         if (response.status !== 200) {
             throw new Error(`API error: ${response.statusText}`);